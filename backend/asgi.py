@@ -0,0 +1,527 @@
+"""
+Modo de servicio asíncrono (ASGI) con las mismas rutas que controller.py, incluidas /metrics, /health/* y la caché
+de respuestas con ETag.
+Las consultas de cada petición usan el driver asíncrono de PyMongo, así que una petición esperando a MongoDB
+no ocupa un hilo. Requiere quart, quart-cors y pymongo >= 4.9; se lanza con un servidor ASGI, p.ej.:
+
+    uvicorn asgi:app --workers 4
+    hypercorn asgi:app --workers 4
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from types import SimpleNamespace
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.errors import PyMongoError
+from quart import Quart, Response, jsonify, request
+from quart_cors import cors
+from services.AsyncServices import (
+    AsyncAssociationRules,
+    AsyncDemographicService,
+    AsyncEmptyLocalsService,
+    AsyncResponseCache,
+    AsyncRestaurantService,
+    AsyncTransportService,
+    threaded_rows_response,
+)
+from services.RestaurantService import parse_geo_args, parse_sites
+from services.DemographicService import parse_nearest_k
+from services.AssociationRules import parse_rule_args
+from services.TransportProximity import PROXIMITY_SOURCES, TransportProximity, parse_point_args
+from services.RestaurantIndex import RestaurantIndex
+from services.CompetitorTiles import CompetitorTiles
+from services.Pagination import STREAM_FORMATS, json_encoder, parse_page_args
+from services.JsonProvider import FastJSONProvider
+from services.GeometryStore import GeometryStore, parse_zoom
+from services.EmptyLocalsSnapshot import EmptyLocalsSnapshot
+from services.NeighborhoodStats import NeighborhoodStats
+from services.MongoPool import ConnectionPoolWarmer, PoolMonitor, mongo_client_options
+from services.IndexManager import IndexManager
+from services.VectorTiles import MVT_MIMETYPE, VectorTiles
+from services.ResponseCache import DatasetVersion, RedisBackend
+from services.Metrics import MetricsRegistry, MongoCommandMetrics, RequestMetrics, instrument, render_counter
+
+app = Quart(__name__)
+app = cors(app, allow_origin="http://localhost:3000", expose_headers=["X-Next-Cursor"])
+
+# Misma configuración que controller.py
+app.config["MONGO_URI"] = os.environ.get("MONGO_URI", "mongodb://localhost:27017/urban_insight_data")
+app.config["MONGO_CLIENT_OPTIONS"] = mongo_client_options(os.environ)
+app.config["INDEX_PLAN_CHECK"] = os.environ.get("INDEX_PLAN_CHECK", "warn")
+app.config["RESTAURANT_SPATIAL_INDEX"] = True
+app.config["COMPETITOR_TILES"] = True
+app.config["VECTOR_TILES_PYRAMID_ZOOM"] = 14
+app.config["VECTOR_TILES_CLUSTER_ZOOM"] = 15
+app.config["VECTOR_TILES_MAX_AGE"] = 3600
+app.config["RESPONSE_CACHE_SIZE"] = 512
+app.config["RESPONSE_CACHE_TTL"] = 3600
+app.config["RESPONSE_CACHE_REDIS_URL"] = None
+app.config["SLOW_REQUEST_MS"] = float(os.environ["SLOW_REQUEST_MS"]) if os.environ.get("SLOW_REQUEST_MS") else None
+app.json = FastJSONProvider(app)
+logging.basicConfig(level=logging.WARNING)
+
+# Métricas en /metrics, como en controller.py
+metrics_registry = MetricsRegistry()
+mongo_metrics = MongoCommandMetrics(metrics_registry)
+RequestMetrics(metrics_registry, slow_request_ms=app.config["SLOW_REQUEST_MS"]).init_async_app(app)
+
+# El cliente síncrono solo carga las estructuras en memoria; las peticiones usan el asíncrono, cuyo pool es el
+# que vigilan /health/ready y el calentamiento
+pool_monitor = PoolMonitor()
+mongo = SimpleNamespace(db=MongoClient(
+    app.config["MONGO_URI"], event_listeners=[mongo_metrics], **app.config["MONGO_CLIENT_OPTIONS"]
+).get_default_database())
+async_client = AsyncMongoClient(
+    app.config["MONGO_URI"], event_listeners=[pool_monitor, mongo_metrics], **app.config["MONGO_CLIENT_OPTIONS"]
+)
+async_mongo = SimpleNamespace(db=async_client.get_default_database())
+pool_warmer = ConnectionPoolWarmer(async_client, pool_monitor, app.config["MONGO_CLIENT_OPTIONS"].get("minPoolSize", 1))
+
+# Servicios
+restaurant_index = RestaurantIndex(mongo) if app.config["RESTAURANT_SPATIAL_INDEX"] else None
+competitor_tiles = CompetitorTiles() if restaurant_index and app.config["COMPETITOR_TILES"] else None
+if restaurant_index and competitor_tiles:
+    restaurant_index.add_listener(competitor_tiles.build)
+geometry_store = GeometryStore(mongo)
+neighborhood_stats = NeighborhoodStats(mongo)
+restaurant_service = AsyncRestaurantService(
+    mongo, async_mongo, index=restaurant_index, tiles=competitor_tiles, geometry_store=geometry_store, stats=neighborhood_stats
+)
+demographics_service = AsyncDemographicService(mongo, async_mongo, geometry_store=geometry_store)
+empty_locals_snapshot = EmptyLocalsSnapshot(mongo, encode=json_encoder(app.json))
+empty_local_service = AsyncEmptyLocalsService(mongo, async_mongo, snapshot=empty_locals_snapshot, stats=neighborhood_stats)
+transport_proximity = TransportProximity(mongo)
+transport_service = AsyncTransportService(mongo, async_mongo, proximity=transport_proximity)
+association_rules = AsyncAssociationRules(mongo, async_mongo)
+index_manager = IndexManager(mongo, [restaurant_service, demographics_service, empty_local_service, transport_service])
+vector_tiles = VectorTiles(
+    mongo,
+    index=restaurant_index,
+    pyramid_max_zoom=app.config["VECTOR_TILES_PYRAMID_ZOOM"],
+    cluster_max_zoom=app.config["VECTOR_TILES_CLUSTER_ZOOM"]
+)
+for service in (restaurant_service, demographics_service, empty_local_service, transport_service):
+    instrument(service)
+dataset_version = DatasetVersion(mongo)
+response_cache = AsyncResponseCache(
+    dataset_version,
+    maxsize=app.config["RESPONSE_CACHE_SIZE"],
+    ttl=app.config["RESPONSE_CACHE_TTL"],
+    shared_backend=RedisBackend(app.config["RESPONSE_CACHE_REDIS_URL"]) if app.config["RESPONSE_CACHE_REDIS_URL"] else None
+)
+# The change-stream refreshes do not bump the dataset version: they invalidate the cached responses themselves
+if restaurant_index:
+    restaurant_index.add_listener(response_cache.invalidate)
+neighborhood_stats.add_listener(response_cache.invalidate)
+demographics_service.add_listener(response_cache.invalidate)
+
+
+def cache_metric_lines():
+    counts = {}
+    for endpoint, stats in response_cache.hit_stats().items():
+        counts[(endpoint, "hit")] = stats["hits"]
+        counts[(endpoint, "miss")] = stats["misses"]
+    return render_counter("response_cache_requests_total", "Response cache lookups by route", ("endpoint", "result"), counts)
+
+metrics_registry.add_collector(cache_metric_lines)
+
+
+def reload_datasets():
+    # Same reload as controller.py when ingest.py bumps the dataset version
+    loaders = [
+        geometry_store.load,
+        demographics_service.warm_lookups,
+        empty_locals_snapshot.load,
+        transport_proximity.load,
+        association_rules.load,
+        vector_tiles.load
+    ]
+    if restaurant_index:
+        loaders.insert(0, restaurant_index.load)
+    for load in loaders:
+        try:
+            load()
+        except PyMongoError as e:
+            logging.error(f"Could not reload {load.__qualname__}: {str(e)}")
+
+
+def start_services():
+    # Same startup sequence as controller.py (the geometries must be loaded before the name lookup)
+    loaded_version = dataset_version.current()
+    if restaurant_index:
+        restaurant_index.start()
+    geometry_store.start()
+    index_manager.start(plan_check=app.config["INDEX_PLAN_CHECK"])
+    demographics_service.start()
+    empty_locals_snapshot.start()
+    transport_proximity.start()
+    neighborhood_stats.start()
+    association_rules.start()
+    vector_tiles.start()
+    dataset_version.watch(reload_datasets, since=loaded_version)
+
+
+@app.before_serving
+async def load_services():
+    # Blocking loads run in a worker thread so the event loop of each worker is never held by them
+    app.add_background_task(pool_warmer.warm_async)
+    await asyncio.to_thread(start_services)
+
+
+# Rutas relacionadas con RestaurantService
+@app.route('/nearby_restaurants', methods=['GET'])
+async def get_nearby_restaurants():
+    try:
+        lat = float(request.args.get('lat'))
+        lon = float(request.args.get('lon'))
+        filters = parse_geo_args(request.args)
+        return jsonify(await restaurant_service.get_nearby_restaurants_async(lat, lon, filters))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/restaurants', methods=['GET'])
+async def get_restaurants():
+    try:
+        page = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return await restaurant_service.get_restaurants_async(**page)
+
+@app.route('/api/neighbours_competitors', methods=['GET'])
+async def neighbours_competitors():
+    try:
+        lat = request.args.get('lat')
+        lon = request.args.get('lon')
+        if not lat or not lon:
+            return jsonify({"error": "Missing latitude or longitude"}), 400
+        lat = float(lat)
+        lon = float(lon)
+    except ValueError:
+        return jsonify({"error": "Invalid latitude or longitude"}), 400
+    try:
+        filters = parse_geo_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        stats = await restaurant_service.get_neighbours_competitors_async(lat, lon, filters)
+        if stats is None:
+            return jsonify({"error": "No nearby competitors found"}), 404
+        return jsonify(stats)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/neighbours_competitors/batch', methods=['POST'])
+async def neighbours_competitors_batch():
+    try:
+        body = await request.get_json(silent=True)
+        # The neighborhood lookup may fall back to a blocking MongoDB query
+        sites, radius = await asyncio.to_thread(parse_sites, body, empty_local_service.get_locations_by_neighborhood)
+        stream_format = request.args.get('format', 'ndjson')
+        if stream_format not in STREAM_FORMATS:
+            raise ValueError(f"Invalid format: {stream_format}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return threaded_rows_response(restaurant_service.get_competitors_batch(sites, radius), stream_format)
+
+@app.route('/api/restaurant_price_categories', methods=['GET'])
+@response_cache.cached
+async def get_price_categories():
+    try:
+        return jsonify(await restaurant_service.get_price_categories_async()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/restaurant_cuisine_categories', methods=['GET'])
+@response_cache.cached
+async def get_cuisine_categories():
+    try:
+        return jsonify(await restaurant_service.get_cuisine_categories_async()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/top_5_cuisine_types_by_neighborhood/<string:neighborhood_name>', methods=['GET'])
+@response_cache.cached
+async def get_top_5_cuisine_types_by_neighborhood(neighborhood_name):
+    try:
+        return jsonify(await restaurant_service.get_top_5_cuisine_types_by_neighborhood_async(neighborhood_name)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/restaurant_price_categories_by_neighborhood/<string:neighborhood_name>', methods=['GET'])
+@response_cache.cached
+async def get_restaurant_price_categories_by_neighborhood(neighborhood_name):
+    try:
+        return jsonify(await restaurant_service.get_price_categories_by_neighborhood_async(neighborhood_name)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/restaurant_count_by_neighborhood/<string:neighborhood_name>', methods=['GET'])
+@response_cache.cached
+async def get_restaurant_count_by_neighborhood(neighborhood_name):
+    try:
+        count = await restaurant_service.get_restaurant_count_by_neighborhood_async(neighborhood_name)
+        return jsonify({"count": count}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/restaurant_count_by_neighborhoods', methods=['GET'])
+@response_cache.cached
+async def get_restaurant_counts_for_neighborhoods():
+    try:
+        return jsonify(await restaurant_service.get_restaurant_counts_for_neighborhoods_async()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/restaurants_by_neighborhood/<string:neighborhood>', methods=['GET'])
+@response_cache.cached
+async def get_restaurants_by_neighborhood(neighborhood):
+    try:
+        return jsonify(await restaurant_service.get_restaurants_by_neighborhood_async(neighborhood)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Rutas relacionadas con DemographicService
+@app.route('/api/demographics', methods=['GET'])
+@response_cache.cached
+async def get_demographics():
+    try:
+        return jsonify(await demographics_service.get_demographics_async(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/demographics_by_name', methods=['GET'])
+@response_cache.cached
+async def get_demographics_by_name():
+    try:
+        barrio = request.args.get('barrio')
+        if barrio:
+            neighborhood_data = await demographics_service.get_neighborhood_by_name_async(barrio, parse_zoom(request.args))
+            if neighborhood_data:
+                return jsonify(neighborhood_data), 200
+            return jsonify({"error": f"No data found for neighborhood: {barrio}"}), 404
+        return jsonify(await demographics_service.get_demographics_async(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/neighborhoods', methods=['GET'])
+@response_cache.cached
+async def get_neighborhoods():
+    try:
+        return jsonify(await demographics_service.get_neigborhoods_async(parse_zoom(request.args)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/neighborhoods/search', methods=['GET'])
+@response_cache.cached
+async def search_neighborhoods():
+    try:
+        query = request.args.get('q', '')
+        limit = int(request.args.get('limit', 10))
+        return jsonify(await demographics_service.search_neighborhoods_async(query, limit)), 200
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/similar_neighborhoods_by_renta/<string:renta>', methods=['GET'])
+@response_cache.cached
+async def get_similar_neighborhoods_by_renta(renta):
+    try:
+        renta = float(renta.replace(",", "."))
+        try:
+            k = parse_nearest_k(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if k is not None:
+            barrios_similares = await demographics_service.get_nearest_neighborhoods_by_renta_async(renta, k)
+        else:
+            barrios_similares = await demographics_service.get_neighborhoods_by_renta_async(renta)
+        if barrios_similares:
+            return jsonify(barrios_similares), 200
+        return jsonify({"error": "No se encontraron barrios con una renta similar"}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Rutas relacionadas con EmptyLocalsService
+@app.route('/api/empty_locals', methods=['GET'])
+async def get_empty_locals():
+    try:
+        page = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return await empty_local_service.get_empty_locals_async(**page)
+
+@app.route('/api/empty_locals_by_neighborhood/<string:neighborhood>', methods=['GET'])
+@response_cache.cached
+async def get_empty_locals_by_neighborhood(neighborhood):
+    try:
+        return jsonify(await empty_local_service.get_empty_locals_by_neighborhood_async(neighborhood)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/empty_locals_count_by_neighborhood', methods=['GET'])
+@response_cache.cached
+async def get_empty_locals_count_by_neighborhood():
+    try:
+        return jsonify(await empty_local_service.get_empty_locals_count_by_neighborhood_async()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/empty_locals_average_price', methods=['GET'])
+@response_cache.cached
+async def get_empty_locals_average_price():
+    try:
+        neighborhood = request.args.get('neighborhood')
+        if not neighborhood:
+            return jsonify({"error": "Missing neighborhood parameter"}), 400
+        average_price = await empty_local_service.get_average_price_by_neighborhood_async(neighborhood)
+        return jsonify({"neighborhood": neighborhood, "average_price": average_price}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/empty_locals_average_price_by_neighborhood', methods=['GET'])
+@response_cache.cached
+async def get_empty_locals_average_price_by_neighborhood():
+    try:
+        return jsonify(await empty_local_service.get_average_price_by_neighborhoods_async()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/neighborhood_profile/<string:neighborhood_name>', methods=['GET'])
+@response_cache.cached
+async def get_neighborhood_profile(neighborhood_name):
+    try:
+        # Restaurant facets, empty-locals facets and demographics run concurrently on the event loop
+        restaurants, empty_locals, demographics = await asyncio.gather(
+            restaurant_service.get_neighborhood_profile_async(neighborhood_name),
+            empty_local_service.get_neighborhood_profile_async(neighborhood_name),
+            demographics_service.get_neighborhood_by_name_async(neighborhood_name)
+        )
+        return jsonify({
+            "neighborhood": neighborhood_name,
+            **restaurants,
+            "empty_locals": empty_locals,
+            "demographics": demographics
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/tiles/<string:layer>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+async def get_vector_tile(layer, z, x, y):
+    try:
+        data = vector_tiles.tile(layer, z, x, y)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if data is None:
+        return jsonify({"error": f"Unknown layer: {layer}", "layers": vector_tiles.layers()}), 404
+    response = Response(data, mimetype=MVT_MIMETYPE)
+    response.set_etag(hashlib.sha1(data).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config["VECTOR_TILES_MAX_AGE"]
+    return await response.make_conditional(request)
+
+
+@app.route('/api/cache_stats', methods=['GET'])
+async def get_cache_stats():
+    return jsonify({"dataset_version": dataset_version.current(), "routes": response_cache.hit_stats()}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/health/live', methods=['GET'])
+async def get_liveness():
+    return jsonify({"status": "ok"}), 200
+
+@app.route('/health/ready', methods=['GET'])
+async def get_readiness():
+    # Same report as controller.py, for the pool of the asynchronous client
+    ready = pool_warmer.ready()
+    return jsonify({
+        "status": "ready" if ready else "starting",
+        "pool": pool_monitor.stats(),
+        "error": pool_warmer.error,
+        "datasets": {
+            "restaurant_index": restaurant_index is not None and restaurant_index.loaded,
+            "competitor_tiles": competitor_tiles is not None and competitor_tiles.loaded,
+            "neighborhood_geometries": geometry_store.loaded,
+            "empty_locals_snapshot": empty_locals_snapshot.loaded,
+            "neighborhood_stats": neighborhood_stats.loaded,
+            "association_rules": association_rules.loaded,
+            "transport_proximity": transport_proximity.loaded,
+            "vector_tiles": vector_tiles.loaded,
+        }
+    }), 200 if ready else 503
+
+
+@app.route('/transport', methods=['GET'])
+async def get_transport():
+    try:
+        page = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return await transport_service.get_transport_data_async(**page)
+
+@app.route('/api/transport_proximity', methods=['GET'])
+async def get_transport_proximity():
+    try:
+        lat, lon, radius = parse_point_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return jsonify(await transport_service.get_proximity_async(lat, lon, radius)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/transport_proximity/<string:source>/<string:site_id>', methods=['GET'])
+@response_cache.cached
+async def get_site_transport_proximity(source, site_id):
+    if source not in PROXIMITY_SOURCES:
+        return jsonify({"error": f"Unknown source: {source}"}), 404
+    try:
+        site_id = ObjectId(site_id)
+    except InvalidId:
+        return jsonify({"error": f"Invalid id: {site_id}"}), 400
+    try:
+        proximity = await transport_service.get_site_proximity_async(source, site_id)
+        if proximity is None:
+            return jsonify({"error": f"No transport data for {source}/{site_id}"}), 404
+        return jsonify(proximity), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/association_rules', methods=['GET'])
+@response_cache.cached
+async def get_association_rules():
+    try:
+        query = parse_rule_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        cuisines = None
+        if query.neighborhood is not None:
+            top_cuisines = await restaurant_service.get_top_5_cuisine_types_by_neighborhood_async(query.neighborhood)
+            cuisines = [cuisine["Tipo"] for cuisine in top_cuisines]
+        return jsonify(await association_rules.get_rules_async(query, cuisines)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+if __name__ == '__main__':
+    app.run(debug=True)
@@ -0,0 +1,155 @@
+"""
+Benchmark de los histogramas de competidores sobre el dataset sintético (desde backend/):
+
+    python -m benchmarks.histograms
+    python -m benchmarks.histograms --scale 2 --sites 5000 --radius 1000 --repeat 5
+
+Compara el calculate_histogram original (Counter y numpy.histogram por sitio, copiado aquí como referencia)
+con HistogramEngine sitio a sitio (como _competitors_from_index) y con todos los sitios en una sola pasada
+(como CompetitorTiles.batch_stats), ambos sobre un único HistogramEngine de todos los restaurantes.
+Los sitios son los locales vacíos y los vecinos de cada uno se calculan antes de medir, así que solo se
+mide la construcción de los histogramas. Comprueba además que los tres caminos devuelven las mismas
+estadísticas.
+"""
+import argparse
+import math
+import time
+from collections import Counter
+import numpy as np
+from numpy import histogram
+from benchmarks.synthetic_city import generate
+from services.HistogramEngine import RATING_INTERVALS, HistogramEngine, decay_weights
+from services.RestaurantIndex import haversine_distance
+
+
+def calculate_histogram(data: list, intervals=None):
+    # Baseline: RestaurantService.calculate_histogram before HistogramEngine
+    if not data:
+        return []
+    n = len(data)
+    if isinstance(data[0], str):
+        hist = Counter(data)
+        for k in hist.keys():
+            hist[k] = float(hist[k] / n)
+        return dict(hist)
+    elif isinstance(data[0], float):
+        if intervals is None:
+            raise ValueError('If the data are numbers you must provide the intervals')
+        hist = histogram(data, bins=intervals)
+        hist_vals = [float(x / n) for x in hist[0]]
+        return (hist_vals, hist[1].tolist())
+    else:
+        raise ValueError('Data must be a list of strings or floats')
+
+
+def legacy_stats(neighbours):
+    # Baseline: the value lists of _group_competitors_from_index and the old _competitor_stats
+    if not neighbours:
+        return None
+    accesibilidad = [r["Accesibilidad"] for r in neighbours if r.get("Accesibilidad") is not None]
+    return {
+        "Categoria Cocina": calculate_histogram([r["Categoría Cocina"] for r in neighbours if "Categoría Cocina" in r]),
+        "Numero de restaurantes": len(neighbours),
+        "Precio": calculate_histogram([r["Categoría Precio"] for r in neighbours if "Categoría Precio" in r]),
+        "Nota": calculate_histogram([r["Nota"] for r in neighbours if "Nota" in r], intervals=RATING_INTERVALS),
+        "Accesibilidad": {
+            "min": min(accesibilidad) if accesibilidad else None,
+            "avg": sum(accesibilidad) / len(accesibilidad) if accesibilidad else None,
+            "max": max(accesibilidad) if accesibilidad else None
+        }
+    }
+
+
+def engine_stats(engine, members, distances, decay=None):
+    # One site at a time over the shared engine, like RestaurantService._competitors_from_index
+    if not len(members):
+        return None
+    weights = None if decay is None else decay_weights(distances, decay)
+    return engine.stats(engine.group_counts(np.zeros(len(members), dtype=np.int64), members, 1, weights))
+
+
+def neighbours_of(sites, lons, lats, radius):
+    """ (índices, distancias) de los restaurantes a menos de radius metros de cada sitio """
+    result = []
+    for lon, lat in sites:
+        distances = haversine_distance(lat, lon, lats, lons)
+        members = np.flatnonzero(distances <= radius)
+        result.append((members, distances[members]))
+    return result
+
+
+def same_stats(a, b):
+    if a is None or b is None:
+        return a is b
+    if a["Numero de restaurantes"] != b["Numero de restaurantes"]:
+        return False
+    for key in ("Categoria Cocina", "Precio"):
+        if a[key].keys() != b[key].keys() or any(not math.isclose(a[key][k], b[key][k]) for k in a[key]):
+            return False
+    if not np.allclose(a["Nota"][0], b["Nota"][0]) or a["Nota"][1] != b["Nota"][1]:
+        return False
+    return all(
+        a["Accesibilidad"][k] == b["Accesibilidad"][k] or math.isclose(a["Accesibilidad"][k], b["Accesibilidad"][k])
+        for k in ("min", "avg", "max")
+    )
+
+
+def timed(function, repeat):
+    """ (mejor tiempo en segundos de repeat ejecuciones, resultado de la última) """
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Competitor histogram benchmark on the synthetic dataset")
+    parser.add_argument("--scale", type=float, default=1.0, help="1.0 = ~10k restaurants and 2k sites")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sites", type=int, help="number of sites (default: every empty local)")
+    parser.add_argument("--radius", type=float, default=500, help="competitor radius in meters")
+    parser.add_argument("--decay", type=float, default=250, help="half distance in meters of the weighted case")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the best one is reported")
+    args = parser.parse_args()
+
+    datasets = generate(args.scale, args.seed)
+    restaurants = datasets["restaurants"]
+    lons = np.array([r["Geometry"]["coordinates"][0] for r in restaurants], dtype=float)
+    lats = np.array([r["Geometry"]["coordinates"][1] for r in restaurants], dtype=float)
+    sites = [local["Geometry"]["coordinates"] for local in datasets["empty_locals"]][:args.sites]
+    neighbours = neighbours_of(sites, lons, lats, args.radius)
+    pairs = sum(len(members) for members, _ in neighbours)
+    print(f"{len(restaurants)} restaurants, {len(sites)} sites, {pairs} site-competitor pairs within {args.radius:g} m")
+
+    groups = np.repeat(np.arange(len(sites)), [len(members) for members, _ in neighbours])
+    points = np.concatenate([members for members, _ in neighbours]) if neighbours else np.empty(0, dtype=np.int64)
+    distances = np.concatenate([d for _, d in neighbours]) if neighbours else np.empty(0)
+
+    build_time, engine = timed(lambda: HistogramEngine(restaurants), args.repeat)
+    cases = [
+        ("calculate_histogram", lambda: [legacy_stats([restaurants[i] for i in m.tolist()]) for m, _ in neighbours]),
+        ("engine per site", lambda: [engine_stats(engine, m, d) for m, d in neighbours]),
+        ("engine batch", lambda: engine.batch_stats(groups, points, len(sites))),
+        ("engine per site, decay", lambda: [engine_stats(engine, m, d, args.decay) for m, d in neighbours]),
+        ("engine batch, decay", lambda: engine.batch_stats(groups, points, len(sites), decay_weights(distances, args.decay))),
+    ]
+    results = {}
+    print(f"{'case':<26}{'total ms':>12}{'us/site':>12}{'speedup':>10}")
+    baseline = None
+    for name, function in cases:
+        elapsed, results[name] = timed(function, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{name:<26}{elapsed * 1000:>12.1f}{elapsed * 1e6 / max(len(sites), 1):>12.1f}{baseline / elapsed:>9.1f}x")
+    print(f"(the engine cases share one HistogramEngine of every restaurant, built in {build_time * 1000:.1f} ms)")
+
+    for name in ("engine per site", "engine batch"):
+        mismatches = sum(not same_stats(a, b) for a, b in zip(results["calculate_histogram"], results[name]))
+        print(f"{name}: {mismatches} sites differ from calculate_histogram")
+    mismatches = sum(not same_stats(a, b) for a, b in zip(results["engine per site, decay"], results["engine batch, decay"]))
+    print(f"engine batch, decay: {mismatches} sites differ from engine per site, decay")
+
+
+if __name__ == '__main__':
+    main()
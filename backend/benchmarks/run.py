@@ -0,0 +1,358 @@
+"""
+Benchmark reproducible de las rutas de controller.py sobre el dataset sintético (desde backend/):
+
+    python -m benchmarks.run --stand-in                      # MongoDB simulado en proceso (requiere mongomock)
+    python -m benchmarks.run --mongo-uri mongodb://localhost:27017/urban_insight_bench
+    python -m benchmarks.run --url http://localhost:5000 --mongo-uri ...   # servidor ya lanzado (gunicorn / asgi)
+
+    python -m benchmarks.run --stand-in --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --stand-in --baseline benchmarks/baseline.json   # código 1 si hay regresiones
+
+Por cada ruta informa de p50/p95/p99, throughput y errores, y del pico de RSS del proceso.
+Los resultados del stand-in no son comparables con los de un mongod real: compárese siempre con
+una baseline obtenida con el mismo backend y la misma máquina.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+import numpy as np
+from benchmarks.synthetic_city import generate, load
+
+# Routes that are not part of the data API
+SKIPPED_RULES = {"/metrics", "/health/live", "/health/ready", "/api/cache_stats", "/static/<path:filename>"}
+
+
+def benchmark_cases(datasets, rng):
+    """ (nombre, regla, función que genera la URL de cada petición) de cada caso del benchmark """
+    names = [n["Nombre"] for n in datasets["demographic_info"]]
+    points = [r["Geometry"]["coordinates"] for r in datasets["restaurants"]]
+    rentas = [float(n["Renta"].replace(",", ".")) for n in datasets["demographic_info"]]
+    # _id is set on the documents by insert_many when the benchmark loads them
+    site_ids = [str(r["_id"]) for r in datasets["restaurants"] if "_id" in r] or ["000000000000000000000000"]
+    cuisines = sorted({item for rule in datasets["association_rules"] for item in rule["antecedents"]})
+
+    def name():
+        return quote(names[rng.integers(len(names))])
+
+    def point():
+        lon, lat = points[rng.integers(len(points))]
+        return f"lat={lat:.6f}&lon={lon:.6f}"
+
+    def tile():
+        # Viewport-sized requests: a random zoom between city and street level around a restaurant
+        lon, lat = points[rng.integers(len(points))]
+        z = int(rng.integers(11, 18))
+        x = int((lon + 180.0) / 360.0 * 2 ** z)
+        y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2 ** z)
+        return f"/tiles/{rng.choice(['restaurants', 'empty_locals', 'transport'])}/{z}/{x}/{y}.mvt"
+
+    return [
+        ("nearby_restaurants", "/nearby_restaurants", lambda: f"/nearby_restaurants?{point()}"),
+        ("restaurants", "/restaurants", lambda: "/restaurants"),
+        ("restaurants_page", "/restaurants", lambda: "/restaurants?limit=500"),
+        ("neighbours_competitors", "/api/neighbours_competitors", lambda: f"/api/neighbours_competitors?{point()}"),
+        ("restaurant_price_categories", "/api/restaurant_price_categories", lambda: "/api/restaurant_price_categories"),
+        ("restaurant_cuisine_categories", "/api/restaurant_cuisine_categories", lambda: "/api/restaurant_cuisine_categories"),
+        ("top_5_cuisine_types", "/api/top_5_cuisine_types_by_neighborhood/<string:neighborhood_name>",
+         lambda: f"/api/top_5_cuisine_types_by_neighborhood/{name()}"),
+        ("price_categories_by_neighborhood", "/api/restaurant_price_categories_by_neighborhood/<string:neighborhood_name>",
+         lambda: f"/api/restaurant_price_categories_by_neighborhood/{name()}"),
+        ("restaurant_count_by_neighborhood", "/api/restaurant_count_by_neighborhood/<string:neighborhood_name>",
+         lambda: f"/api/restaurant_count_by_neighborhood/{name()}"),
+        ("restaurant_count_by_neighborhoods", "/api/restaurant_count_by_neighborhoods", lambda: "/api/restaurant_count_by_neighborhoods"),
+        ("restaurants_by_neighborhood", "/api/restaurants_by_neighborhood/<string:neighborhood>",
+         lambda: f"/api/restaurants_by_neighborhood/{name()}"),
+        ("demographics", "/api/demographics", lambda: f"/api/demographics?income={int(rng.choice(rentas))}"),
+        ("demographics_by_name", "/api/demographics_by_name", lambda: f"/api/demographics_by_name?barrio={name()}"),
+        ("neighborhoods", "/api/neighborhoods", lambda: "/api/neighborhoods"),
+        ("neighborhoods_search", "/api/neighborhoods/search", lambda: f"/api/neighborhoods/search?q={name()[:3]}"),
+        ("similar_neighborhoods_by_renta", "/api/similar_neighborhoods_by_renta/<string:renta>",
+         lambda: f"/api/similar_neighborhoods_by_renta/{rng.choice(rentas):.1f}"),
+        ("empty_locals", "/api/empty_locals", lambda: "/api/empty_locals"),
+        ("empty_locals_by_neighborhood", "/api/empty_locals_by_neighborhood/<string:neighborhood>",
+         lambda: f"/api/empty_locals_by_neighborhood/{name()}"),
+        ("empty_locals_count_by_neighborhood", "/api/empty_locals_count_by_neighborhood", lambda: "/api/empty_locals_count_by_neighborhood"),
+        ("empty_locals_average_price", "/api/empty_locals_average_price", lambda: f"/api/empty_locals_average_price?neighborhood={name()}"),
+        ("empty_locals_average_price_by_neighborhood", "/api/empty_locals_average_price_by_neighborhood",
+         lambda: "/api/empty_locals_average_price_by_neighborhood"),
+        ("neighborhood_profile", "/api/neighborhood_profile/<string:neighborhood_name>", lambda: f"/api/neighborhood_profile/{name()}"),
+        ("transport", "/transport", lambda: "/transport"),
+        ("transport_proximity", "/api/transport_proximity", lambda: f"/api/transport_proximity?{point()}"),
+        ("site_transport_proximity", "/api/transport_proximity/<string:source>/<string:site_id>",
+         lambda: f"/api/transport_proximity/restaurants/{site_ids[rng.integers(len(site_ids))]}"),
+        ("association_rules", "/association_rules", lambda: "/association_rules"),
+        ("association_rules_filtered", "/association_rules",
+         lambda: f"/association_rules?cuisine={quote(str(rng.choice(cuisines)))}&min_confidence=0.3&sort=lift&limit=10"),
+        ("vector_tiles", "/tiles/<string:layer>/<int:z>/<int:x>/<int:y>.mvt", tile),
+        ("competitors_batch", "/api/neighbours_competitors/batch",
+         lambda: ("/api/neighbours_competitors/batch", {"points": [dict(zip(("lon", "lat"), points[i])) for i in rng.integers(len(points), size=200)]})),
+        ("competitors_batch_neighborhood", "/api/neighbours_competitors/batch",
+         lambda: ("/api/neighbours_competitors/batch", {"neighborhood": names[rng.integers(len(names))]})),
+    ]
+
+
+def use_stand_in():
+    """ Sustituye MongoClient por mongomock (en memoria, en este proceso) para la app y el benchmark """
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit("--stand-in requires mongomock (pip install mongomock)")
+    import flask_pymongo
+    import pymongo
+    from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+    from pymongo.errors import OperationFailure
+
+    mongomock.patch(servers=(("localhost", 27017),)).start()
+    # flask_pymongo subclasses the real client, so it is not covered by mongomock.patch
+    flask_pymongo.MongoClient = lambda uri, *args, **kwargs: pymongo.MongoClient(uri)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        # mongomock does not understand the request objects of recent PyMongo versions
+        for op in requests:
+            if isinstance(op, ReplaceOne):
+                self.replace_one(op._filter, op._doc, upsert=op._upsert)
+            elif isinstance(op, UpdateOne):
+                self.update_one(op._filter, op._doc, upsert=op._upsert)
+            elif isinstance(op, UpdateMany):
+                self.update_many(op._filter, op._doc, upsert=op._upsert)
+            elif isinstance(op, InsertOne):
+                self.insert_one(op._doc)
+            elif isinstance(op, DeleteOne):
+                self.delete_one(op._filter)
+            elif isinstance(op, DeleteMany):
+                self.delete_many(op._filter)
+
+    def watch(self, *args, **kwargs):
+        raise OperationFailure("Change streams are not available in the stand-in")
+
+    original_aggregate = mongomock.collection.Collection.aggregate
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        # $merge is not implemented by mongomock: run the rest of the pipeline and merge the results by _id
+        if pipeline and "$merge" in pipeline[-1]:
+            target = self.database[pipeline[-1]["$merge"]["into"]]
+            for document in original_aggregate(self, pipeline[:-1], *args, **kwargs):
+                fields = {key: value for key, value in document.items() if key != "_id"}
+                target.update_one({"_id": document["_id"]}, {"$set": fields}, upsert=True)
+            return iter([])
+        return original_aggregate(self, pipeline, *args, **kwargs)
+
+    original_command = mongomock.database.Database.command
+
+    def command(self, command, *args, **kwargs):
+        if command == "collMod":
+            raise OperationFailure("collMod is not available in the stand-in")
+        return original_command(self, command, *args, **kwargs)
+
+    original_find = mongomock.collection.Collection.find
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        # mongomock pops and restores keys of the projection, which the services share between threads
+        if isinstance(projection, dict):
+            projection = dict(projection)
+        return original_find(self, filter, projection, *args, **kwargs)
+
+    mongomock.collection.Collection.bulk_write = bulk_write
+    mongomock.collection.Collection.find = find
+    mongomock.collection.Collection.watch = watch
+    mongomock.collection.Collection.aggregate = aggregate
+    mongomock.database.Database.watch = watch
+    mongomock.database.Database.command = command
+    # explain() is not implemented by mongomock
+    os.environ["INDEX_PLAN_CHECK"] = "off"
+    return "mongodb://localhost:27017/urban_insight_bench"
+
+
+def in_process_client():
+    import controller
+    local = threading.local()
+
+    def get(url, body=None):
+        if not hasattr(local, "client"):
+            local.client = controller.app.test_client()
+        response = local.client.get(url) if body is None else local.client.post(url, json=body)
+        size = len(response.get_data())
+        return response.status_code, size
+    return get, controller
+
+
+def http_client(base_url):
+    def get(url, body=None):
+        request = urllib.request.Request(base_url.rstrip("/") + url)
+        if body is not None:
+            request.data = json.dumps(body).encode("utf-8")
+            request.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+    return get
+
+
+def run_case(get, make_url, requests, concurrency, warmup):
+    # make_url() returns the URL of a GET, or (url, json body) for a POST
+    for _ in range(warmup):
+        get(*_as_request(make_url()))
+    urls = [_as_request(make_url()) for _ in range(requests)]
+
+    def timed(request):
+        started = time.perf_counter()
+        status, size = get(*request)
+        return time.perf_counter() - started, status, size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, urls))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([r[0] for r in results]) * 1000
+    # 404 is a valid answer for some routes (e.g. no competitors around a random point)
+    errors = sum(1 for r in results if r[1] >= 500)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "mean_bytes": int(np.mean([r[2] for r in results])),
+    }
+
+
+def _as_request(request):
+    return request if isinstance(request, tuple) else (request, None)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """ Casos cuyo p95 ha empeorado más de tolerance (y más de min_delta_ms en valor absoluto) """
+    regressions = []
+    for case, current in results["cases"].items():
+        previous = baseline.get("cases", {}).get(case)
+        if previous is None:
+            continue
+        delta = current["p95_ms"] - previous["p95_ms"]
+        if delta > min_delta_ms and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append((case, previous["p95_ms"], current["p95_ms"]))
+        if current["errors"] > previous["errors"]:
+            regressions.append((case + " (errors)", previous["errors"], current["errors"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route benchmark on a synthetic Barcelona-scale dataset")
+    backend = parser.add_mutually_exclusive_group(required=True)
+    backend.add_argument("--stand-in", action="store_true", help="in-process MongoDB stand-in (mongomock)")
+    backend.add_argument("--mongo-uri", help="MongoDB database to (re)load the synthetic data into")
+    parser.add_argument("--url", help="benchmark a running server instead of the app in this process")
+    parser.add_argument("--no-load", action="store_true", help="keep the data already in the database")
+    parser.add_argument("--scale", type=float, default=1.0, help="1.0 = ~10k restaurants")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=200, help="requests per case")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10, help="requests per case before measuring")
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache (in-process only)")
+    parser.add_argument("--cases", help="comma-separated subset of cases")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    parser.add_argument("--baseline", help="compare against this baseline and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore p95 changes smaller than this")
+    args = parser.parse_args()
+    if args.stand_in and args.url:
+        parser.error("--stand-in runs the app in this process; it cannot be combined with --url")
+
+    uri = use_stand_in() if args.stand_in else args.mongo_uri
+    datasets = generate(args.scale, args.seed)
+    if not args.no_load:
+        from pymongo import MongoClient
+        started = time.perf_counter()
+        load(MongoClient(uri).get_default_database(), datasets)
+        print(f"Loaded synthetic dataset (scale {args.scale}) in {time.perf_counter() - started:.1f}s")
+
+    if args.url:
+        get = http_client(args.url)
+        rules = None
+    else:
+        os.environ["MONGO_URI"] = uri
+        started = time.perf_counter()
+        get, controller = in_process_client()
+        print(f"App started in {time.perf_counter() - started:.1f}s")
+        if args.no_cache:
+            controller.response_cache.local.maxsize = 0
+            controller.response_cache.shared = None
+        rules = {rule.rule for rule in controller.app.url_map.iter_rules()} - SKIPPED_RULES
+
+    rng = np.random.default_rng(args.seed)
+    cases = benchmark_cases(datasets, rng)
+    if rules is not None:
+        uncovered = rules - {rule for _, rule, _ in cases}
+        if uncovered:
+            print(f"Routes without a benchmark case: {', '.join(sorted(uncovered))}")
+    if args.cases:
+        selected = set(args.cases.split(","))
+        cases = [case for case in cases if case[0] in selected]
+
+    results = {
+        "meta": {
+            "backend": "stand-in" if args.stand_in else ("http" if args.url else "mongod"),
+            "scale": args.scale,
+            "seed": args.seed,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cache": not args.no_cache,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "cases": {}
+    }
+    print(f"{'case':<45}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'errors':>8}")
+    total_started = time.perf_counter()
+    for case, _, make_url in cases:
+        stats = run_case(get, make_url, args.requests, args.concurrency, args.warmup)
+        results["cases"][case] = stats
+        print(f"{case:<45}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}"
+              f"{stats['throughput_rps']:>9.1f}{stats['errors']:>8}")
+    total_requests = len(cases) * args.requests
+    results["throughput_rps"] = round(total_requests / (time.perf_counter() - total_started), 1)
+    results["peak_rss_mb"] = peak_rss_mb()
+    print(f"Overall {results['throughput_rps']} req/s, peak RSS {results['peak_rss_mb']} MB")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("backend") != results["meta"]["backend"]:
+            print("Warning: the baseline was recorded with a different backend")
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        for case, before, after in regressions:
+            print(f"REGRESSION {case}: {before} -> {after}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+Dataset sintético con la forma y el tamaño de los datos de Barcelona, reproducible a partir de una semilla:
+barrios como polígonos en EPSG:32631 (UTM 31N) que teselan la ciudad, restaurantes agrupados en focos
+de densidad, locales vacíos con precios en los formatos mixtos del dataset real y paradas de transporte.
+"""
+from types import SimpleNamespace
+import numpy as np
+import shapely
+from pyproj import Transformer
+from shapely import STRtree
+from shapely.geometry import Polygon
+from services.DemographicService import DemographicService
+from services.EmptyLocalsService import EmptyLocalsService
+
+# Bounding box of Barcelona in WGS84 (lon, lat)
+CITY_BOUNDS = (2.07, 41.32, 2.23, 41.47)
+GRID_COLUMNS = 10
+GRID_ROWS = 8
+NEIGHBORHOOD_NAMES = [
+    "el Raval", "el Barri Gòtic", "la Barceloneta", "Sant Pere, Santa Caterina i la Ribera", "el Fort Pienc",
+    "la Sagrada Família", "la Dreta de l'Eixample", "l'Antiga Esquerra de l'Eixample", "la Nova Esquerra de l'Eixample",
+    "Sant Antoni", "el Poble-sec", "la Marina del Prat Vermell", "la Marina de Port", "la Font de la Guatlla",
+    "Hostafrancs", "la Bordeta", "Sants - Badal", "Sants", "les Corts", "la Maternitat i Sant Ramon", "Pedralbes",
+    "Vallvidrera, el Tibidabo i les Planes", "Sarrià", "les Tres Torres", "Sant Gervasi - la Bonanova",
+    "Sant Gervasi - Galvany", "el Putxet i el Farró", "Vallcarca i els Penitents", "el Coll", "la Salut",
+    "la Vila de Gràcia", "el Camp d'en Grassot i Gràcia Nova", "el Baix Guinardó", "Can Baró", "el Guinardó",
+    "la Font d'en Fargues", "el Carmel", "la Teixonera", "Sant Genís dels Agudells", "Montbau",
+    "la Vall d'Hebron", "la Clota", "Horta", "Vilapicina i la Torre Llobeta", "Porta", "el Turó de la Peira",
+    "Can Peguera", "la Guineueta", "Canyelles", "les Roquetes", "Verdun", "la Prosperitat", "la Trinitat Nova",
+    "Torre Baró", "Ciutat Meridiana", "Vallbona", "la Trinitat Vella", "Baró de Viver", "el Bon Pastor",
+    "Sant Andreu", "la Sagrera", "el Congrés i els Indians", "Navas", "el Camp de l'Arpa del Clot", "el Clot",
+    "el Parc i la Llacuna del Poblenou", "la Vila Olímpica del Poblenou", "el Poblenou",
+    "Diagonal Mar i el Front Marítim del Poblenou", "el Besòs i el Maresme", "Provençals del Poblenou",
+    "Sant Martí de Provençals", "la Verneda i la Pau",
+]
+CUISINES = ["Mediterránea", "Española", "Catalana", "Italiana", "Japonesa", "China", "Mexicana", "India",
+            "Tapas", "Vegetariana", "Marisquería", "Americana", "Peruana", "Libanesa", "Thai"]
+PRICE_CATEGORIES = ["€", "€€", "€€€", "€€€€"]
+TRANSPORT_TYPES = ["Metro", "Bus", "Tram", "FGC"]
+STREETS = ["Carrer de Mallorca", "Carrer de Provença", "Avinguda Diagonal", "Gran Via de les Corts Catalanes",
+           "Carrer d'Aragó", "Carrer de Sants", "Carrer Gran de Gràcia", "Rambla del Poblenou", "Carrer de Balmes"]
+
+to_utm = Transformer.from_crs("EPSG:4326", "EPSG:32631", always_xy=True)
+to_wgs84 = Transformer.from_crs("EPSG:32631", "EPSG:4326", always_xy=True)
+
+
+def neighborhood_polygons(rng, edge_vertices=60):
+    """
+    Rejilla de GRID_COLUMNS x GRID_ROWS celdas en UTM con los vértices interiores desplazados; cada borde tiene
+    edge_vertices vértices con ruido, como los límites reales, y lo comparten exactamente los dos barrios vecinos
+    """
+    min_x, min_y = to_utm.transform(CITY_BOUNDS[0], CITY_BOUNDS[1])
+    max_x, max_y = to_utm.transform(CITY_BOUNDS[2], CITY_BOUNDS[3])
+    xs = np.linspace(min_x, max_x, GRID_COLUMNS + 1)
+    ys = np.linspace(min_y, max_y, GRID_ROWS + 1)
+    grid_x, grid_y = np.meshgrid(xs, ys, indexing="ij")
+    jitter = 0.25 * min(xs[1] - xs[0], ys[1] - ys[0])
+    interior = np.zeros_like(grid_x, dtype=bool)
+    interior[1:-1, 1:-1] = True
+    grid_x[interior] += rng.uniform(-jitter, jitter, interior.sum())
+    grid_y[interior] += rng.uniform(-jitter, jitter, interior.sum())
+
+    edges = {}
+
+    def edge(a, b):
+        """ Vértices del borde de a a b (sin el último), generados una vez para los dos sentidos """
+        key = (min(a, b), max(a, b))
+        if key not in edges:
+            start = np.array([grid_x[key[0]], grid_y[key[0]]])
+            end = np.array([grid_x[key[1]], grid_y[key[1]]])
+            t = np.linspace(0.0, 1.0, edge_vertices + 2)[:, None]
+            normal = np.array([start[1] - end[1], end[0] - start[0]]) / np.linalg.norm(end - start)
+            offsets = np.cumsum(rng.normal(0.0, 4.0, edge_vertices + 2))
+            offsets -= offsets[0] + (offsets[-1] - offsets[0]) * t.ravel()  # Ends stay on the grid vertices
+            edges[key] = start + (end - start) * t + normal * offsets[:, None]
+        points = edges[key] if key[0] == a else edges[key][::-1]
+        return points[:-1].tolist()
+
+    polygons = []
+    for i in range(GRID_COLUMNS):
+        for j in range(GRID_ROWS):
+            corners = [(i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1), (i, j)]
+            ring = [point for a, b in zip(corners, corners[1:]) for point in edge(a, b)]
+            polygons.append(ring + [ring[0]])
+    return polygons
+
+
+def random_points(rng, n, centers, spread_m=900.0):
+    """ Puntos lon/lat: 70% alrededor de focos de densidad y 30% uniformes dentro de la ciudad """
+    clustered = int(n * 0.7)
+    chosen = centers[rng.integers(0, len(centers), clustered)]
+    xy = chosen + rng.normal(0.0, spread_m, (clustered, 2))
+    min_x, min_y = to_utm.transform(CITY_BOUNDS[0], CITY_BOUNDS[1])
+    max_x, max_y = to_utm.transform(CITY_BOUNDS[2], CITY_BOUNDS[3])
+    uniform = np.column_stack([rng.uniform(min_x, max_x, n - clustered), rng.uniform(min_y, max_y, n - clustered)])
+    xy = np.clip(np.concatenate([xy, uniform]), [min_x, min_y], [max_x, max_y])
+    lons, lats = to_wgs84.transform(xy[:, 0], xy[:, 1])
+    return xy, np.column_stack([lons, lats])
+
+
+def price_text(rng, amount):
+    """ Precio en uno de los formatos del dataset real de locales """
+    style = rng.integers(0, 5)
+    if style == 0:
+        return int(amount)
+    if style == 1:
+        return f"{int(amount):,} €".replace(",", ".")
+    if style == 2:
+        return f"{amount:.2f} €/mes".replace(".", ",")
+    if style == 3:
+        return float(amount)
+    return "A consultar"
+
+
+def generate(scale=1.0, seed=42):
+    """ Documentos de cada colección; scale=1 son ~10k restaurantes, 2k locales y 3.5k paradas """
+    rng = np.random.default_rng(seed)
+    rings = neighborhood_polygons(rng)
+    names = (NEIGHBORHOOD_NAMES + [f"Barri {i:02d}" for i in range(len(rings))])[:len(rings)]
+    tree = STRtree([Polygon(ring) for ring in rings])
+    centers_xy = np.array([Polygon(ring).centroid.coords[0] for ring in rings])
+    hot_spots = centers_xy[rng.choice(len(centers_xy), 12, replace=False)]
+
+    def barrios_for(xy):
+        points = shapely.points(xy[:, 0], xy[:, 1])
+        point_idx, polygon_idx = tree.query(points, predicate="intersects")
+        barrios = np.full(len(xy), -1)
+        barrios[point_idx] = polygon_idx
+        return [names[b] if b >= 0 else None for b in barrios.tolist()]
+
+    demographic_info = [
+        {
+            "Nombre": name,
+            "Renta": f"{rng.normal(18000, 6000):.1f}".replace(".", ","),
+            "Población": int(rng.integers(5000, 60000)),
+            "Distribución edad": int(rng.integers(30, 50)),
+            "Distribución habitación por casas": str(rng.choice(["1", "2", "3", "4+"])),
+            "Geometry": {"type": "Polygon", "coordinates": [ring]},
+        }
+        for name, ring in zip(names, rings)
+    ]
+
+    n_restaurants = int(10000 * scale)
+    xy, lonlat = random_points(rng, n_restaurants, hot_spots)
+    barrios = barrios_for(xy)
+    restaurants = []
+    for i in range(n_restaurants):
+        restaurant = {
+            "Nombre": f"Restaurante {i}",
+            "Tipo": "Restaurante",
+            "Categoría Cocina": CUISINES[int(rng.zipf(1.6) - 1) % len(CUISINES)],
+            "Nota": float(rng.integers(4, 11) / 2),
+            "Nº Reseñas": int(rng.integers(0, 4000)),
+            "Precio": f"{int(rng.integers(8, 90))} €",
+            "Categoría Precio": PRICE_CATEGORIES[min(int(rng.exponential(0.9)), 3)],
+            "Accesibilidad": float(round(rng.uniform(0, 10), 2)),
+            "Barrio": barrios[i],
+            "Dirección": f"{STREETS[i % len(STREETS)]}, {int(rng.integers(1, 400))}",
+            "Geometry": {"type": "Point", "coordinates": [float(lonlat[i, 0]), float(lonlat[i, 1])]},
+        }
+        if rng.random() < 0.03:
+            del restaurant["Nota"]  # Like the scraped data, some restaurants have no rating
+        restaurants.append(restaurant)
+
+    n_locals = int(2000 * scale)
+    xy, lonlat = random_points(rng, n_locals, hot_spots, spread_m=1500.0)
+    barrios = barrios_for(xy)
+    empty_locals = []
+    for i in range(n_locals):
+        surface = int(rng.integers(20, 600))
+        amount = surface * rng.uniform(8, 35)
+        empty_locals.append({
+            "Título": f"Local en alquiler {i}",
+            "Dirección completa": f"{STREETS[i % len(STREETS)]}, {int(rng.integers(1, 400))}, Barcelona",
+            "Precio total (€)": price_text(rng, amount),
+            "Superficie (m2)": surface,
+            "Precio (€/m2)": float(round(amount / surface, 2)),
+            "Barrio": barrios[i],
+            "Geometry": {"type": "Point", "coordinates": [float(lonlat[i, 0]), float(lonlat[i, 1])]},
+            "Accesibilidad": float(round(rng.uniform(0, 10), 2)),
+        })
+
+    n_stops = int(3500 * scale)
+    _, lonlat = random_points(rng, n_stops, hot_spots, spread_m=2500.0)
+    transport = [
+        {
+            "Nombre": f"Parada {i}",
+            "Tipo": TRANSPORT_TYPES[int(rng.choice(4, p=[0.15, 0.7, 0.05, 0.1]))],
+            "Lineas": [f"L{int(line)}" for line in rng.choice(60, int(rng.integers(1, 4)), replace=False)],
+            "Geometry": {"type": "Point", "coordinates": [float(lonlat[i, 0]), float(lonlat[i, 1])]},
+        }
+        for i in range(n_stops)
+    ]
+
+    association_rules = [
+        {
+            "antecedents": [a],
+            "consequents": [b],
+            "support": float(round(rng.uniform(0.01, 0.2), 4)),
+            "confidence": float(round(rng.uniform(0.1, 0.9), 4)),
+            "lift": float(round(rng.uniform(0.5, 3.0), 4)),
+        }
+        for a in CUISINES for b in CUISINES if a != b and rng.random() < 0.3
+    ]
+
+    return {
+        "restaurants": restaurants,
+        "empty_locals": empty_locals,
+        "demographic_info": demographic_info,
+        "transport": transport,
+        "association_rules": association_rules,
+    }
+
+
+def load(db, datasets):
+    """ Sustituye las colecciones de la base de datos por las del dataset sintético """
+    for name, documents in datasets.items():
+        db.drop_collection(name)
+        if documents:
+            db[name].insert_many(documents)
+    # Derived fields that ingest.py (or indexes.py on an existing database) materializes
+    mongo = SimpleNamespace(db=db)
+    demographics = DemographicService(mongo)
+    demographics.ensure_normalized_names()
+    demographics.ensure_numeric_renta()
+    EmptyLocalsService(mongo).ensure_numeric_prices()
+    # Derived collections are rebuilt by the services at startup
+    db.drop_collection("neighborhood_geometries")
+    db.drop_collection("transport_proximity")
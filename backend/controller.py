@@ -1,27 +1,185 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_pymongo import PyMongo
 from flask_cors import CORS
+import hashlib
 import logging
-from services.RestaurantService import RestaurantService
-from services.DemographicService import DemographicService
+import os
+import contextvars
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
+from concurrent.futures import ThreadPoolExecutor
+from services.RestaurantService import RestaurantService, parse_geo_args, parse_sites
+from services.DemographicService import DemographicService, parse_nearest_k
 from services.EmptyLocalsService import EmptyLocalsService
 from services.TransportService import TransportService
+from services.TransportProximity import PROXIMITY_SOURCES, TransportProximity, parse_point_args
+from services.RestaurantIndex import RestaurantIndex
+from services.CompetitorTiles import CompetitorTiles
+from services.Pagination import STREAM_FORMATS, json_encoder, parse_page_args, rows_response
+from services.JsonProvider import FastJSONProvider
+from services.GeometryStore import GeometryStore, parse_zoom
+from services.EmptyLocalsSnapshot import EmptyLocalsSnapshot
+from services.NeighborhoodStats import NeighborhoodStats
+from services.AssociationRules import AssociationRules, parse_rule_args
+from services.ResponseCache import DatasetVersion, RedisBackend, ResponseCache
+from services.IndexManager import IndexManager
+from services.MongoPool import ConnectionPoolWarmer, PoolMonitor, mongo_client_options
+from services.VectorTiles import MVT_MIMETYPE, VectorTiles
+from services.Metrics import MetricsRegistry, MongoCommandMetrics, RequestMetrics, instrument, render_counter
 
 app = Flask(__name__)
 
 # Habilitar CORS para permitir solicitudes desde el frontend (localhost:3000)
-CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}})
+CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}}, expose_headers=["X-Next-Cursor"])
 
 # Configuración de MongoDB
-app.config["MONGO_URI"] = "mongodb://localhost:27017/urban_insight_data"
-mongo = PyMongo(app)
+app.config["MONGO_URI"] = os.environ.get("MONGO_URI", "mongodb://localhost:27017/urban_insight_data")
+# Pool de conexiones, timeouts y read preference (MONGO_MAX_POOL_SIZE, MONGO_READ_PREFERENCE, ... ver MongoPool.py)
+app.config["MONGO_CLIENT_OPTIONS"] = mongo_client_options(os.environ)
+# Con gunicorn.conf.py los servicios se cargan una vez en el proceso master y los workers los comparten tras el fork
+app.config["PRELOAD"] = os.environ.get("URBAN_INSIGHT_PRELOAD") == "1"
+# Comprobación con explain() de que las consultas usan índices al arrancar: "warn", "strict" (aborta) u "off"
+app.config["INDEX_PLAN_CHECK"] = os.environ.get("INDEX_PLAN_CHECK", "warn")
+# Índice espacial en memoria para las consultas por radio (nearby / competitors)
+app.config["RESTAURANT_SPATIAL_INDEX"] = True
+# Agregados precalculados por celda para /api/neighbours_competitors (requiere el índice espacial)
+app.config["COMPETITOR_TILES"] = True
+# Caché de respuestas de las rutas de solo lectura (se invalida al incrementar la versión de los datasets)
+app.config["RESPONSE_CACHE_SIZE"] = 512
+app.config["RESPONSE_CACHE_TTL"] = 3600
+app.config["RESPONSE_CACHE_REDIS_URL"] = None  # p.ej. "redis://localhost:6379/0" para compartirla entre procesos
+# Teselas vectoriales: pirámide precalculada de las capas estáticas y clusters de puntos hasta ese zoom
+app.config["VECTOR_TILES_PYRAMID_ZOOM"] = 14
+app.config["VECTOR_TILES_CLUSTER_ZOOM"] = 15
+app.config["VECTOR_TILES_MAX_AGE"] = 3600
+# Log de peticiones más lentas que este umbral (ms) con las consultas que lanzaron; None lo desactiva
+app.config["SLOW_REQUEST_MS"] = float(os.environ["SLOW_REQUEST_MS"]) if os.environ.get("SLOW_REQUEST_MS") else None
+
+# Métricas en /metrics: latencia por ruta, tiempo en MongoDB por método de servicio, tamaño de respuesta y caché
+metrics_registry = MetricsRegistry()
+mongo_metrics = MongoCommandMetrics(metrics_registry)
+RequestMetrics(metrics_registry, slow_request_ms=app.config["SLOW_REQUEST_MS"]).init_app(app)
+pool_monitor = PoolMonitor()
+mongo = PyMongo(app, event_listeners=[pool_monitor, mongo_metrics], **app.config["MONGO_CLIENT_OPTIONS"])
+pool_warmer = ConnectionPoolWarmer(mongo.cx, pool_monitor, app.config["MONGO_CLIENT_OPTIONS"].get("minPoolSize", 1))
+# Serialización JSON con orjson, con soporte para ObjectId, fechas y tipos de NumPy
+# (después de PyMongo(app), que puede registrar su propio proveedor JSON)
+app.json = FastJSONProvider(app)
 logging.basicConfig(level=logging.WARNING)
 
+# Versión de los datasets con la que se cargan las copias en memoria (ingest.py la incrementa)
+dataset_version = DatasetVersion(mongo)
+loaded_version = dataset_version.current()
+
 # Servicios
-restaurant_service = RestaurantService(mongo)
-demographics_service = DemographicService(mongo)
-empty_local_service = EmptyLocalsService(mongo)
-transport_service = TransportService(mongo)
+restaurant_index = RestaurantIndex(mongo) if app.config["RESTAURANT_SPATIAL_INDEX"] else None
+competitor_tiles = CompetitorTiles() if restaurant_index and app.config["COMPETITOR_TILES"] else None
+if restaurant_index:
+    if competitor_tiles:
+        restaurant_index.add_listener(competitor_tiles.build)
+    # With preload the change-stream thread is started in each worker (start_worker)
+    restaurant_index.start(watch=not app.config["PRELOAD"])
+# Geometrías de barrios reproyectadas a WGS84 una sola vez y persistidas
+geometry_store = GeometryStore(mongo)
+geometry_store.start()
+# Agregados por barrio materializados en neighborhood_stats y actualizados con los cambios de las colecciones
+neighborhood_stats = NeighborhoodStats(mongo)
+restaurant_service = RestaurantService(
+    mongo, index=restaurant_index, tiles=competitor_tiles, geometry_store=geometry_store, stats=neighborhood_stats
+)
+demographics_service = DemographicService(mongo, geometry_store=geometry_store)
+# Copia columnar de empty_locals, limpiada y serializada una sola vez
+empty_locals_snapshot = EmptyLocalsSnapshot(mongo, encode=json_encoder(app.json))
+empty_local_service = EmptyLocalsService(mongo, snapshot=empty_locals_snapshot, stats=neighborhood_stats)
+# Índice de paradas en memoria y distancias precalculadas de cada restaurante y local vacío al transporte
+transport_proximity = TransportProximity(mongo)
+transport_service = TransportService(mongo, proximity=transport_proximity)
+# Reglas de asociación en arrays con índices por ítem para filtrarlas en /association_rules
+association_rules = AssociationRules(mongo)
+association_rules.start()
+for service in (restaurant_service, demographics_service, empty_local_service, transport_service):
+    instrument(service)
+# Índices declarados por los servicios (se crean si faltan) y comprobación de sus planes de consulta
+index_manager = IndexManager(mongo, [restaurant_service, demographics_service, empty_local_service, transport_service])
+index_manager.start(plan_check=app.config["INDEX_PLAN_CHECK"])
+demographics_service.start(watch=not app.config["PRELOAD"])
+empty_locals_snapshot.start()
+transport_proximity.start()
+# After IndexManager: the incremental refreshes filter the source collections by Barrio
+neighborhood_stats.start(watch=not app.config["PRELOAD"])
+# Capas de puntos para /tiles (los restaurantes se reconstruyen con cada recarga del índice espacial)
+vector_tiles = VectorTiles(
+    mongo,
+    index=restaurant_index,
+    pyramid_max_zoom=app.config["VECTOR_TILES_PYRAMID_ZOOM"],
+    cluster_max_zoom=app.config["VECTOR_TILES_CLUSTER_ZOOM"]
+)
+vector_tiles.start()
+
+# Hilos para lanzar en paralelo las consultas independientes de una misma petición
+query_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="query")
+
+
+def reload_datasets():
+    """ Recarga las copias en memoria de los datasets cuando ingest.py incrementa su versión """
+    loaders = [
+        geometry_store.load,
+        demographics_service.warm_lookups,  # After the geometries, like at startup
+        empty_locals_snapshot.load,
+        transport_proximity.load,
+        association_rules.load,
+        vector_tiles.load
+    ]
+    if restaurant_index:
+        # Its listeners rebuild the competitor tiles and the restaurants tile layer
+        loaders.insert(0, restaurant_index.load)
+    for load in loaders:
+        try:
+            load()
+        except PyMongoError as e:
+            logging.error(f"Could not reload {load.__qualname__}: {str(e)}")
+
+
+response_cache = ResponseCache(
+    dataset_version,
+    maxsize=app.config["RESPONSE_CACHE_SIZE"],
+    ttl=app.config["RESPONSE_CACHE_TTL"],
+    shared_backend=RedisBackend(app.config["RESPONSE_CACHE_REDIS_URL"]) if app.config["RESPONSE_CACHE_REDIS_URL"] else None
+)
+# The change-stream refreshes do not bump the dataset version: they invalidate the cached responses themselves
+if restaurant_index:
+    restaurant_index.add_listener(response_cache.invalidate)
+neighborhood_stats.add_listener(response_cache.invalidate)
+demographics_service.add_listener(response_cache.invalidate)
+if not app.config["PRELOAD"]:
+    dataset_version.watch(reload_datasets, since=loaded_version)
+    pool_warmer.start()
+
+
+def cache_metric_lines():
+    counts = {}
+    for endpoint, stats in response_cache.hit_stats().items():
+        counts[(endpoint, "hit")] = stats["hits"]
+        counts[(endpoint, "miss")] = stats["misses"]
+    return render_counter("response_cache_requests_total", "Response cache lookups by route", ("endpoint", "result"), counts)
+
+metrics_registry.add_collector(cache_metric_lines)
+
+
+def start_worker():
+    """
+    Arranca en cada worker los hilos que no sobreviven al fork y calienta su pool de conexiones.
+    El MongoClient heredado del master no se cierra: PyMongo reinicia sus pools en el proceso hijo tras el fork.
+    """
+    pool_monitor.reset()
+    if restaurant_index:
+        restaurant_index.start_watching()
+    neighborhood_stats.start_watching()
+    demographics_service.start_watching()
+    # A worker forked after an ingest reloads on the first check, its snapshots are still those of loaded_version
+    dataset_version.watch(reload_datasets, since=loaded_version)
+    pool_warmer.start()
 
 
 # Rutas relacionadas con RestaurantService
@@ -30,13 +188,18 @@ def get_nearby_restaurants():
     try:
         lat = float(request.args.get('lat'))
         lon = float(request.args.get('lon'))
-        return restaurant_service.get_nearby_restaurants(lat, lon)
+        filters = parse_geo_args(request.args)
+        return restaurant_service.get_nearby_restaurants(lat, lon, filters)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
 @app.route('/restaurants', methods=['GET'])
 def get_restaurants():
-    return restaurant_service.get_restaurants()
+    try:
+        page = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return restaurant_service.get_restaurants(**page)
 
 @app.route('/api/neighbours_competitors', methods=['GET'])
 def neighbours_competitors():
@@ -47,13 +210,33 @@ def neighbours_competitors():
             return jsonify({"error": "Missing latitude or longitude"}), 400
         lat = float(lat)
         lon = float(lon)
-        return restaurant_service.get_neighbours_competitors(lat, lon)
     except ValueError:
         return jsonify({"error": "Invalid latitude or longitude"}), 400
+    try:
+        filters = parse_geo_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return restaurant_service.get_neighbours_competitors(lat, lon, filters)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/neighbours_competitors/batch', methods=['POST'])
+def neighbours_competitors_batch():
+    # Body: {"points": [{"lat", "lon", "id"}, ...]}, a bare list of points or {"neighborhood": name} (its empty locals),
+    # optional "radius"
+    try:
+        sites, radius = parse_sites(request.get_json(silent=True), empty_local_service.get_locations_by_neighborhood)
+        stream_format = request.args.get('format', 'ndjson')
+        if stream_format not in STREAM_FORMATS:
+            raise ValueError(f"Invalid format: {stream_format}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Results are streamed as each block of sites is computed
+    return rows_response(restaurant_service.get_competitors_batch(sites, radius), stream_format)
+
 @app.route('/api/restaurant_price_categories', methods=['GET'])
+@response_cache.cached
 def get_price_categories():
     try:
         price_categories = restaurant_service.get_price_categories()
@@ -62,6 +245,7 @@ def get_price_categories():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/restaurant_cuisine_categories', methods=['GET'])
+@response_cache.cached
 def get_cuisine_categories():
     try:
         cuisine_categories = restaurant_service.get_cuisine_categories()
@@ -70,6 +254,7 @@ def get_cuisine_categories():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/top_5_cuisine_types_by_neighborhood/<string:neighborhood_name>', methods=['GET'])
+@response_cache.cached
 def get_top_5_cuisine_types_by_neighborhood(neighborhood_name):
     try:
         top_cuisine_types = restaurant_service.get_top_5_cuisine_types_by_neighborhood(neighborhood_name)
@@ -78,6 +263,7 @@ def get_top_5_cuisine_types_by_neighborhood(neighborhood_name):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/restaurant_price_categories_by_neighborhood/<string:neighborhood_name>', methods=['GET'])
+@response_cache.cached
 def get_restaurant_price_categories_by_neighborhood(neighborhood_name):
     try:
         price_categories = restaurant_service.get_price_categories_by_neighborhood(neighborhood_name)
@@ -86,6 +272,7 @@ def get_restaurant_price_categories_by_neighborhood(neighborhood_name):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/restaurant_count_by_neighborhood/<string:neighborhood_name>', methods=['GET'])
+@response_cache.cached
 def get_restaurant_count_by_neighborhood(neighborhood_name):
     try:
         count = restaurant_service.get_restaurant_count_by_neighborhood(neighborhood_name)
@@ -93,7 +280,17 @@ def get_restaurant_count_by_neighborhood(neighborhood_name):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/restaurant_count_by_neighborhoods', methods=['GET'])
+@response_cache.cached
+def get_restaurant_counts_for_neighborhoods():
+    try:
+        counts = restaurant_service.get_restaurant_counts_for_neighborhoods()
+        return jsonify(counts), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/restaurants_by_neighborhood/<string:neighborhood>', methods=['GET'])
+@response_cache.cached
 def get_restaurants_by_neighborhood(neighborhood):
     try:
         restaurants = restaurant_service.get_restaurants_by_neighborhood(neighborhood)
@@ -104,6 +301,7 @@ def get_restaurants_by_neighborhood(neighborhood):
 
 # Rutas relacionadas con DemographicService
 @app.route('/api/demographics', methods=['GET'])
+@response_cache.cached
 def get_demographics():
     try:
         filters = request.args
@@ -112,11 +310,12 @@ def get_demographics():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/demographics_by_name', methods=['GET'])
+@response_cache.cached
 def get_demographics_by_name():
     try:
         barrio = request.args.get('barrio')
         if barrio:
-            neighborhood_data = demographics_service.get_neighborhood_by_name(barrio)
+            neighborhood_data = demographics_service.get_neighborhood_by_name(barrio, parse_zoom(request.args))
             if neighborhood_data:
                 return jsonify(neighborhood_data), 200
             else:
@@ -124,23 +323,51 @@ def get_demographics_by_name():
         else:
             filters = request.args
             return demographics_service.get_demographics(filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/neighborhoods', methods=['GET'])
+@response_cache.cached
 def get_neighborhoods():
     try:
-        return demographics_service.get_neigborhoods()
+        # ?zoom=N: WGS84 geometries simplified for that zoom level (UTM at full resolution without it)
+        return demographics_service.get_neigborhoods(parse_zoom(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/neighborhoods/search', methods=['GET'])
+@response_cache.cached
+def search_neighborhoods():
+    try:
+        query = request.args.get('q', '')
+        limit = int(request.args.get('limit', 10))
+        return jsonify(demographics_service.search_neighborhoods(query, limit)), 200
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/similar_neighborhoods_by_renta/<string:renta>', methods=['GET'])
+@response_cache.cached
 def get_similar_neighborhoods_by_renta(renta):
     try:
         renta = renta.replace(",", ".")
         renta = float(renta)
-        barrios_similares = demographics_service.get_neighborhoods_by_renta_service(renta)
-        return jsonify(barrios_similares) if barrios_similares else jsonify({"error": "No se encontraron barrios con una renta similar"}), 404
+        try:
+            k = parse_nearest_k(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if k is not None:
+            barrios_similares = demographics_service.get_nearest_neighborhoods_by_renta(renta, k)
+        else:
+            barrios_similares = demographics_service.get_neighborhoods_by_renta_service(renta)
+        if barrios_similares:
+            return jsonify(barrios_similares), 200
+        return jsonify({"error": "No se encontraron barrios con una renta similar"}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -148,9 +375,14 @@ def get_similar_neighborhoods_by_renta(renta):
 # Rutas relacionadas con EmptyLocalsService
 @app.route('/api/empty_locals', methods=['GET'])
 def get_empty_locals():
-    return empty_local_service.get_empty_locals()
+    try:
+        page = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return empty_local_service.get_empty_locals(**page)
 
 @app.route('/api/empty_locals_by_neighborhood/<string:neighborhood>', methods=['GET'])
+@response_cache.cached
 def get_empty_locals_by_neighborhood(neighborhood):
     try:
         locals = empty_local_service.get_empty_locals_by_neighborhood(neighborhood)
@@ -159,6 +391,7 @@ def get_empty_locals_by_neighborhood(neighborhood):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/empty_locals_count_by_neighborhood', methods=['GET'])
+@response_cache.cached
 def get_empty_locals_count_by_neighborhood():
     try:
         local_counts = empty_local_service.get_empty_locals_count_by_neighborhood()
@@ -167,6 +400,7 @@ def get_empty_locals_count_by_neighborhood():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/empty_locals_average_price', methods=['GET'])
+@response_cache.cached
 def get_empty_locals_average_price():
     try:
         neighborhood = request.args.get('neighborhood')
@@ -178,6 +412,7 @@ def get_empty_locals_average_price():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/empty_locals_average_price_by_neighborhood', methods=['GET'])
+@response_cache.cached
 def get_empty_locals_average_price_by_neighborhood():
     try:
         average_prices = empty_local_service.get_average_price_by_neighborhoods()
@@ -186,15 +421,131 @@ def get_empty_locals_average_price_by_neighborhood():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/neighborhood_profile/<string:neighborhood_name>', methods=['GET'])
+@response_cache.cached
+def get_neighborhood_profile(neighborhood_name):
+    try:
+        # Restaurant facets, empty-locals facets and demographics run concurrently
+        # (each in a copy of the request context, so their MongoDB commands are attributed to this request)
+        restaurants = query_executor.submit(contextvars.copy_context().run, restaurant_service.get_neighborhood_profile, neighborhood_name)
+        empty_locals = query_executor.submit(contextvars.copy_context().run, empty_local_service.get_neighborhood_profile, neighborhood_name)
+        demographics = query_executor.submit(contextvars.copy_context().run, demographics_service.get_neighborhood_by_name, neighborhood_name)
+        return jsonify({
+            "neighborhood": neighborhood_name,
+            **restaurants.result(),
+            "empty_locals": empty_locals.result(),
+            "demographics": demographics.result()
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/tiles/<string:layer>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def get_vector_tile(layer, z, x, y):
+    try:
+        data = vector_tiles.tile(layer, z, x, y)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if data is None:
+        return jsonify({"error": f"Unknown layer: {layer}", "layers": vector_tiles.layers()}), 404
+    response = Response(data, mimetype=MVT_MIMETYPE)
+    response.set_etag(hashlib.sha1(data).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config["VECTOR_TILES_MAX_AGE"]
+    return response.make_conditional(request)
+
+
+@app.route('/api/cache_stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({"dataset_version": dataset_version.current(), "routes": response_cache.hit_stats()}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/health/live', methods=['GET'])
+def get_liveness():
+    return jsonify({"status": "ok"}), 200
+
+@app.route('/health/ready', methods=['GET'])
+def get_readiness():
+    # Ready once this worker's connection pool is warm; the datasets are informative because the
+    # services fall back to MongoDB queries while they are not loaded
+    ready = pool_warmer.ready()
+    return jsonify({
+        "status": "ready" if ready else "starting",
+        "pool": pool_monitor.stats(),
+        "error": pool_warmer.error,
+        "datasets": {
+            "restaurant_index": restaurant_index is not None and restaurant_index.loaded,
+            "competitor_tiles": competitor_tiles is not None and competitor_tiles.loaded,
+            "neighborhood_geometries": geometry_store.loaded,
+            "empty_locals_snapshot": empty_locals_snapshot.loaded,
+            "neighborhood_stats": neighborhood_stats.loaded,
+            "association_rules": association_rules.loaded,
+            "transport_proximity": transport_proximity.loaded,
+            "vector_tiles": vector_tiles.loaded,
+        }
+    }), 200 if ready else 503
+
+
 @app.route('/transport', methods=['GET'])
 def get_transport():
-    return transport_service.get_transport_data()
+    try:
+        page = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return transport_service.get_transport_data(**page)
+
+@app.route('/api/transport_proximity', methods=['GET'])
+def get_transport_proximity():
+    # ?lat=&lon=&radius=: nearest stop of each mode and number of stops within radius meters
+    try:
+        lat, lon, radius = parse_point_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return jsonify(transport_service.get_proximity(lat, lon, radius)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/transport_proximity/<string:source>/<string:site_id>', methods=['GET'])
+@response_cache.cached
+def get_site_transport_proximity(source, site_id):
+    # Precomputed for every restaurant and empty local (source: restaurants or empty_locals)
+    if source not in PROXIMITY_SOURCES:
+        return jsonify({"error": f"Unknown source: {source}"}), 404
+    try:
+        site_id = ObjectId(site_id)
+    except InvalidId:
+        return jsonify({"error": f"Invalid id: {site_id}"}), 400
+    try:
+        proximity = transport_service.get_site_proximity(source, site_id)
+        if proximity is None:
+            return jsonify({"error": f"No transport data for {source}/{site_id}"}), 404
+        return jsonify(proximity), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 
 @app.route('/association_rules', methods=['GET'])
+@response_cache.cached
 def get_association_rules():
-    results = mongo.db['association_rules'].find({}, {"_id": 0})
-    return list(results)
+    # Without parameters every rule; see parse_rule_args for the filters, sort and limit
+    try:
+        query = parse_rule_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        cuisines = None
+        if query.neighborhood is not None:
+            top_cuisines = restaurant_service.get_top_5_cuisine_types_by_neighborhood(query.neighborhood)
+            cuisines = [cuisine["Tipo"] for cuisine in top_cuisines]
+        return jsonify(association_rules.get_rules(query, cuisines)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 
 if __name__ == '__main__':
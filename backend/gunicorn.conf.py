@@ -0,0 +1,48 @@
+"""
+Lanzador de producción (desde backend/):
+
+    gunicorn -c gunicorn.conf.py
+
+Con preload_app el master importa controller una sola vez (índice espacial, tiles, geometrías, snapshot...)
+y los workers lo heredan copy-on-write, así que arrancar o reiniciar un worker no vuelve a consultar MongoDB.
+El pool de conexiones se configura con las variables MONGO_* (ver services/MongoPool.py).
+"""
+import gc
+import multiprocessing
+import os
+
+os.environ.setdefault("URBAN_INSIGHT_PRELOAD", "1")
+
+wsgi_app = "controller:app"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+preload_app = True
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers periodically; the jitter keeps them from restarting (and warming their pools) all at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+
+# One pooled connection per worker thread, plus headroom for the background threads
+os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(threads + 4))
+os.environ.setdefault("MONGO_MIN_POOL_SIZE", str(threads))
+os.environ.setdefault("MONGO_MAX_IDLE_TIME_MS", "300000")
+os.environ.setdefault("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")
+os.environ.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+os.environ.setdefault("MONGO_CONNECT_TIMEOUT_MS", "5000")
+os.environ.setdefault("MONGO_APPNAME", "urban-insight")
+
+
+def when_ready(server):
+    # The app is already loaded (preload): freeze the loaded objects so the garbage collector does not touch
+    # (and copy) the shared pages in every worker. The MongoClient stays open; PyMongo resets its pools after fork
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import controller
+    controller.start_worker()
@@ -0,0 +1,68 @@
+"""
+Crea los índices que declaran los servicios y comprueba con explain() que sus consultas los usan (desde backend/):
+
+    python indexes.py                  # crea los que faltan y muestra el plan de cada consulta
+    python indexes.py --check-only     # no crea nada
+    python indexes.py --strict         # termina con código 1 si alguna consulta hace COLLSCAN
+
+Salvo con --check-only, materializa también los campos derivados que escribe ingest.py (NombreNormalizado y
+RentaNum de demographic_info, PrecioNum de empty_locals) en las bases de datos que no se han cargado con él;
+la aplicación solo los lee. Usa MONGO_URI y las variables MONGO_* como la aplicación.
+"""
+import argparse
+import os
+import sys
+from types import SimpleNamespace
+from pymongo import MongoClient
+from services.RestaurantService import RestaurantService
+from services.DemographicService import DemographicService
+from services.EmptyLocalsService import EmptyLocalsService
+from services.TransportService import TransportService
+from services.IndexManager import DEFAULT_SAMPLE, IndexManager, QueryPlanError
+from services.MongoPool import mongo_client_options
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index bootstrap and query-plan verification")
+    parser.add_argument("--check-only", action="store_true", help="do not create missing indexes")
+    parser.add_argument("--strict", action="store_true", help="exit with status 1 if a query is not using an index")
+    parser.add_argument("--neighborhood", default=DEFAULT_SAMPLE["neighborhood"])
+    parser.add_argument("--lat", type=float, default=DEFAULT_SAMPLE["lat"])
+    parser.add_argument("--lon", type=float, default=DEFAULT_SAMPLE["lon"])
+    parser.add_argument("--renta", type=float, default=DEFAULT_SAMPLE["renta"])
+    args = parser.parse_args()
+
+    uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017/urban_insight_data")
+    mongo = SimpleNamespace(db=MongoClient(uri, **mongo_client_options(os.environ)).get_default_database())
+    demographics_service = DemographicService(mongo)
+    empty_locals_service = EmptyLocalsService(mongo)
+    services = [RestaurantService(mongo), demographics_service, empty_locals_service, TransportService(mongo)]
+    manager = IndexManager(mongo, services)
+
+    if not args.check_only:
+        demographics_service.ensure_normalized_names()
+        demographics_service.ensure_numeric_renta()
+        empty_locals_service.ensure_numeric_prices()
+        for name in manager.ensure():
+            print(f"created  {name}")
+        for conflict in manager.conflicts:
+            print(f"conflict {conflict}", file=sys.stderr)
+    sample = {"neighborhood": args.neighborhood, "lat": args.lat, "lon": args.lon, "renta": args.renta}
+    try:
+        report = manager.verify(sample, strict=args.strict)
+        error = None
+    except QueryPlanError as e:
+        # The report is printed first so that it shows which queries failed
+        report, error = e.report, e
+    for entry in report:
+        status = "ERROR" if "error" in entry else ("COLLSCAN" if entry["collscan"] else "ok")
+        detail = entry.get("error") or ", ".join(entry["stages"])
+        print(f"{status:<9}{entry['collection']}.{entry['query']}: {detail}")
+    if error is not None:
+        print(str(error), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Carga los datasets desde los ficheros de origen, normalizados, y sustituye las colecciones de una vez (desde backend/):
+
+    python ingest.py --demographics barrios.geojson --restaurants restaurantes.csv \
+        --empty-locals locales.csv --transport transporte.geojson
+    python ingest.py --restaurants restaurantes.ndjson          # solo un dataset (p.ej. salida de mongoexport)
+    python ingest.py --demographics barrios.geojson --demographics-crs EPSG:4326
+
+Los CSV llevan una cabecera con los nombres de campo de MongoDB y las coordenadas en columnas lon/lat.
+Después de la carga sincroniza las geometrías, los agregados por barrio y las distancias al transporte, e incrementa
+la versión de los datasets: la aplicación en marcha recarga sus copias en memoria e invalida las cachés de respuestas
+(en unos segundos, sin reiniciarla). Usa MONGO_URI y las variables MONGO_* como la aplicación.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from types import SimpleNamespace
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from services.RestaurantService import RestaurantService
+from services.DemographicService import DemographicService
+from services.EmptyLocalsService import EmptyLocalsService
+from services.TransportService import TransportService
+from services.IndexManager import IndexManager
+from services.Ingestion import DATA_CRS, DatasetLoader
+from services.GeometryStore import GeometryStore
+from services.NeighborhoodStats import NeighborhoodStats
+from services.TransportProximity import TransportProximity
+from services.ResponseCache import DatasetVersion
+from services.MongoPool import mongo_client_options
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk ingestion of the city datasets")
+    parser.add_argument("--demographics", help="demographic_info source (GeoJSON, JSON, NDJSON or CSV)")
+    parser.add_argument("--restaurants", help="restaurants source")
+    parser.add_argument("--empty-locals", help="empty_locals source")
+    parser.add_argument("--transport", help="transport source")
+    parser.add_argument("--demographics-crs", default=DATA_CRS, help=f"CRS of the neighborhood polygons (stored in {DATA_CRS})")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+    paths = {
+        "demographic_info": args.demographics,
+        "restaurants": args.restaurants,
+        "empty_locals": args.empty_locals,
+        "transport": args.transport,
+    }
+    if not any(paths.values()):
+        parser.error("at least one dataset file is required")
+    logging.basicConfig(level=logging.WARNING)
+
+    uri = os.environ.get("MONGO_URI", "mongodb://localhost:27017/urban_insight_data")
+    mongo = SimpleNamespace(db=MongoClient(uri, **mongo_client_options(os.environ)).get_default_database())
+    services = [RestaurantService(mongo), DemographicService(mongo), EmptyLocalsService(mongo), TransportService(mongo)]
+    loader = DatasetLoader(mongo, indexes=IndexManager(mongo, services).declared(), chunk_size=args.chunk_size)
+
+    started = time.perf_counter()
+    try:
+        for report in loader.load_all(paths, crs=args.demographics_crs):
+            print(f"{report.dataset:<18}{report.written:>8} / {report.read:<8} documents  {report.seconds:6.1f}s")
+        # Derived data that the application would otherwise rebuild on the next start
+        if paths["demographic_info"]:
+            GeometryStore(mongo).sync()
+        NeighborhoodStats(mongo).refresh()
+        TransportProximity(mongo).sync()
+        version = DatasetVersion(mongo).bump()
+    except (PyMongoError, ValueError, OSError) as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print(f"done in {time.perf_counter() - started:.1f}s, dataset version {version}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
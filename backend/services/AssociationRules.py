@@ -0,0 +1,228 @@
+import ast
+import logging
+import math
+import re
+from collections import namedtuple
+import numpy as np
+from pymongo.errors import PyMongoError
+
+RULE_METRICS = ("support", "confidence", "lift")
+MAX_RULES = 1000
+# pandas/mlxtend write the item sets as "frozenset({'Italiana', 'Japonesa'})" when exported as text
+FROZENSET_PATTERN = re.compile(r"frozenset\((.*)\)")
+
+# Filtros de /association_rules (ver parse_rule_args); sin ninguno se devuelven todas las reglas
+RuleQuery = namedtuple(
+    "RuleQuery",
+    ["antecedents", "cuisine", "neighborhood", "min_support", "min_confidence", "min_lift", "sort", "limit"],
+    defaults=[None, None, None, None, None, None, None, None]
+)
+
+
+def parse_rule_args(args):
+    """
+    antecedent (varios separados por comas o repetidos), cuisine, neighborhood, min_support, min_confidence,
+    min_lift, sort (métrica, de mayor a menor) y limit de la query string. Lanza ValueError si no son válidos.
+    """
+    def number(name, cast=float):
+        value = args.get(name)
+        if value is None or value == "":
+            return None
+        try:
+            number = cast(value)
+        except ValueError:
+            raise ValueError(f"Invalid {name}")
+        if isinstance(number, float) and math.isnan(number):
+            raise ValueError(f"Invalid {name}")
+        return number
+
+    antecedents = [item.strip() for value in args.getlist("antecedent") for item in value.split(",") if item.strip()]
+    sort = args.get("sort") or None
+    if sort is not None and sort not in RULE_METRICS:
+        raise ValueError(f"sort must be one of: {', '.join(RULE_METRICS)}")
+    limit = number("limit", int)
+    if limit is not None and not 0 < limit <= MAX_RULES:
+        raise ValueError(f"limit must be between 1 and {MAX_RULES}")
+    return RuleQuery(
+        antecedents or None,
+        (args.get("cuisine") or "").strip() or None,
+        (args.get("neighborhood") or "").strip() or None,
+        number("min_support"),
+        number("min_confidence"),
+        number("min_lift"),
+        sort,
+        limit
+    )
+
+
+def rule_items(value):
+    """ Ítems de antecedents/consequents: lista, texto de un frozenset exportado por pandas o un único ítem """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [str(item) for item in value]
+    if isinstance(value, str):
+        match = FROZENSET_PATTERN.fullmatch(value.strip())
+        if match:
+            try:
+                return sorted(str(item) for item in ast.literal_eval(match.group(1) or "set()"))
+            except (ValueError, SyntaxError, TypeError):
+                pass
+        return [value]
+    return []
+
+
+def _item_lists(item_lists, codes):
+    """ Offsets y códigos (formato CSR) de una lista de listas de ítems """
+    lengths = np.array([len(items) for items in item_lists], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    flat = np.array([codes[item] for items in item_lists for item in items], dtype=np.int64)
+    return offsets, flat
+
+
+def _postings(offsets, flat, n_items):
+    """ Índice invertido ítem -> reglas (CSR): las reglas del ítem c son rules[item_offsets[c]:item_offsets[c + 1]] """
+    rule_ids = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    order = np.argsort(flat, kind="stable")
+    item_offsets = np.concatenate([[0], np.cumsum(np.bincount(flat, minlength=n_items))]).astype(np.int64)
+    return item_offsets, rule_ids[order]
+
+
+class AssociationRules:
+    """
+    Reglas de asociación cargadas al arrancar en arrays (métricas por columna, ítems codificados) con índices
+    invertidos por ítem del antecedente y por ítem de cualquiera de los dos lados. Los filtros se resuelven con
+    máscaras sobre esos arrays; MongoDB se consulta mientras no están cargadas.
+    """
+
+    def __init__(self, mongo):
+        self.rules_collection = mongo.db['association_rules']
+        self.loaded = False
+        self._arrays = {}
+
+    def load(self):
+        documents = list(self.rules_collection.find({}, {"_id": 0}))
+        antecedents = [rule_items(d.get("antecedents")) for d in documents]
+        consequents = [rule_items(d.get("consequents")) for d in documents]
+        items = sorted({item for rule in antecedents + consequents for item in rule})
+        codes = {item: code for code, item in enumerate(items)}
+        # Every numeric field is a metric column (mlxtend also adds leverage, conviction...); NaN where missing
+        metrics = sorted({
+            key for d in documents for key, value in d.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        } | set(RULE_METRICS))
+        columns = {
+            metric: np.array([
+                d[metric] if isinstance(d.get(metric), (int, float)) and not isinstance(d.get(metric), bool) else np.nan
+                for d in documents
+            ], dtype=float)
+            for metric in metrics
+        }
+        antecedent_offsets, antecedent_codes = _item_lists(antecedents, codes)
+        consequent_offsets, consequent_codes = _item_lists(consequents, codes)
+        both_offsets, both_codes = _item_lists([a + c for a, c in zip(antecedents, consequents)], codes)
+
+        self._arrays = {
+            "count": len(documents),
+            "items": np.array(items, dtype=object),
+            "codes": codes,
+            "metrics": columns,
+            "antecedent_offsets": antecedent_offsets,
+            "antecedent_codes": antecedent_codes,
+            "antecedent_sizes": np.diff(antecedent_offsets),
+            "consequent_offsets": consequent_offsets,
+            "consequent_codes": consequent_codes,
+            "by_antecedent": _postings(antecedent_offsets, antecedent_codes, len(items)),
+            "by_item": _postings(both_offsets, both_codes, len(items)),
+        }
+        self.loaded = True
+        logging.info(f"Association rules loaded: {len(documents)} rules over {len(items)} items")
+
+    def start(self):
+        try:
+            self.load()
+        except PyMongoError as e:
+            logging.error(f"Could not load association rules, falling back to MongoDB queries: {str(e)}")
+
+    def get_rules(self, query=RuleQuery(), neighborhood_cuisines=None):
+        """
+        Reglas que cumplen query: con antecedent, las que tienen todos esos ítems en el antecedente; con cuisine,
+        las que la mencionan en cualquiera de los dos lados; con neighborhood, las que tienen todo el antecedente
+        dentro del barrio (su nombre o neighborhood_cuisines, sus tipos de cocina principales).
+        """
+        if not self.loaded:
+            return self._rules_from_mongo(query, neighborhood_cuisines)
+        rows = self._matching_rows(query, self._neighborhood_items(query, neighborhood_cuisines))
+        return [self._rule_row(i) for i in rows.tolist()]
+
+    def _neighborhood_items(self, query, neighborhood_cuisines):
+        if query.neighborhood is None:
+            return None
+        return [query.neighborhood] + [cuisine for cuisine in (neighborhood_cuisines or []) if cuisine is not None]
+
+    def _matching_rows(self, query, neighborhood_items=None):
+        arrays = self._arrays
+        mask = np.ones(arrays["count"], dtype=bool)
+        for item in query.antecedents or []:
+            mask &= self._rules_with(arrays["by_antecedent"], [item])
+        if query.cuisine is not None:
+            mask &= self._rules_with(arrays["by_item"], [query.cuisine])
+        if neighborhood_items is not None:
+            # Rules whose every antecedent item is one of the neighborhood's
+            item_offsets, rules = arrays["by_antecedent"]
+            codes = sorted({arrays["codes"][item] for item in neighborhood_items if item in arrays["codes"]})
+            hits = np.concatenate([rules[item_offsets[c]:item_offsets[c + 1]] for c in codes] or [np.empty(0, dtype=np.int64)])
+            counts = np.bincount(hits, minlength=arrays["count"])
+            mask &= (counts == arrays["antecedent_sizes"]) & (arrays["antecedent_sizes"] > 0)
+        for metric, minimum in zip(RULE_METRICS, (query.min_support, query.min_confidence, query.min_lift)):
+            if minimum is not None:
+                mask &= arrays["metrics"][metric] >= minimum  # NaN (missing metric) never passes
+
+        rows = np.flatnonzero(mask)
+        if query.sort is not None:
+            # Descending by the metric, missing values last, load order between ties
+            values = arrays["metrics"][query.sort][rows]
+            rows = rows[np.lexsort((rows, -np.nan_to_num(values, nan=0.0), np.isnan(values)))]
+        return rows if query.limit is None else rows[:query.limit]
+
+    def _rules_with(self, postings, items):
+        """ Máscara de las reglas que contienen alguno de items en la lista invertida postings """
+        item_offsets, rules = postings
+        mask = np.zeros(self._arrays["count"], dtype=bool)
+        for item in items:
+            code = self._arrays["codes"].get(item)
+            if code is not None:
+                mask[rules[item_offsets[code]:item_offsets[code + 1]]] = True
+        return mask
+
+    def _rule_row(self, i):
+        arrays = self._arrays
+        row = {
+            "antecedents": arrays["items"][arrays["antecedent_codes"][arrays["antecedent_offsets"][i]:arrays["antecedent_offsets"][i + 1]]].tolist(),
+            "consequents": arrays["items"][arrays["consequent_codes"][arrays["consequent_offsets"][i]:arrays["consequent_offsets"][i + 1]]].tolist(),
+        }
+        for metric, values in arrays["metrics"].items():
+            if not math.isnan(values[i]):
+                row[metric] = float(values[i])
+        return row
+
+    def rules_filter(self, query, neighborhood_cuisines=None):
+        """ Filtro de MongoDB equivalente a los de get_rules (para item sets guardados como listas) """
+        clauses = []
+        if query.antecedents:
+            clauses.append({"antecedents": {"$all": query.antecedents}})
+        if query.cuisine is not None:
+            clauses.append({"$or": [{"antecedents": query.cuisine}, {"consequents": query.cuisine}]})
+        neighborhood_items = self._neighborhood_items(query, neighborhood_cuisines)
+        if neighborhood_items is not None:
+            clauses.append({"antecedents": {"$ne": [], "$not": {"$elemMatch": {"$nin": neighborhood_items}}}})
+        for metric, minimum in zip(RULE_METRICS, (query.min_support, query.min_confidence, query.min_lift)):
+            if minimum is not None:
+                clauses.append({metric: {"$gte": minimum}})
+        return {"$and": clauses} if clauses else {}
+
+    def _rules_from_mongo(self, query, neighborhood_cuisines=None):
+        rules = self.rules_collection.find(self.rules_filter(query, neighborhood_cuisines), {"_id": 0})
+        if query.sort is not None:
+            rules = rules.sort([(query.sort, -1), ("_id", 1)])
+        if query.limit is not None:
+            rules = rules.limit(query.limit)
+        return list(rules)
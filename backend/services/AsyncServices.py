@@ -0,0 +1,320 @@
+"""
+Variantes asíncronas de los servicios para el modo ASGI (asgi.py).
+Cada clase hereda del servicio síncrono: las estructuras en memoria (índice, tiles, snapshot, tablas de nombres)
+se cargan con el cliente síncrono igual que en controller.py, y las consultas de cada petición se lanzan con el
+driver asíncrono de PyMongo reutilizando los mismos pipelines. Los métodos *_async devuelven datos, no respuestas.
+"""
+import asyncio
+import hashlib
+import itertools
+from functools import wraps
+from quart import Response, current_app, make_response, request
+from quart.wrappers.response import DataBody
+from services.Pagination import STREAM_FORMATS, async_cursor_chunks, async_cursor_page, json_encoder, keyset_query
+from services.RestaurantService import RestaurantService, GeoFilters, RESTAURANT_LIST_PROJECTION
+from services.DemographicService import DemographicService, DEMOGRAPHICS_PROJECTION, normalize_name
+from services.EmptyLocalsService import EmptyLocalsService, EMPTY_LOCAL_LIST_PROJECTION, EMPTY_LOCALS_PROJECTION
+from services.TransportService import TransportService
+from services.TransportProximity import PROXIMITY_COLLECTION, STOPS_RADIUS, proximity_result
+from services.AssociationRules import AssociationRules, RuleQuery
+from services.ResponseCache import CachedResponse, ResponseCache
+from services.NeighborhoodStats import (
+    CITY_ID,
+    STATS_COLLECTION,
+    average_price_result,
+    empty_locals_profile_result,
+    price_categories_result,
+    restaurant_profile_result,
+    top_cuisine_types_result,
+)
+
+
+class AsyncResponseCache(ResponseCache):
+    """ ResponseCache para las vistas async de Quart: mismas claves, backends, ETag y respuestas 304 """
+
+    def cached(self, view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            key = self._key(request.endpoint, kwargs, request.args)
+            entry = await self._run(self._get, key)
+            self._record(request.endpoint, hit=entry is not None)
+            if entry is None:
+                response = await make_response(await view(*args, **kwargs))
+                if response.status_code != 200 or not isinstance(response.response, DataBody):
+                    return response
+                body = await response.get_data()
+                entry = CachedResponse(body, response.mimetype, hashlib.sha1(body).hexdigest())
+                await self._run(self._set, key, entry)
+            response = Response(entry.body, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            return await response.make_conditional(request)
+        return wrapper
+
+    async def _run(self, function, *args):
+        # The shared backend does network I/O, keep it off the event loop
+        if self.shared is None:
+            return function(*args)
+        return await asyncio.to_thread(function, *args)
+
+
+async def aggregate(collection, pipeline):
+    cursor = await collection.aggregate(pipeline)
+    return await cursor.to_list(None)
+
+
+async def stats_document(collection, _id):
+    """ Documento de neighborhood_stats (barrio o CITY_ID), {} si no existe """
+    return await collection.find_one({"_id": _id}) or {}
+
+
+def stream_response(cursor, to_row, stream_format):
+    """ Respuesta en streaming de un cursor asíncrono (array JSON o NDJSON) """
+    encode = json_encoder(current_app.json)
+    return Response(async_cursor_chunks(cursor, to_row, encode, stream_format), mimetype=STREAM_FORMATS[stream_format])
+
+
+async def page_response(cursor, to_row, limit, stream_format):
+    body, next_cursor = await async_cursor_page(cursor, to_row, json_encoder(current_app.json), limit, stream_format)
+    response = Response(body, mimetype=STREAM_FORMATS[stream_format])
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+async def cursor_response_async(cursor, to_row, limit=None, stream_format="json"):
+    if limit is None:
+        return stream_response(cursor, to_row, stream_format)
+    return await page_response(cursor, to_row, limit, stream_format)
+
+
+def threaded_rows_response(rows, stream_format="ndjson", block_size=256):
+    """ Respuesta en streaming de un iterable síncrono (cálculo o consultas bloqueantes) consumido por bloques en un hilo """
+    encode = json_encoder(current_app.json)
+    rows = iter(rows)
+
+    async def chunks():
+        separator = b"" if stream_format == "ndjson" else b"["
+        while True:
+            block = await asyncio.to_thread(lambda: list(itertools.islice(rows, block_size)))
+            if not block:
+                break
+            if stream_format == "ndjson":
+                yield b"".join(encode(row) + b"\n" for row in block)
+            else:
+                yield separator + b",".join(encode(row) for row in block)
+                separator = b","
+        if stream_format == "json":
+            yield b"[]" if separator == b"[" else b"]"
+
+    return Response(chunks(), mimetype=STREAM_FORMATS[stream_format])
+
+
+class AsyncRestaurantService(RestaurantService):
+    def __init__(self, mongo, async_mongo, index=None, tiles=None, geometry_store=None, stats=None):
+        super().__init__(mongo, index=index, tiles=tiles, geometry_store=geometry_store, stats=stats)
+        self.async_restaurants_collection = async_mongo.db['restaurants']
+        self.async_demographics_collection = async_mongo.db['demographic_info']
+        self.async_stats_collection = async_mongo.db[STATS_COLLECTION]
+
+    async def get_nearby_restaurants_async(self, lat, lon, filters=GeoFilters()):
+        if self._use_index():
+            nearby_restaurants = self._nearby_from_index(lat, lon, filters)
+        else:
+            nearby_restaurants = await self.async_restaurants_collection.find(
+                self._nearby_query(lat, lon, filters), self._nearby_projection(filters)
+            ).limit(filters.limit).to_list(None)
+        return [self._nearby_row(restaurant, filters.fields) for restaurant in nearby_restaurants]
+
+    async def get_restaurants_async(self, limit=None, after=None, stream_format="json"):
+        restaurants = self.async_restaurants_collection.find(keyset_query({}, after), RESTAURANT_LIST_PROJECTION)
+        if limit is not None or after is not None:
+            restaurants = restaurants.sort("_id", 1)
+        return await cursor_response_async(restaurants, self._restaurant_row, limit, stream_format)
+
+    async def get_neighbours_competitors_async(self, lat, lon, filters=GeoFilters()):
+        """ Estadísticas de competidores, o None si no hay restaurantes en el radio """
+        if (self.tiles is not None and self.tiles.loaded) or self._use_index():
+            return self._neighbours_competitors(lat, lon, filters)
+        result = await aggregate(self.async_restaurants_collection, self._competitors_pipeline(lat, lon, filters))
+        return self._competitors_from_facets(result)
+
+    async def get_price_categories_async(self):
+        if self._use_stats():
+            return (await stats_document(self.async_stats_collection, CITY_ID)).get("price_categories", [])
+        results = await aggregate(self.async_restaurants_collection, self._distinct_values_pipeline("Categoría Precio"))
+        return [result["_id"] for result in results]
+
+    async def get_cuisine_categories_async(self):
+        if self._use_stats():
+            return (await stats_document(self.async_stats_collection, CITY_ID)).get("cuisine_categories", [])
+        results = await aggregate(self.async_restaurants_collection, self._distinct_values_pipeline("Categoría Cocina"))
+        return [result["_id"] for result in results]
+
+    async def get_restaurant_count_by_neighborhood_async(self, neighborhood_name):
+        if self._use_stats():
+            return (await stats_document(self.async_stats_collection, neighborhood_name)).get("restaurant_count", 0)
+        return await self.async_restaurants_collection.count_documents({"Barrio": neighborhood_name})
+
+    async def get_restaurant_counts_for_neighborhoods_async(self):
+        reads = {}
+        if not (self.geometry_store is not None and self.geometry_store.loaded):
+            reads["neighborhoods"] = self.async_demographics_collection.find({}, {"_id": 0, "Nombre": 1, "Geometry": 1}).to_list(None)
+        if not self._use_index():
+            reads["points"] = self.async_restaurants_collection.find({}, {"_id": 0, "Geometry.coordinates": 1}).to_list(None)
+        # The reads that are needed run concurrently; the spatial join itself runs in a worker thread
+        results = dict(zip(reads, await asyncio.gather(*reads.values())))
+        neighborhoods = results.get("neighborhoods")
+        points = results.get("points")
+        if points is not None:
+            points = self._points_from_documents(points)
+        return await asyncio.to_thread(self.get_restaurant_counts_for_neighborhoods, neighborhoods, points)
+
+    async def get_top_5_cuisine_types_by_neighborhood_async(self, neighborhood_name):
+        if self._use_stats():
+            return top_cuisine_types_result(await stats_document(self.async_stats_collection, neighborhood_name), 5)
+        result = await aggregate(self.async_restaurants_collection, self._top_cuisine_types_pipeline(neighborhood_name, 5))
+        return [{"Tipo": entry["_id"], "count": entry["count"]} for entry in result]
+
+    async def get_restaurants_by_neighborhood_async(self, neighborhood_name):
+        return await self.async_restaurants_collection.find({"Barrio": neighborhood_name}).to_list(None)
+
+    async def get_price_categories_by_neighborhood_async(self, neighborhood_name):
+        if self._use_stats():
+            return price_categories_result(await stats_document(self.async_stats_collection, neighborhood_name))
+        result = await aggregate(self.async_restaurants_collection, self._price_categories_pipeline(neighborhood_name))
+        return {entry["_id"]: entry["count"] for entry in result}
+
+    async def get_neighborhood_profile_async(self, neighborhood_name):
+        if self._use_stats():
+            return restaurant_profile_result(await stats_document(self.async_stats_collection, neighborhood_name))
+        result = await aggregate(self.async_restaurants_collection, self._neighborhood_profile_pipeline(neighborhood_name))
+        return self._neighborhood_profile_result(result)
+
+
+class AsyncDemographicService(DemographicService):
+    def __init__(self, mongo, async_mongo, geometry_store=None):
+        super().__init__(mongo, geometry_store=geometry_store)
+        self.async_demographics_collection = async_mongo.db['demographic_info']
+
+    async def get_demographics_async(self, filters):
+        """ Lanza ValueError si algún filtro no es válido """
+        query = self._demographics_query(filters)
+        return await self.async_demographics_collection.find(query, DEMOGRAPHICS_PROJECTION).to_list(None)
+
+    async def get_neigborhoods_async(self, zoom=None):
+        if zoom is not None:
+            if self.geometry_store is not None and self.geometry_store.loaded:
+                return self._simplified_neighborhoods(zoom)
+            return await asyncio.to_thread(self._simplified_neighborhoods, zoom)
+        return await self.async_demographics_collection.find({}, {"_id": 0, "Nombre": 1, "Geometry": 1}).to_list(None)
+
+    async def get_neighborhood_by_name_async(self, barrio, zoom=None):
+        if self._by_name:
+            return self.get_neighborhood_by_name(barrio, zoom)
+        neighborhood = await self.async_demographics_collection.find_one(
+            {"NombreNormalizado": normalize_name(barrio)},
+            DEMOGRAPHICS_PROJECTION
+        )
+        if neighborhood:
+            neighborhood['Geometry'] = await asyncio.to_thread(self._wgs84_geometry, neighborhood)
+            neighborhood = self._response_copy(neighborhood, zoom)
+        return neighborhood
+
+    async def search_neighborhoods_async(self, query, limit=10):
+        if self._sorted_names:
+            return self.search_neighborhoods(query, limit)
+        # Lookup tables not warmed: the MongoDB fallback runs on the sync client in a worker thread
+        return await asyncio.to_thread(self.search_neighborhoods, query, limit)
+
+    async def get_neighborhoods_by_renta_async(self, renta):
+        return await self.async_demographics_collection.find(self._renta_range_query(renta), {"Nombre": 1, "Renta": 1}).to_list(None)
+
+    async def get_nearest_neighborhoods_by_renta_async(self, renta, k):
+        if self._renta_lookup[1]:
+            return self.get_nearest_neighborhoods_by_renta(renta, k)
+        return await asyncio.to_thread(self.get_nearest_neighborhoods_by_renta, renta, k)
+
+
+class AsyncEmptyLocalsService(EmptyLocalsService):
+    def __init__(self, mongo, async_mongo, snapshot=None, stats=None):
+        super().__init__(mongo, snapshot=snapshot, stats=stats)
+        self.async_empty_locals_collection = async_mongo.db['empty_locals']
+        self.async_stats_collection = async_mongo.db[STATS_COLLECTION]
+
+    async def get_empty_locals_async(self, limit=None, after=None, stream_format="json"):
+        if self._use_snapshot():
+            return self.snapshot.response(limit, after, stream_format, response_class=Response)
+        empty_locals = self.async_empty_locals_collection.find(keyset_query({}, after), EMPTY_LOCAL_LIST_PROJECTION)
+        if limit is not None or after is not None:
+            empty_locals = empty_locals.sort("_id", 1)
+        return await cursor_response_async(empty_locals, self._empty_local_row, limit, stream_format)
+
+    async def get_empty_locals_count_by_neighborhood_async(self):
+        if self._use_snapshot():
+            return self.snapshot.count_by_neighborhood()
+        if self._use_stats():
+            return (await stats_document(self.async_stats_collection, CITY_ID)).get("empty_locals_counts", [])
+        results = await aggregate(self.async_empty_locals_collection, self._count_by_neighborhood_pipeline())
+        return [{"Barrio": r["_id"], "count": r["count"]} for r in results]
+
+    async def get_average_price_by_neighborhood_async(self, neighborhood):
+        if self._use_snapshot():
+            return self.snapshot.average_price(neighborhood)
+        if self._use_stats():
+            return average_price_result(await stats_document(self.async_stats_collection, neighborhood))
+        result = await aggregate(self.async_empty_locals_collection, self._average_price_pipeline(neighborhood))
+        return result[0]["average_price"] if result else 0
+
+    async def get_average_price_by_neighborhoods_async(self):
+        if self._use_snapshot():
+            return self.snapshot.average_price_by_neighborhoods()
+        if self._use_stats():
+            return (await stats_document(self.async_stats_collection, CITY_ID)).get("average_prices", [])
+        results = await aggregate(self.async_empty_locals_collection, self._average_price_by_neighborhoods_pipeline())
+        return [{"Barrio": r["_id"], "average_price": r["average_price"]} for r in results]
+
+    async def get_neighborhood_profile_async(self, neighborhood):
+        if self._use_stats():
+            return empty_locals_profile_result(await stats_document(self.async_stats_collection, neighborhood))
+        result = await aggregate(self.async_empty_locals_collection, self._neighborhood_profile_pipeline(neighborhood))
+        return self._neighborhood_profile_result(result)
+
+    async def get_empty_locals_by_neighborhood_async(self, neighborhood_name):
+        return await self.async_empty_locals_collection.find({"Barrio": neighborhood_name}, EMPTY_LOCALS_PROJECTION).to_list(None)
+
+
+class AsyncTransportService(TransportService):
+    def __init__(self, mongo, async_mongo, proximity=None):
+        super().__init__(mongo, proximity=proximity)
+        self.async_transport_collection = async_mongo.db['transport']
+        self.async_proximity_collection = async_mongo.db[PROXIMITY_COLLECTION]
+
+    async def get_transport_data_async(self, limit=None, after=None, stream_format="json"):
+        transport_data = self.async_transport_collection.find(keyset_query({}, after))
+        if limit is not None or after is not None:
+            transport_data = transport_data.sort("_id", 1)
+        return await cursor_response_async(transport_data, self._transport_row, limit, stream_format)
+
+    async def get_proximity_async(self, lat, lon, radius=STOPS_RADIUS):
+        if self._use_proximity():
+            return self.proximity.nearest_stops(lat, lon, radius)
+        return proximity_result(await aggregate(self.async_transport_collection, self._proximity_pipeline(lat, lon, radius)), radius)
+
+    async def get_site_proximity_async(self, source, site_id):
+        return await self.async_proximity_collection.find_one({"_id": {"source": source, "id": site_id}}, {"_id": 0})
+
+
+class AsyncAssociationRules(AssociationRules):
+    def __init__(self, mongo, async_mongo):
+        super().__init__(mongo)
+        self.async_rules_collection = async_mongo.db['association_rules']
+
+    async def get_rules_async(self, query=RuleQuery(), neighborhood_cuisines=None):
+        if self.loaded:
+            return self.get_rules(query, neighborhood_cuisines)
+        rules = self.async_rules_collection.find(self.rules_filter(query, neighborhood_cuisines), {"_id": 0})
+        if query.sort is not None:
+            rules = rules.sort([(query.sort, -1), ("_id", 1)])
+        if query.limit is not None:
+            rules = rules.limit(query.limit)
+        return await rules.to_list(None)
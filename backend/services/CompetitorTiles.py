@@ -0,0 +1,153 @@
+import logging
+import math
+import numpy as np
+from services.RestaurantIndex import EARTH_RADIUS_METERS, haversine_distance
+from services.HistogramEngine import SUM_KEYS, HistogramEngine, decay_weights
+
+
+class CompetitorTiles:
+    """ Agregados parciales por celda (rejilla fina) para calcular las estadísticas de competidores por radio """
+
+    def __init__(self, tile_size=0.001):
+        self.tile_size = tile_size  # Degrees, ~110 m of latitude
+        self.loaded = False
+        self._tiles = None
+
+    def build(self, documents, lons, lats):
+        """ Precalcula los agregados por celda a partir de los restaurantes del RestaurantIndex """
+        engine = HistogramEngine(documents)
+        keys = np.stack([np.floor(lons / self.tile_size), np.floor(lats / self.tile_size)], axis=1).astype(np.int64)
+        if len(documents):
+            cell_keys, tile_of_point = np.unique(keys, axis=0, return_inverse=True)
+            tile_of_point = tile_of_point.ravel()
+        else:
+            cell_keys, tile_of_point = np.empty((0, 2), dtype=np.int64), np.empty(0, dtype=np.int64)
+        n_tiles = len(cell_keys)
+
+        tiles = {
+            "engine": engine,
+            "lons": lons,
+            "lats": lats,
+            "cell_keys": cell_keys,
+            "grid_origin": cell_keys.min(axis=0) if n_tiles else np.zeros(2, dtype=np.int64),
+            "grid": _dense_grid(cell_keys),
+            # total, cuisine_counts, price_counts, rating_counts... of each tile
+            **engine.group_counts(tile_of_point, np.arange(len(documents)), n_tiles),
+            "members": _members_by_tile(tile_of_point, n_tiles),
+            # Points sorted by longitude, to find the candidates of many sites at once (batch_stats)
+            "lon_order": np.argsort(lons, kind="stable"),
+        }
+        tiles["sorted_lons"] = lons[tiles["lon_order"]]
+        self._tiles = tiles
+        self.loaded = True
+        logging.info(f"Competitor tiles built: {n_tiles} tiles for {len(documents)} restaurants")
+
+    def competitor_stats(self, lat, lon, max_distance, cuisines=None, prices=None, min_rating=None, decay=None):
+        """
+        Estadísticas de competidores en el radio, con el mismo formato que get_neighbours_competitors; None si no hay.
+        cuisines, prices y min_rating filtran los restaurantes igual que la consulta de MongoDB; con decay (metros)
+        cada competidor pesa decay_weights(distancia, decay) en los histogramas.
+        """
+        tiles = self._tiles
+        engine = tiles["engine"]
+        inside, boundary = self._covering_tiles(tiles, lat, lon, max_distance)
+        mask = None
+        if cuisines is not None or prices is not None or min_rating is not None:
+            mask = engine.filter_mask(cuisines, prices, min_rating)
+        if mask is not None or decay is not None:
+            # The per-tile aggregates count every restaurant once, so the candidates are checked one by one
+            boundary = np.concatenate([inside, boundary])
+            inside = inside[:0]
+
+        # Exact pass only for the points of the boundary tiles
+        if len(boundary):
+            candidates = np.concatenate([tiles["members"][t] for t in boundary])
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            distances = haversine_distance(lat, lon, tiles["lats"][candidates], tiles["lons"][candidates])
+            within = distances <= max_distance
+            points, distances = candidates[within], distances[within]
+        else:
+            points, distances = np.empty(0, dtype=np.int64), np.empty(0)
+
+        weights = None if decay is None else decay_weights(distances, decay)
+        counts = engine.group_counts(np.zeros(len(points), dtype=np.int64), points, 1, weights)
+        if len(inside):
+            for key in SUM_KEYS:
+                counts[key] = counts[key] + tiles[key][inside].sum(axis=0)
+            counts["accessibility_min"] = np.minimum(counts["accessibility_min"], tiles["accessibility_min"][inside].min())
+            counts["accessibility_max"] = np.maximum(counts["accessibility_max"], tiles["accessibility_max"][inside].max())
+        return engine.stats(counts)
+
+    def batch_stats(self, lats, lons, max_distance, chunk_size=256):
+        """
+        Estadísticas de competidores de muchos puntos (formato de competitor_stats, None si no hay), en orden.
+        Los pares punto-restaurante de cada bloque de chunk_size puntos se evalúan en una sola pasada vectorizada,
+        así que los resultados de un bloque están disponibles antes de calcular el siguiente.
+        """
+        tiles = self._tiles
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        for start in range(0, len(lats), chunk_size):
+            yield from self._chunk_stats(tiles, lats[start:start + chunk_size], lons[start:start + chunk_size], max_distance)
+
+    def _chunk_stats(self, tiles, lats, lons, max_distance):
+        n_sites = len(lats)
+        # Candidate pairs: restaurants in the longitude band of each site, then latitude band, then exact distance
+        dlat = math.degrees(max_distance / EARTH_RADIUS_METERS)
+        dlon = dlat / np.cos(np.radians(np.minimum(np.abs(lats) + dlat, 89.9)))
+        low = np.searchsorted(tiles["sorted_lons"], lons - dlon, side="left")
+        counts = np.searchsorted(tiles["sorted_lons"], lons + dlon, side="right") - low
+        site = np.repeat(np.arange(n_sites), counts)
+        positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - low, counts)
+        point = tiles["lon_order"][positions]
+        close = np.abs(tiles["lats"][point] - lats[site]) <= dlat
+        site, point = site[close], point[close]
+        within = haversine_distance(lats[site], lons[site], tiles["lats"][point], tiles["lons"][point]) <= max_distance
+        site, point = site[within], point[within]
+
+        yield from tiles["engine"].batch_stats(site, point, n_sites)
+
+    def _covering_tiles(self, tiles, lat, lon, max_distance):
+        dlat = math.degrees(max_distance / EARTH_RADIUS_METERS)
+        dlon = dlat / math.cos(math.radians(min(abs(lat) + dlat, 89.9)))
+        origin_x, origin_y = tiles["grid_origin"]
+        grid = tiles["grid"]
+        min_x = max(math.floor((lon - dlon) / self.tile_size) - origin_x, 0)
+        max_x = min(math.floor((lon + dlon) / self.tile_size) - origin_x + 1, grid.shape[0])
+        min_y = max(math.floor((lat - dlat) / self.tile_size) - origin_y, 0)
+        max_y = min(math.floor((lat + dlat) / self.tile_size) - origin_y + 1, grid.shape[1])
+        present = grid[min_x:max_x, min_y:max_y].ravel() if min_x < max_x and min_y < max_y else np.empty(0, dtype=np.int64)
+        present = present[present >= 0]
+        if not len(present):
+            return present, present
+
+        west, south = (tiles["cell_keys"][present] * self.tile_size).T
+        east, north = west + self.tile_size, south + self.tile_size
+        corners = np.stack([
+            haversine_distance(lat, lon, south, west),
+            haversine_distance(lat, lon, south, east),
+            haversine_distance(lat, lon, north, west),
+            haversine_distance(lat, lon, north, east),
+        ])
+        inside = corners.max(axis=0) <= max_distance
+        # Tiles whose closest point is clearly out of range can be skipped (1 m margin for the spherical approximation)
+        nearest = haversine_distance(lat, lon, np.clip(lat, south, north), np.clip(lon, west, east))
+        boundary = ~inside & (nearest <= max_distance + 1.0)
+        return present[inside], present[boundary]
+
+
+def _dense_grid(cell_keys):
+    """ Matriz densa celda -> índice de tile (-1 si está vacía) sobre el rectángulo que cubre la ciudad """
+    if not len(cell_keys):
+        return np.full((0, 0), -1, dtype=np.int64)
+    offsets = cell_keys - cell_keys.min(axis=0)
+    grid = np.full(tuple(offsets.max(axis=0) + 1), -1, dtype=np.int64)
+    grid[offsets[:, 0], offsets[:, 1]] = np.arange(len(cell_keys))
+    return grid
+
+
+def _members_by_tile(tile_of_point, n_tiles):
+    order = np.argsort(tile_of_point, kind="stable")
+    bounds = np.cumsum(np.bincount(tile_of_point, minlength=n_tiles))
+    return np.split(order, bounds[:-1])
@@ -4,52 +4,198 @@ import logging
 from numpy import histogram
 import math
 from collections import Counter
-from pyproj import Proj, Transformer, transform
+import numpy as np
+import bisect
+import copy
+import threading
+import difflib
 import unidecode
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import PyMongoError
+from services.GeometryStore import reproject_coordinates
+from services.IndexManager import QueryCheck
+
+# Campos derivados que se materializan en demographic_info y no forman parte de las respuestas
+DEMOGRAPHICS_PROJECTION = {"_id": 0, "NombreNormalizado": 0, "RentaNum": 0}
 
 
-transformer = Transformer.from_crs("EPSG:32631", "EPSG:4326", always_xy=True)
 def normalize_name(name):
-    return unidecode.unidecode(name.lower()).strip()
+    # Sin acentos, en minúsculas y con los espacios colapsados
+    return " ".join(unidecode.unidecode(name.lower()).split())
+
+def parse_renta(renta):
+    """ Renta como float ('12345,6' -> 12345.6); None si no es numérica """
+    if isinstance(renta, bool):
+        return None
+    if isinstance(renta, (int, float)):
+        return float(renta)
+    if isinstance(renta, str):
+        try:
+            return float(renta.strip().replace(",", "."))
+        except ValueError:
+            return None
+    return None
+
+def parse_nearest_k(args):
+    """ k de la query string (None si no se indica); lanza ValueError si no es un entero positivo """
+    k = args.get("k")
+    if k is None:
+        return None
+    try:
+        k = int(k)
+    except ValueError:
+        raise ValueError("k must be a positive integer")
+    if k <= 0:
+        raise ValueError("k must be a positive integer")
+    return k
 
 def convert_utm_to_wgs84(coordinates):
     try:
-        # Verificar si las coordenadas son de tipo polígono o multipolígono
-        if isinstance(coordinates[0], list) and isinstance(coordinates[0][0], list):
-            # Multipolígono
-            logging.info("Converting multipolygon")
-            return [
-                [
-                    [
-                        transformer.transform(easting, northing)
-                        for easting, northing in ring
-                        if isinstance(easting, (int, float)) and isinstance(northing, (int, float))  # Verificar el formato
-                    ]
-                    for ring in polygon
-                ]
-                for polygon in coordinates
-            ]
-        elif isinstance(coordinates[0], list) and len(coordinates[0]) == 2:
-            # Polígono simple
-            logging.info(f"Converting polygon with coordinates: {coordinates}")
-            return [
-                transformer.transform(easting, northing)
-                for easting, northing in coordinates
-                if isinstance(easting, (int, float)) and isinstance(northing, (int, float))  # Verificar el formato
-            ]
+        # Polígono (lista de pares) o multipolígono (anidado); todos los vértices se transforman de una vez
+        if isinstance(coordinates, list) and coordinates and isinstance(coordinates[0], list):
+            return reproject_coordinates([coordinates])[0]
         else:
             # Si el formato no es válido, registrar el problema
-            logging.error(f"Invalid coordinate format detected: {coordinates}")
+            logging.error("Invalid coordinate format detected")
             return []  # Devolver una lista vacía en caso de formato inválido
     except Exception as e:
         logging.error(f"Error converting coordinates: {str(e)}")
         return []  
 
 class DemographicService:
-    def __init__(self, mongo):
+    # Índices que necesitan las consultas del servicio (los crea IndexManager)
+    INDEXES = {
+        "demographic_info": [
+            IndexModel([("NombreNormalizado", ASCENDING)], name="NombreNormalizado_1"),
+            IndexModel([("RentaNum", ASCENDING)], name="RentaNum_1"),
+        ]
+    }
+
+    def __init__(self, mongo, geometry_store=None):
         self.demographics_collection = mongo.db['demographic_info']
+        # Optional GeometryStore with the WGS84 polygons; without it they are reprojected per request
+        self.geometry_store = geometry_store
+        # NombreNormalizado -> documento, warmed at startup by warm_name_lookup()
+        self._by_name = {}
+        self._sorted_names = []
+        # (RentaNum sorted, neighborhoods in the same order) for the k-nearest by income lookup, swapped as a whole
+        self._renta_lookup = (np.empty(0), [])
+        self._watcher = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """ Registra callback(), llamado tras cada recarga de las tablas en memoria """
+        self._listeners.append(callback)
+
+    def ensure_normalized_names(self):
+        """ Materializa NombreNormalizado en los documentos que no lo tienen al día (lo llama indexes.py) """
+        operations = [
+            UpdateOne({"_id": n["_id"]}, {"$set": {"NombreNormalizado": normalize_name(n["Nombre"])}})
+            for n in self.demographics_collection.find({}, {"Nombre": 1, "NombreNormalizado": 1})
+            if isinstance(n.get("Nombre"), str) and n.get("NombreNormalizado") != normalize_name(n["Nombre"])
+        ]
+        if operations:
+            self.demographics_collection.bulk_write(operations, ordered=False)
+
+    def ensure_numeric_renta(self):
+        """ Materializa RentaNum (Renta como número) para las consultas por rango (lo llama indexes.py) """
+        operations = [
+            UpdateOne({"_id": n["_id"]}, {"$set": {"RentaNum": parse_renta(n.get("Renta"))}})
+            for n in self.demographics_collection.find({}, {"Renta": 1, "RentaNum": 1})
+            if "RentaNum" not in n or n["RentaNum"] != parse_renta(n.get("Renta"))
+        ]
+        if operations:
+            self.demographics_collection.bulk_write(operations, ordered=False)
+
+    def query_checks(self, sample):
+        """ Consultas del servicio que deben usar un índice (ver IndexManager.verify) """
+        return [
+            QueryCheck("neighborhood_by_name", "demographic_info", {"NombreNormalizado": normalize_name(sample["neighborhood"])}, None),
+            QueryCheck("similar_neighborhoods_by_renta", "demographic_info", self._renta_range_query(sample["renta"]), None),
+            QueryCheck("demographics_by_income", "demographic_info", self._demographics_query({"income": str(int(sample["renta"]))}), None),
+        ]
+
+    def warm_renta_lookup(self):
+        """ Array ordenado de rentas para buscar los k barrios más parecidos por búsqueda binaria """
+        barrios = list(self.demographics_collection.find(
+            {"RentaNum": {"$ne": None}}, {"Nombre": 1, "Renta": 1, "RentaNum": 1}
+        ).sort("RentaNum", 1))
+        self._renta_lookup = (np.array([b.pop("RentaNum") for b in barrios], dtype=float), barrios)
+
+    def warm_name_lookup(self):
+        """ Carga la tabla en memoria nombre normalizado -> barrio (con la geometría ya en WGS84) """
+        by_name = {}
+        for neighborhood in self.demographics_collection.find({}, DEMOGRAPHICS_PROJECTION):
+            if not isinstance(neighborhood.get("Nombre"), str):
+                continue
+            if neighborhood.get("Geometry", {}).get("coordinates"):
+                neighborhood["Geometry"] = self._wgs84_geometry(neighborhood)
+            by_name[normalize_name(neighborhood["Nombre"])] = neighborhood
+        self._by_name = by_name
+        self._sorted_names = sorted(by_name)
+        logging.info(f"Neighborhood name lookup warmed with {len(by_name)} neighborhoods")
+
+    def warm_lookups(self):
+        """
+        (Re)construye las tablas de nombres y de rentas. Solo lee: NombreNormalizado y RentaNum los escriben
+        ingest.py o indexes.py
+        """
+        self.warm_name_lookup()
+        self.warm_renta_lookup()
+        for callback in self._listeners:
+            callback()
+
+    def start(self, watch=True):
+        """ Calienta las tablas en memoria y arranca su recarga cuando cambia demographic_info """
+        try:
+            self.warm_lookups()
+        except PyMongoError as e:
+            logging.error(f"Could not warm neighborhood name lookup, falling back to MongoDB queries: {str(e)}")
+        if watch:
+            self.start_watching()
+
+    def start_watching(self):
+        # Threads do not survive fork(): a preloaded worker sees the parent's Thread object but not the thread
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch_changes, name="demographic-lookup-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch_changes(self):
+        # Database-level stream, so replacing the whole collection (drop or rename) does not invalidate it
+        pipeline = [{"$match": {"$or": [{"ns.coll": "demographic_info"}, {"to.coll": "demographic_info"}]}}]
+        try:
+            with self.demographics_collection.database.watch(pipeline, max_await_time_ms=1000) as stream:
+                pending = False
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        pending = True  # Drain the burst before reloading once
+                        continue
+                    if pending:
+                        self.warm_lookups()
+                        pending = False
+        except PyMongoError as e:
+            logging.warning(f"demographic_info change stream unavailable, automatic refresh disabled: {str(e)}")
+
+    def _wgs84_geometry(self, neighborhood):
+        if self.geometry_store is not None and self.geometry_store.loaded:
+            geometry = self.geometry_store.get(neighborhood.get('Nombre'))
+            if geometry is not None:
+                return geometry
+        geometry = dict(neighborhood['Geometry'])
+        geometry['coordinates'] = convert_utm_to_wgs84(geometry['coordinates'])
+        return geometry
 
     def get_demographics(self, filters):
+        try:
+            query = self._demographics_query(filters)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        demographics = list(self.demographics_collection.find(query, DEMOGRAPHICS_PROJECTION))
+        return jsonify(demographics)
+
+    def _demographics_query(self, filters):
+        """ Consulta de demographic_info para los filtros; lanza ValueError si alguno no es válido """
         age_range = filters.get('age_range', 'all')
         income = filters.get('income', 'all')
         household_size = filters.get('household_size', 'all')
@@ -59,21 +205,23 @@ class DemographicService:
                 min_age, max_age = map(int, age_range.split('-'))
                 query['Distribución edad'] = {'$gte': min_age, '$lte': max_age}
             except ValueError:
-                return jsonify({"error": "Rango de edad inválido"}), 400
+                raise ValueError("Rango de edad inválido")
         if income != 'all':
             try:
-                query['Renta'] = {'$gte': int(income)}
+                query['RentaNum'] = {'$gte': int(income)}
             except ValueError:
-                return jsonify({"error": "Ingreso inválido"}), 400
+                raise ValueError("Ingreso inválido")
         if household_size != 'all':
             query['Distribución habitación por casas'] = household_size
-        demographics = list(self.demographics_collection.find(query, {'_id': 0}))
-        return jsonify(demographics)
+        return query
     
     
         
-    def get_neigborhoods(self):
+    def get_neigborhoods(self, zoom=None):
+        """ Barrios con su Geometry en UTM; con zoom, en WGS84 y simplificada para ese nivel de zoom """
         try:
+            if zoom is not None:
+                return self._simplified_neighborhoods(zoom)
             barrios = self.demographics_collection.find({}, {"_id": 0, "Nombre": 1, "Geometry": 1})
             return list(barrios)
         except Exception as e:
@@ -83,25 +231,27 @@ class DemographicService:
 
     
         
+    def _simplified_neighborhoods(self, zoom):
+        if self.geometry_store is not None and self.geometry_store.loaded:
+            return [{"Nombre": nombre, "Geometry": geometry} for nombre, geometry in self.geometry_store.items(zoom)]
+        # Without the store there are no simplified variants: full geometries reprojected per request
+        barrios = list(self.demographics_collection.find({}, {"_id": 0, "Nombre": 1, "Geometry": 1}))
+        for barrio in barrios:
+            barrio['Geometry'] = self._wgs84_geometry(barrio)
+        return barrios
+
     def get_neighborhoods_idealista(self):
         try:
             barrios = self.demographics_collection.find({}, {"_id": 0, "Nombre": 1, "Geometry": 1})
             neighborhoods = list(barrios)
 
-            # Convertir las coordenadas de UTM a WGS84 antes de devolver los resultados
+            # Geometrías en WGS84 (desde la caché de GeometryStore si está cargada)
             for barrio in neighborhoods:
-                logging.info(f"Processing neighborhood: {barrio['Nombre']}")
-                logging.info(f"Coordinates before conversion: {barrio['Geometry']['coordinates']}")
-                
-                # Intentar la conversión
-                converted_coords = convert_utm_to_wgs84(barrio['Geometry']['coordinates'])
-                
-                if not converted_coords:
+                geometry = self._wgs84_geometry(barrio)
+                if not geometry['coordinates']:
                     logging.error(f"Failed to convert coordinates for neighborhood: {barrio['Nombre']}")
                     continue  # Saltar este barrio si la conversión falla
-                
-                barrio['Geometry']['coordinates'] = converted_coords
-                logging.info(f"Coordinates after conversion: {barrio['Geometry']['coordinates']}")
+                barrio['Geometry'] = geometry
             
             # Verificar que los datos son serializables a JSON antes de devolver
             if isinstance(neighborhoods, list):
@@ -114,50 +264,100 @@ class DemographicService:
             logging.error(f"Error fetching neighborhoods: {str(e)}")
             return jsonify({'error': str(e)}), 500
         
-    def get_neighborhood_by_name(self, barrio):
+    def get_neighborhood_by_name(self, barrio, zoom=None):
         try:
             #Normalize the neighborhood name
             normalized_barrio = normalize_name(barrio)
-            
-            # query to match the normalized neighborhood name
+
+            if self._by_name:
+                neighborhood = self._by_name.get(normalized_barrio)
+                return self._response_copy(neighborhood, zoom) if neighborhood else None
+
+            # Indexed lookup on the materialized normalized name
             neighborhood = self.demographics_collection.find_one(
-                {
-                    "$expr": {
-                        "$eq": [
-                            { "$trim": { "input": { "$toLower": "$Nombre" }}},  # Trim and lowercase the field in MongoDB
-                            normalized_barrio  # Compare to normalized neighborhood name
-                        ]
-                    }
-                },
-                {"_id": 0}  # Exclude _id from the results
+                {"NombreNormalizado": normalized_barrio},
+                DEMOGRAPHICS_PROJECTION
             )
             
             # Ifneighborhood is found, convert the coordinates and return the data
             if neighborhood:
-                neighborhood['Geometry']['coordinates'] = convert_utm_to_wgs84(neighborhood['Geometry']['coordinates'])
-                return neighborhood
+                neighborhood['Geometry'] = self._wgs84_geometry(neighborhood)
+                return self._response_copy(neighborhood, zoom)
             else:
                 return None
         
         except Exception as e:
             logging.error(f"Error fetching neighborhood: {str(e)}")
             raise e
-        
+
+    def _response_copy(self, neighborhood, zoom):
+        # Deep copy: the geometry is shared with the lookup table and the GeometryStore cache
+        return copy.deepcopy(self._with_zoom(dict(neighborhood), zoom))
+
+    def _with_zoom(self, neighborhood, zoom):
+        """ Sustituye la Geometry por su variante simplificada para el zoom, si está precalculada """
+        if zoom is not None and self.geometry_store is not None and self.geometry_store.loaded:
+            geometry = self.geometry_store.get(neighborhood.get('Nombre'), zoom)
+            if geometry is not None:
+                neighborhood['Geometry'] = geometry
+        return neighborhood
+
+    def search_neighborhoods(self, query, limit=10):
+        """ Autocompletado por prefijo (del nombre o de una de sus palabras), con búsqueda aproximada si no hay coincidencias """
+        prefix = normalize_name(query)
+        if not prefix:
+            return []
+        names = self._sorted_names
+        if not names:
+            names = sorted(
+                n["NombreNormalizado"] for n in self.demographics_collection.find({}, {"_id": 0, "NombreNormalizado": 1})
+                if n.get("NombreNormalizado")
+            )
+        start = bisect.bisect_left(names, prefix)
+        matches = []
+        for name in names[start:]:
+            if not name.startswith(prefix) or len(matches) >= limit:
+                break
+            matches.append(name)
+        if len(matches) < limit:
+            matches += [
+                name for name in names
+                if name not in matches and any(word.startswith(prefix) for word in name.split()[1:])
+            ][:limit - len(matches)]
+        if not matches:
+            matches = difflib.get_close_matches(prefix, names, n=limit, cutoff=0.6)
+        if self._by_name:
+            return [self._by_name[name]["Nombre"] for name in matches]
+        nombres = {
+            n["NombreNormalizado"]: n["Nombre"]
+            for n in self.demographics_collection.find({"NombreNormalizado": {"$in": matches}}, {"_id": 0, "Nombre": 1, "NombreNormalizado": 1})
+        }
+        return [nombres[name] for name in matches if name in nombres]
+
     def get_neighborhoods_by_renta_service(self, renta):
-        barrios_similares = self.demographics_collection.find({
-            "$expr": {
-                "$and": [
-                    {"$gte": [{"$toDouble": {"$replaceAll": {"input": "$Renta", "find": ",", "replacement": "."}}}, renta * 0.95]},
-                    {"$lte": [{"$toDouble": {"$replaceAll": {"input": "$Renta", "find": ",", "replacement": "."}}}, renta * 1.05]}
-                ]
-            }
-        }, {"Nombre": 1, "Renta": 1})
-
-        # Convert the cursor into a list and convert ObjectId to string
-        barrios_similares_list = []
-        for barrio in barrios_similares:
-            barrio["_id"] = str(barrio["_id"])  # Convert ObjectId to string
-            barrios_similares_list.append(barrio)
-
-        return barrios_similares_list
+        # Indexed range query on the numeric income field
+        barrios_similares = self.demographics_collection.find(self._renta_range_query(renta), {"Nombre": 1, "Renta": 1})
+
+        # ObjectId is serialized by the app's JSON provider
+        return list(barrios_similares)
 
+    def _renta_range_query(self, renta):
+        return {"RentaNum": {"$gte": renta * 0.95, "$lte": renta * 1.05}}
+
+    def get_nearest_neighborhoods_by_renta(self, renta, k):
+        """ Los k barrios con la renta más cercana, sin umbral, ordenados por cercanía """
+        if not self._renta_lookup[1]:
+            self.warm_renta_lookup()
+        rentas, barrios = self._renta_lookup
+        # Expand from the insertion point towards whichever side is closer
+        right = int(np.searchsorted(rentas, renta))
+        left = right - 1
+        nearest = []
+        while len(nearest) < k and (left >= 0 or right < len(rentas)):
+            if right >= len(rentas) or (left >= 0 and renta - rentas[left] <= rentas[right] - renta):
+                nearest.append(left)
+                left -= 1
+            else:
+                nearest.append(right)
+                right += 1
+        return [dict(barrios[i]) for i in nearest]
@@ -1,66 +1,110 @@
-from flask import jsonify
-import re
 import logging
-from numpy import histogram
 import math
-from collections import Counter
+from services.Pagination import cursor_response, keyset_query
+from services.IndexManager import QueryCheck
+from services.NeighborhoodStats import average_price_result, empty_locals_profile_result
+from services.EmptyLocalsSnapshot import clean_price_text, parse_prices
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+EMPTY_LOCAL_LIST_PROJECTION = {
+    'Título': 1,
+    'Dirección completa': 1,
+    'Precio total (€)': 1,
+    'Superficie (m2)': 1,
+    'Precio (€/m2)': 1,
+    'Barrio': 1,
+    'Geometry.coordinates': 1,
+    'Accesibilidad': 1,
+}
+# Campos derivados que se materializan en empty_locals y no forman parte de las respuestas
+EMPTY_LOCALS_PROJECTION = {"PrecioNum": 0}
 
 class EmptyLocalsService:
-    def __init__(self, mongo):
+    # Índices que necesitan las consultas del servicio (los crea IndexManager)
+    INDEXES = {
+        "empty_locals": [IndexModel([("Barrio", ASCENDING)], name="Barrio_1")]
+    }
+
+    def __init__(self, mongo, snapshot=None, stats=None):
         self.empty_locals_collection = mongo.db['empty_locals']
         self.demographics_collection = mongo.db['demographic_info']
+        # Optional EmptyLocalsSnapshot, cleaned and serialized once; MongoDB is queried until it is loaded
+        self.snapshot = snapshot
+        # Optional NeighborhoodStats with the per-neighborhood rollups of the raw collection
+        self.stats = stats
+
+    def ensure_numeric_prices(self):
+        """
+        Materializa PrecioNum (Precio total (€) leído con parse_prices, como en EmptyLocalsSnapshot) para que los
+        precios medios de las agregaciones coincidan con los de la copia en memoria
+        """
+        locals = list(self.empty_locals_collection.find({}, {"Precio total (€)": 1, "PrecioNum": 1}))
+        prices = parse_prices([local.get("Precio total (€)") for local in locals]).tolist()
+        operations = []
+        for local, price in zip(locals, prices):
+            price = None if math.isnan(price) else price
+            if "PrecioNum" not in local or local["PrecioNum"] != price:
+                operations.append(UpdateOne({"_id": local["_id"]}, {"$set": {"PrecioNum": price}}))
+        if operations:
+            self.empty_locals_collection.bulk_write(operations, ordered=False)
+
+    def _use_snapshot(self):
+        return self.snapshot is not None and self.snapshot.loaded
+
+    def _use_stats(self):
+        return self.stats is not None and self.stats.loaded
+
+    def query_checks(self, sample):
+        """ Consultas del servicio que deben usar un índice (ver IndexManager.verify) """
+        barrio = sample["neighborhood"]
+        return [
+            QueryCheck("empty_locals_by_neighborhood", "empty_locals", {"Barrio": barrio}, None),
+            QueryCheck("empty_locals_average_price", "empty_locals", None, self._average_price_pipeline(barrio)),
+            QueryCheck("empty_locals_neighborhood_profile", "empty_locals", None, self._neighborhood_profile_pipeline(barrio)),
+        ]
+
+    def get_empty_locals(self, limit=None, after=None, stream_format="json"):
+        if self._use_snapshot():
+            return self.snapshot.response(limit, after, stream_format)
+        empty_locals = self.empty_locals_collection.find(keyset_query({}, after), EMPTY_LOCAL_LIST_PROJECTION)
+        if limit is not None or after is not None:
+            empty_locals = empty_locals.sort("_id", 1)
+        return cursor_response(empty_locals, self._empty_local_row, limit, stream_format)
+
+    def _empty_local_row(self, local):
+        direccion = local.get("Dirección completa")
+        coordenadas = local.get("Geometry", {}).get("coordinates", [])
+        titulo = local.get("Título")
+        precio_total = local.get("Precio total (€)")
+        superficie = local.get("Superficie (m2)")
+        precio_por_m2 = local.get("Precio (€/m2)")
+        barrio = local.get("Barrio")
+        accesibilidad = local.get("Accesibilidad")
 
-    def get_empty_locals(self):
-        empty_locals = self.empty_locals_collection.find({}, {
-            '_id': 0,
-            'Título': 1,
-            'Dirección completa': 1,
-            'Precio total (€)': 1,
-            'Superficie (m2)': 1,
-            'Precio (€/m2)': 1,
-            'Barrio': 1,
-            'Geometry.coordinates': 1,
-            'Accesibilidad': 1,
-        })
-        locals_list = []
-        for local in empty_locals:
-            direccion = local.get("Dirección completa")
-            coordenadas = local.get("Geometry", {}).get("coordinates", [])
-            titulo = local.get("Título")
-            precio_total = local.get("Precio total (€)")
-            superficie = local.get("Superficie (m2)")
-            precio_por_m2 = local.get("Precio (€/m2)")
-            barrio = local.get("Barrio")
-            accesibilidad = local.get("Accesibilidad")
-            
-            # Ensure direccion is a string before performing any string operations
-            if not direccion or not isinstance(direccion, str) or direccion.strip() == "" or not coordenadas or len(coordenadas) != 2 or not titulo:
-                continue
-            
-            precio_num = self.preprocess_price(precio_total)
-            if precio_num is None or not barrio:
-                continue
-            
-            locals_list.append({
-                "Título": titulo,
-                "Dirección completa": direccion,
-                "Precio total (€)": precio_num,
-                "Superficie (m2)": superficie,
-                "Precio (€/m2)": precio_por_m2,
-                "Barrio": barrio,
-                "Coordinates": coordenadas,
-                "Accesibilidad": accesibilidad
-            })
-        
-        logging.info(f"Total de locales válidos: {len(locals_list)}")
-        return jsonify(locals_list)
+        # Ensure direccion is a string before performing any string operations
+        if not direccion or not isinstance(direccion, str) or direccion.strip() == "" or not coordenadas or len(coordenadas) != 2 or not titulo:
+            return None
+
+        precio_num = self.preprocess_price(precio_total)
+        if precio_num is None or not barrio:
+            return None
+
+        return {
+            "Título": titulo,
+            "Dirección completa": direccion,
+            "Precio total (€)": precio_num,
+            "Superficie (m2)": superficie,
+            "Precio (€/m2)": precio_por_m2,
+            "Barrio": barrio,
+            "Coordinates": coordenadas,
+            "Accesibilidad": accesibilidad
+        }
 
 
     def preprocess_price(self, precio):
         if isinstance(precio, str):
-            precio_clean = re.sub(r'[^\d.,]', '', precio)
             try:
-                return float(precio_clean.replace(',', '.'))
+                return float(clean_price_text(precio))
             except ValueError:
                 logging.warning(f"Precio no válido: {precio}")
                 return None
@@ -69,7 +113,15 @@ class EmptyLocalsService:
         return None
     
     def get_empty_locals_count_by_neighborhood(self):
-        pipeline = [
+        if self._use_snapshot():
+            return self.snapshot.count_by_neighborhood()
+        if self._use_stats():
+            return self.stats.city().get("empty_locals_counts", [])
+        results = self.empty_locals_collection.aggregate(self._count_by_neighborhood_pipeline())
+        return [{"Barrio": r["_id"], "count": r["count"]} for r in results]
+
+    def _count_by_neighborhood_pipeline(self):
+        return [
             {
                 "$group": {
                     "_id": "$Barrio",
@@ -80,52 +132,97 @@ class EmptyLocalsService:
                 "$sort": {"count": -1}
             }
         ]
-        results = self.empty_locals_collection.aggregate(pipeline)
-        return [{"Barrio": r["_id"], "count": r["count"]} for r in results]
     
     def get_average_price_by_neighborhood(self, neighborhood):
-        pipeline = [
+        if self._use_snapshot():
+            return self.snapshot.average_price(neighborhood)
+        if self._use_stats():
+            return average_price_result(self.stats.neighborhood(neighborhood))
+        result = list(self.empty_locals_collection.aggregate(self._average_price_pipeline(neighborhood)))
+        if result:
+            return result[0]["average_price"]
+        return 0
+
+    def _average_price_pipeline(self, neighborhood):
+        return [
             {"$match": {"Barrio": neighborhood}},
             {
                 "$group": {
                     "_id": None,
-                    "average_price": {"$avg": "$Precio total (€)"}
+                    "average_price": {"$avg": "$PrecioNum"}
                 }
             }
         ]
-        result = list(self.empty_locals_collection.aggregate(pipeline))
-        if result:
-            return result[0]["average_price"]
-        return 0
     
+    def get_neighborhood_profile(self, neighborhood):
+        """ Número de locales vacíos y precio medio del barrio en una sola agregación """
+        if self._use_stats():
+            return empty_locals_profile_result(self.stats.neighborhood(neighborhood))
+        result = list(self.empty_locals_collection.aggregate(self._neighborhood_profile_pipeline(neighborhood)))
+        return self._neighborhood_profile_result(result)
+
+    def _neighborhood_profile_pipeline(self, neighborhood):
+        return [
+            {"$match": {"Barrio": neighborhood}},
+            {
+                "$facet": {
+                    "count": [{"$count": "count"}],
+                    "average_price": [{"$group": {"_id": None, "average_price": {"$avg": "$PrecioNum"}}}]
+                }
+            }
+        ]
+
+    def _neighborhood_profile_result(self, result):
+        facets = result[0] if result else {}
+        count = facets.get("count", [])
+        average_price = facets.get("average_price", [])
+        return {
+            "count": count[0]["count"] if count else 0,
+            "average_price": average_price[0]["average_price"] if average_price else 0
+        }
+
     def get_average_price_by_neighborhoods(self):
-        pipeline = [
+        if self._use_snapshot():
+            return self.snapshot.average_price_by_neighborhoods()
+        if self._use_stats():
+            return self.stats.city().get("average_prices", [])
+        results = self.empty_locals_collection.aggregate(self._average_price_by_neighborhoods_pipeline())
+        return [{"Barrio": r["_id"], "average_price": r["average_price"]} for r in results]
+
+    def _average_price_by_neighborhoods_pipeline(self):
+        return [
             {
                 "$group": {
                     "_id": "$Barrio",
-                    "average_price": {"$avg": "$Precio total (€)"}
+                    "average_price": {"$avg": "$PrecioNum"}
                 }
             },
             {
                 "$sort": {"average_price": -1}
             }
         ]
-        results = self.empty_locals_collection.aggregate(pipeline)
-        return [{"Barrio": r["_id"], "average_price": r["average_price"]} for r in results]
     
 
 
     def get_empty_locals_by_neighborhood(self, neighborhood_name):
         try:
-            locals = self.empty_locals_collection.find({"Barrio": neighborhood_name})
-            local_list = []
-            for local in locals:
-                # Convert ObjectId to string for JSON serialization
-                local['_id'] = str(local['_id'])
-                local_list.append(local)
-            return local_list
+            # ObjectId is serialized by the app's JSON provider
+            return list(self.empty_locals_collection.find({"Barrio": neighborhood_name}, EMPTY_LOCALS_PROJECTION))
         except Exception as e:
             logging.error(f"Error fetching locals: {str(e)}")
             raise
-    
-    
\ No newline at end of file
+
+    def get_locations_by_neighborhood(self, neighborhood_name):
+        """ {"id", "lat", "lon"} de los locales válidos del barrio (los mismos que lista get_empty_locals) """
+        if self._use_snapshot():
+            columns = self.snapshot.columns()
+            rows = (columns["barrios"] == neighborhood_name).nonzero()[0]
+            return [
+                {"id": str(columns["ids"][i]), "lat": float(columns["lats"][i]), "lon": float(columns["lons"][i])}
+                for i in rows.tolist()
+            ]
+        locals = self.empty_locals_collection.find({"Barrio": neighborhood_name}, EMPTY_LOCAL_LIST_PROJECTION).sort("_id", 1)
+        return [
+            {"id": str(local["_id"]), "lat": local["Geometry"]["coordinates"][1], "lon": local["Geometry"]["coordinates"][0]}
+            for local in locals if self._empty_local_row(local) is not None
+        ]
@@ -0,0 +1,180 @@
+import json
+import logging
+import re
+import numpy as np
+from flask import Response
+from pymongo.errors import PyMongoError
+
+SNAPSHOT_PROJECTION = {
+    'Título': 1,
+    'Dirección completa': 1,
+    'Precio total (€)': 1,
+    'Superficie (m2)': 1,
+    'Precio (€/m2)': 1,
+    'Barrio': 1,
+    'Geometry.coordinates': 1,
+    'Accesibilidad': 1,
+}
+# Spanish number format: a '.' followed by exactly three digits separates thousands and ',' is the decimal mark
+THOUSANDS_SEPARATOR = re.compile(r"\.(?=\d{3}(?!\d))")
+
+
+def clean_price_text(text):
+    """ Texto de un precio con solo dígitos y punto decimal ('1.200,50 €' -> '1200.50') """
+    return THOUSANDS_SEPARATOR.sub("", re.sub(r'[^\d.,]', '', text)).replace(",", ".")
+
+
+def parse_prices(values):
+    """
+    Versión vectorizada de EmptyLocalsService.preprocess_price: los números se mantienen y los textos
+    se limpian ('1.200 €' -> 1200.0, '1.200,50 €' -> 1200.5); devuelve un array float con NaN donde
+    el precio no es válido.
+    """
+    parsed = np.full(len(values), np.nan)
+    is_number = np.array([isinstance(v, (int, float)) for v in values], dtype=bool)
+    is_text = np.array([isinstance(v, str) for v in values], dtype=bool)
+    if is_number.any():
+        parsed[is_number] = np.array([v for v, ok in zip(values, is_number) if ok], dtype=float)
+    if is_text.any():
+        texts = np.array([v for v, ok in zip(values, is_text) if ok], dtype=str)
+        # Same as re.sub(r'[^\d.,]', '', price): delete every character that is not a digit, '.' or ','
+        unwanted = {c for c in set("".join(texts.tolist())) if not (c.isdecimal() or c in ".,")}
+        cleaned = np.char.translate(texts, {ord(c): None for c in unwanted})
+        cleaned = np.array([THOUSANDS_SEPARATOR.sub("", text) for text in cleaned.tolist()], dtype=str)
+        cleaned = np.char.replace(cleaned, ",", ".")
+        dots = np.char.count(cleaned, ".")
+        valid = (dots <= 1) & (np.char.str_len(cleaned) > dots)
+        text_prices = np.full(len(texts), np.nan)
+        text_prices[valid] = cleaned[valid].astype(float)
+        parsed[is_text] = text_prices
+    return parsed
+
+
+class EmptyLocalsSnapshot:
+    """ Copia columnar de empty_locals, validada y serializada una sola vez al cargarla """
+
+    def __init__(self, mongo, encode=None):
+        self.empty_locals_collection = mongo.db['empty_locals']
+        # obj -> bytes; normally the app's JSON provider (see Pagination.json_encoder)
+        self.encode = encode or (lambda obj: json.dumps(obj).encode("utf-8"))
+        self.loaded = False
+        self._columns = {}
+
+    def load(self):
+        documents = list(self.empty_locals_collection.find({}, SNAPSHOT_PROJECTION).sort("_id", 1))
+        ids = np.array([str(d["_id"]) for d in documents], dtype=str)
+        titles = [d.get("Título") for d in documents]
+        addresses = [d.get("Dirección completa") for d in documents]
+        raw_prices = [d.get("Precio total (€)") for d in documents]
+        surfaces = [d.get("Superficie (m2)") for d in documents]
+        prices_m2 = [d.get("Precio (€/m2)") for d in documents]
+        barrios = [d.get("Barrio") for d in documents]
+        accessibility = [d.get("Accesibilidad") for d in documents]
+        coordinates = [d.get("Geometry", {}).get("coordinates", []) for d in documents]
+        del documents
+
+        prices = parse_prices(raw_prices)
+        has_coordinates = np.array([isinstance(c, list) and len(c) == 2 for c in coordinates], dtype=bool)
+        coords = np.full((len(coordinates), 2), np.nan)
+        if has_coordinates.any():
+            coords[has_coordinates] = np.array([c for c, ok in zip(coordinates, has_coordinates) if ok], dtype=float)
+        address_text = np.array([a if isinstance(a, str) else "" for a in addresses], dtype=str)
+
+        # Same filters as EmptyLocalsService._empty_local_row, evaluated on whole columns
+        valid = (
+            (np.char.str_len(np.char.strip(address_text)) > 0)
+            & has_coordinates
+            & np.array([bool(t) for t in titles], dtype=bool)
+            & np.array([bool(b) for b in barrios], dtype=bool)
+            & ~np.isnan(prices)
+        )
+        rows = np.flatnonzero(valid)
+        row_bytes = [
+            self.encode({
+                "Título": titles[i],
+                "Dirección completa": addresses[i],
+                "Precio total (€)": raw_prices[i] if isinstance(raw_prices[i], (int, float)) else float(prices[i]),
+                "Superficie (m2)": surfaces[i],
+                "Precio (€/m2)": prices_m2[i],
+                "Barrio": barrios[i],
+                "Coordinates": coordinates[i],
+                "Accesibilidad": accessibility[i]
+            })
+            for i in rows.tolist()
+        ]
+
+        # Per-neighborhood rollups over every document, like the $group pipelines
+        barrio_names = sorted({b for b in barrios if b is not None}) + ([None] if None in barrios else [])
+        barrio_codes = {b: i for i, b in enumerate(barrio_names)}
+        codes = np.array([barrio_codes[b] for b in barrios], dtype=np.int64)
+        has_price = ~np.isnan(prices)
+        counts = np.bincount(codes, minlength=len(barrio_names))
+        price_counts = np.bincount(codes[has_price], minlength=len(barrio_names))
+        price_sums = np.bincount(codes[has_price], weights=prices[has_price], minlength=len(barrio_names))
+        averages = {
+            b: (float(price_sums[i] / price_counts[i]) if price_counts[i] else None)
+            for i, b in enumerate(barrio_names)
+        }
+
+        self._columns = {
+            "ids": ids[rows],
+            "prices": prices[rows],
+            "surfaces": parse_prices(surfaces)[rows],
+            "prices_m2": parse_prices(prices_m2)[rows],
+            "lons": coords[rows, 0],
+            "lats": coords[rows, 1],
+            "barrios": np.array([barrios[i] for i in rows.tolist()], dtype=object),
+            "row_bytes": row_bytes,
+            "json_body": b"[" + b",".join(row_bytes) + b"]",
+            "counts": sorted(
+                ({"Barrio": b, "count": int(counts[i])} for i, b in enumerate(barrio_names)),
+                key=lambda r: -r["count"]
+            ),
+            "averages": averages,
+        }
+        self.loaded = True
+        logging.info(f"Empty locals snapshot loaded: {len(rows)} valid of {len(ids)} locals")
+
+    def start(self):
+        try:
+            self.load()
+        except PyMongoError as e:
+            logging.error(f"Could not load empty locals snapshot, falling back to MongoDB queries: {str(e)}")
+
+    def columns(self):
+        """ Arrays de los locales válidos: ids, prices, surfaces, prices_m2, lons, lats, barrios """
+        return self._columns
+
+    def response(self, limit=None, after=None, stream_format="json", response_class=Response):
+        body, mimetype, next_cursor = self.page(limit, after, stream_format)
+        response = response_class(body, mimetype=mimetype)
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+
+    def page(self, limit=None, after=None, stream_format="json"):
+        """ (cuerpo, mimetype, cursor de la siguiente página o None) """
+        columns = self._columns
+        if limit is None and after is None and stream_format == "json":
+            return columns["json_body"], "application/json", None
+
+        start = 0 if after is None else int(np.searchsorted(columns["ids"], str(after), side="right"))
+        end = len(columns["row_bytes"]) if limit is None else min(start + limit, len(columns["row_bytes"]))
+        rows = columns["row_bytes"][start:end]
+        if stream_format == "ndjson":
+            body, mimetype = b"\n".join(rows) + (b"\n" if rows else b""), "application/x-ndjson"
+        else:
+            body, mimetype = b"[" + b",".join(rows) + b"]", "application/json"
+        next_cursor = str(columns["ids"][end - 1]) if limit is not None and end < len(columns["row_bytes"]) else None
+        return body, mimetype, next_cursor
+
+    def count_by_neighborhood(self):
+        return [dict(row) for row in self._columns["counts"]]
+
+    def average_price(self, neighborhood):
+        return self._columns["averages"].get(neighborhood, 0)
+
+    def average_price_by_neighborhoods(self):
+        averages = self._columns["averages"]
+        rows = sorted(averages.items(), key=lambda item: (item[1] is None, -(item[1] or 0)))
+        return [{"Barrio": barrio, "average_price": average} for barrio, average in rows]
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import logging
+import math
+import numbers
+import numpy as np
+import shapely
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+from shapely.errors import GEOSException
+from shapely.geometry import shape
+from pyproj import Transformer
+
+transformer = Transformer.from_crs("EPSG:32631", "EPSG:4326", always_xy=True)
+
+# Zooms con variante simplificada precalculada; por encima del último se sirve la geometría completa
+SIMPLIFIED_ZOOMS = (10, 12, 14)
+MAX_ZOOM = 22
+BARCELONA_LATITUDE = 41.39
+
+
+def pixel_size_meters(zoom, latitude=BARCELONA_LATITUDE):
+    """ Metros que cubre un píxel de una tesela de 256 px en Web Mercator """
+    return 156543.03392 * math.cos(math.radians(latitude)) / 2 ** zoom
+
+
+def coordinate_decimals(zoom):
+    """ Decimales de lon/lat suficientes para no mover ningún vértice más de un píxel """
+    return max(0, math.ceil(-math.log10(360.0 / (256 * 2 ** zoom))))
+
+
+def parse_zoom(args):
+    """ Parámetro zoom de la petición como int (None si no viene); lanza ValueError si no es válido """
+    zoom = args.get("zoom")
+    if zoom is None:
+        return None
+    try:
+        zoom = int(zoom)
+    except ValueError:
+        raise ValueError("Invalid zoom")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+    return zoom
+
+
+def utm_to_wgs84_array(coords):
+    """ Reproyecta un array (N, 2) de coordenadas UTM a lon/lat en una sola llamada """
+    lons, lats = transformer.transform(coords[:, 0], coords[:, 1])
+    return np.column_stack([lons, lats])
+
+
+def is_ring(node):
+    return (
+        isinstance(node, list) and len(node) > 0
+        and isinstance(node[0], (list, tuple)) and len(node[0]) >= 2
+        and isinstance(node[0][0], numbers.Number)
+    )
+
+
+def reproject_coordinates(trees):
+    """
+    Reproyecta varias coordenadas GeoJSON (anidadas a cualquier nivel) de UTM a WGS84
+    transformando todos los vértices de todos los anillos en una única llamada vectorizada.
+    """
+    rings = []
+
+    def collect(node):
+        if is_ring(node):
+            rings.append(np.asarray(node, dtype=float)[:, :2])
+        else:
+            for child in node:
+                collect(child)
+
+    for tree in trees:
+        collect(tree)
+    if not rings:
+        return [[] for _ in trees]
+
+    converted = utm_to_wgs84_array(np.concatenate(rings))
+    pieces = iter(np.split(converted, np.cumsum([len(ring) for ring in rings])[:-1]))
+
+    def rebuild(node):
+        if is_ring(node):
+            return next(pieces).tolist()
+        return [rebuild(child) for child in node]
+
+    return [rebuild(tree) for tree in trees]
+
+
+def geometry_shape(geometry):
+    """ Geometría shapely a partir de la Geometry de un barrio, tenga o no el campo 'type' """
+    if "type" in geometry:
+        return shape(geometry)
+    coordinates = geometry["coordinates"]
+    depth = 0
+    while isinstance(coordinates, list) and coordinates:
+        coordinates = coordinates[0]
+        depth += 1
+    geometry_type = {2: "Polygon", 3: "Polygon", 4: "MultiPolygon"}[depth]
+    rings = geometry["coordinates"] if depth > 2 else [geometry["coordinates"]]
+    return shape({"type": geometry_type, "coordinates": rings})
+
+
+def simplify_coverage(geometries, tolerance):
+    """
+    Simplifica a la vez polígonos que comparten bordes: con shapely >= 2.1 (GEOS >= 3.12) cada borde común
+    se simplifica una sola vez y no aparecen huecos ni solapes entre barrios vecinos.
+    """
+    if hasattr(shapely, "coverage_simplify"):
+        try:
+            return list(shapely.coverage_simplify(np.array(geometries, dtype=object), tolerance))
+        except GEOSException as e:
+            logging.warning(f"Neighborhoods are not a valid coverage, simplifying them one by one: {str(e)}")
+    return [geometry.simplify(tolerance, preserve_topology=True) for geometry in geometries]
+
+
+def quantize(coordinates, decimals):
+    """ Redondea las coordenadas y elimina los vértices consecutivos que quedan repetidos """
+    if not is_ring(coordinates):
+        return [quantize(child, decimals) for child in coordinates]
+    ring = []
+    for point in coordinates:
+        point = [round(point[0], decimals), round(point[1], decimals)]
+        if not ring or point != ring[-1]:
+            ring.append(point)
+    if len(ring) < 4:
+        # Too small to survive the rounding as a ring: keep every vertex
+        ring = [[round(point[0], decimals), round(point[1], decimals)] for point in coordinates]
+    return ring
+
+
+def simplified_variants(geometries):
+    """ zoom -> Geometry WGS84 simplificada (tolerancia de un píxel) y cuantizada de cada geometría UTM """
+    shapes = [geometry_shape(geometry) for geometry in geometries]
+    variants = [{} for _ in geometries]
+    for zoom in SIMPLIFIED_ZOOMS:
+        simplified = [json.loads(shapely.to_geojson(g)) for g in simplify_coverage(shapes, pixel_size_meters(zoom))]
+        converted = reproject_coordinates([geometry["coordinates"] for geometry in simplified])
+        for variant, geometry, coordinates in zip(variants, simplified, converted):
+            variant[str(zoom)] = {"type": geometry["type"], "coordinates": quantize(coordinates, coordinate_decimals(zoom))}
+    return variants
+
+
+def geometry_hash(geometry):
+    return hashlib.sha1(json.dumps(geometry, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class GeometryStore:
+    """
+    Geometrías de los barrios ya reproyectadas a WGS84, persistidas en neighborhood_geometries junto con sus
+    variantes simplificadas y cuantizadas para cada zoom de SIMPLIFIED_ZOOMS
+    """
+
+    def __init__(self, mongo):
+        self.demographics_collection = mongo.db['demographic_info']
+        self.geometries_collection = mongo.db['neighborhood_geometries']
+        self.loaded = False
+        self._geometries = {}
+        self._variants = {}
+
+    def sync(self):
+        """ Reproyecta solo los barrios cuya geometría UTM ha cambiado (por hash de contenido) y carga la caché """
+        zooms = [str(zoom) for zoom in SIMPLIFIED_ZOOMS]
+        stored = {g["_id"]: g for g in self.geometries_collection.find({}, {"hash": 1, "zooms": 1})}
+        neighborhoods = [
+            n for n in self.demographics_collection.find({}, {"_id": 0, "Nombre": 1, "Geometry": 1})
+            if n.get("Nombre") and n.get("Geometry", {}).get("coordinates")
+        ]
+        hashes = {n["Nombre"]: geometry_hash(n["Geometry"]) for n in neighborhoods}
+        stale = [n for n in neighborhoods if stored.get(n["Nombre"], {}).get("hash") != hashes[n["Nombre"]]]
+        removed = set(stored) - set(hashes)
+        if stale or removed or any(g.get("zooms") != zooms for g in stored.values()):
+            # Neighbours share their simplified borders, so any change rebuilds every neighborhood
+            stale = neighborhoods
+
+        if stale:
+            converted = reproject_coordinates([n["Geometry"]["coordinates"] for n in stale])
+            variants = simplified_variants([n["Geometry"] for n in stale])
+            operations = []
+            for neighborhood, coordinates, variant in zip(stale, converted, variants):
+                geometry = {**neighborhood["Geometry"], "coordinates": coordinates}
+                operations.append(ReplaceOne(
+                    {"_id": neighborhood["Nombre"]},
+                    {
+                        "_id": neighborhood["Nombre"],
+                        "hash": hashes[neighborhood["Nombre"]],
+                        "Geometry": geometry,
+                        "zooms": zooms,
+                        "Variants": variant
+                    },
+                    upsert=True
+                ))
+            self.geometries_collection.bulk_write(operations, ordered=False)
+        if removed:
+            self.geometries_collection.delete_many({"_id": {"$in": list(removed)}})
+        logging.info(f"Neighborhood geometries synced: {len(stale)} reprojected, {len(removed)} removed")
+        self.load()
+
+    def load(self):
+        geometries = {}
+        variants = {}
+        for g in self.geometries_collection.find({}, {"Geometry": 1, "Variants": 1}):
+            geometries[g["_id"]] = g["Geometry"]
+            variants[g["_id"]] = {int(zoom): geometry for zoom, geometry in g.get("Variants", {}).items()}
+        self._geometries = geometries
+        self._variants = variants
+        self.loaded = True
+
+    def start(self):
+        try:
+            self.sync()
+        except PyMongoError as e:
+            logging.error(f"Could not sync neighborhood geometries, they will be reprojected per request: {str(e)}")
+
+    def get(self, nombre, zoom=None):
+        """
+        Geometry WGS84 del barrio, o None si no está en la caché. Con zoom, la variante más simplificada
+        que sigue siendo precisa a ese zoom (la completa por encima del último de SIMPLIFIED_ZOOMS)
+        """
+        if zoom is not None:
+            variants = self._variants.get(nombre, {})
+            for level in sorted(variants):
+                if level >= zoom:
+                    return variants[level]
+        return self._geometries.get(nombre)
+
+    def items(self, zoom=None):
+        return [(nombre, self.get(nombre, zoom)) for nombre in self._geometries]
@@ -0,0 +1,163 @@
+import numpy as np
+
+RATING_INTERVALS = [x * 0.5 for x in range(11)]
+N_RATING_BINS = len(RATING_INTERVALS) - 1
+MISSING = object()
+# Conteos de group_counts que se suman al juntar grupos (las celdas y los puntos sueltos de un radio)
+SUM_KEYS = (
+    "total", "cuisine_counts", "price_counts", "rating_counts", "rating_n", "accessibility_count", "accessibility_sum"
+)
+
+
+def as_float(value):
+    """ float del valor si es un número (no bool); NaN en cualquier otro caso (None, textos...) """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return np.nan
+
+
+def encode_categories(values):
+    """ Codifica una lista de valores como (códigos, categorías); los valores MISSING quedan como -1 """
+    categories = {}
+    codes = np.empty(len(values), dtype=np.int64)
+    for i, value in enumerate(values):
+        if value is MISSING:
+            codes[i] = -1
+        else:
+            codes[i] = categories.setdefault(value, len(categories))
+    return codes, list(categories)
+
+
+def rating_bins(ratings, intervals=RATING_INTERVALS):
+    """ Índice de bin de cada nota con la semántica de numpy.histogram (último bin cerrado); -1 si no cae en ninguno """
+    edges = np.asarray(intervals, dtype=float)
+    bins = np.searchsorted(edges, ratings, side="right") - 1
+    bins[ratings == edges[-1]] = len(edges) - 2
+    bins[~((ratings >= edges[0]) & (ratings <= edges[-1]))] = -1  # Also drops NaN
+    return bins
+
+
+def decay_weights(distances, half_distance):
+    """ Peso de cada competidor según su distancia en metros: 1 en el punto y la mitad cada half_distance metros """
+    return np.exp2(-np.asarray(distances, dtype=float) / half_distance)
+
+
+def count_matrix(groups, codes, n_groups, size, weights=None):
+    """ Matriz (n_groups, size) con los conteos (o la suma de weights) de cada código por grupo; ignora los -1 """
+    valid = codes >= 0
+    flat = np.bincount(
+        groups[valid] * size + codes[valid],
+        weights=None if weights is None else weights[valid],
+        minlength=n_groups * size
+    )
+    return flat.reshape(n_groups, size)
+
+
+def reduce_by_group(ufunc, groups, values, valid, n_groups, initial):
+    result = np.full(n_groups, initial, dtype=float)
+    ufunc.at(result, groups[valid], values[valid])
+    return result
+
+
+def category_histogram(counts, categories):
+    """ {categoría: proporción} de los conteos (ponderados o no); [] si no hay ninguno """
+    n = counts.sum()
+    if not n:
+        return []
+    return {categories[i]: float(counts[i] / n) for i in np.flatnonzero(counts).tolist()}
+
+
+def rating_histogram(counts, n):
+    """ (proporciones por bin, RATING_INTERVALS); n incluye las notas que no caen en ningún bin """
+    if not n:
+        return []
+    return ([float(x / n) for x in counts], np.asarray(RATING_INTERVALS, dtype=float).tolist())
+
+
+class HistogramEngine:
+    """
+    Columnas de un conjunto de restaurantes (cocina y precio codificados como enteros, bin de la nota, accesibilidad)
+    para calcular con np.bincount los histogramas de competidores de uno o muchos sitios a la vez, con pesos opcionales
+    (p.ej. decay_weights por distancia)
+    """
+
+    def __init__(self, documents):
+        self.cuisine_codes, self.cuisines = encode_categories([r.get("Categoría Cocina", MISSING) for r in documents])
+        self.price_codes, self.prices = encode_categories([r.get("Categoría Precio", MISSING) for r in documents])
+        # Every document with a Nota counts in the rating total, numeric or not (like $exists in the $facet)
+        self.has_rating = np.array(["Nota" in r for r in documents], dtype=bool)
+        self.ratings = np.array([as_float(r.get("Nota")) for r in documents], dtype=float)
+        self.rating_bins = rating_bins(self.ratings)
+        self.accessibility = np.array([as_float(r.get("Accesibilidad")) for r in documents], dtype=float)
+        self.has_accessibility = ~np.isnan(self.accessibility)
+
+    def __len__(self):
+        return len(self.cuisine_codes)
+
+    def filter_mask(self, cuisines=None, prices=None, min_rating=None):
+        """ Máscara de los restaurantes que cumplen los filtros, igual que RestaurantService._filters_query """
+        mask = np.ones(len(self), dtype=bool)
+        if cuisines is not None:
+            mask &= np.isin(self.cuisine_codes, [i for i, cuisine in enumerate(self.cuisines) if cuisine in cuisines])
+        if prices is not None:
+            mask &= np.isin(self.price_codes, [i for i, price in enumerate(self.prices) if price in prices])
+        if min_rating is not None:
+            mask &= self.ratings >= min_rating  # NaN (missing or not a number) never passes
+        return mask
+
+    def group_counts(self, groups, points, n_groups, weights=None):
+        """
+        Conteos por grupo (sitio, celda...) de los pares (groups[i], points[i]); con weights, cada par suma su peso
+        en los histogramas y en la media de accesibilidad ("total" siempre cuenta restaurantes)
+        """
+        groups = np.asarray(groups, dtype=np.int64)
+        points = np.asarray(points, dtype=np.int64)
+        weights = None if weights is None else np.asarray(weights, dtype=float)
+        has_rating = self.has_rating[points]
+        has_accessibility = self.has_accessibility[points]
+        accessibility = self.accessibility[points]
+        return {
+            "total": np.bincount(groups, minlength=n_groups),
+            "cuisine_counts": count_matrix(groups, self.cuisine_codes[points], n_groups, len(self.cuisines), weights),
+            "price_counts": count_matrix(groups, self.price_codes[points], n_groups, len(self.prices), weights),
+            "rating_counts": count_matrix(groups, self.rating_bins[points], n_groups, N_RATING_BINS, weights),
+            "rating_n": np.bincount(
+                groups[has_rating], weights=None if weights is None else weights[has_rating], minlength=n_groups
+            ),
+            "accessibility_count": np.bincount(
+                groups[has_accessibility], weights=None if weights is None else weights[has_accessibility], minlength=n_groups
+            ),
+            "accessibility_sum": np.bincount(
+                groups[has_accessibility],
+                weights=accessibility[has_accessibility] * (1.0 if weights is None else weights[has_accessibility]),
+                minlength=n_groups
+            ),
+            "accessibility_min": reduce_by_group(np.minimum, groups, accessibility, has_accessibility, n_groups, np.inf),
+            "accessibility_max": reduce_by_group(np.maximum, groups, accessibility, has_accessibility, n_groups, -np.inf),
+        }
+
+    def stats(self, counts, i=0):
+        """ Estadísticas del grupo i con el formato de get_neighbours_competitors; None si no tiene restaurantes """
+        total = int(counts["total"][i])
+        if not total:
+            return None
+        if counts["accessibility_count"][i]:
+            accessibility = {
+                "min": float(counts["accessibility_min"][i]),
+                "avg": float(counts["accessibility_sum"][i] / counts["accessibility_count"][i]),
+                "max": float(counts["accessibility_max"][i])
+            }
+        else:
+            accessibility = {"min": None, "avg": None, "max": None}
+        return {
+            "Categoria Cocina": category_histogram(counts["cuisine_counts"][i], self.cuisines),
+            "Numero de restaurantes": total,
+            "Precio": category_histogram(counts["price_counts"][i], self.prices),
+            "Nota": rating_histogram(counts["rating_counts"][i], counts["rating_n"][i]),
+            "Accesibilidad": accessibility
+        }
+
+    def batch_stats(self, groups, points, n_groups, weights=None):
+        """ Estadísticas de cada uno de los n_groups sitios (None si no tiene restaurantes), en una sola pasada """
+        counts = self.group_counts(groups, points, n_groups, weights)
+        return [self.stats(counts, i) for i in range(n_groups)]
@@ -0,0 +1,144 @@
+import logging
+from collections import namedtuple
+from pymongo.errors import PyMongoError
+
+# Consulta de un servicio que debe resolverse con un índice: filter (find) o pipeline (aggregate)
+QueryCheck = namedtuple("QueryCheck", ["name", "collection", "filter", "pipeline"])
+
+# Valores de ejemplo para construir las consultas que se pasan a explain()
+DEFAULT_SAMPLE = {
+    "neighborhood": "el Raval",
+    "lat": 41.3809,
+    "lon": 2.1700,
+    "renta": 15000.0,
+}
+
+
+class QueryPlanError(Exception):
+    """ Consultas sin índice en modo strict; report es el informe completo de verify() """
+
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report or []
+
+
+def winning_stages(explain):
+    """ Etapas (COLLSCAN, IXSCAN, GEO_NEAR_2DSPHERE...) de los planes ganadores de un resultado de explain """
+    stages = set()
+
+    def collect(node, in_winning_plan):
+        if isinstance(node, dict):
+            if in_winning_plan and isinstance(node.get("stage"), str):
+                stages.add(node["stage"])
+            for key, value in node.items():
+                if key != "rejectedPlans":
+                    collect(value, in_winning_plan or key == "winningPlan")
+        elif isinstance(node, list):
+            for item in node:
+                collect(item, in_winning_plan)
+
+    collect(explain, False)
+    return stages
+
+
+def key_spec(key):
+    """ Especificación de claves comparable: ((campo, dirección o tipo), ...) con 1.0 y 1 como el mismo valor """
+    return tuple((field, value if isinstance(value, str) else int(value)) for field, value in key.items())
+
+
+class IndexManager:
+    """
+    Crea los índices que declaran los servicios (atributo INDEXES) y comprueba con explain() que sus
+    consultas (método query_checks) los usan, avisando de cualquier consulta que acabe en COLLSCAN.
+    """
+
+    def __init__(self, mongo, services):
+        self.db = mongo.db
+        self.services = services
+        self.conflicts = []
+
+    def declared(self):
+        """ colección -> [IndexModel] de todos los servicios, sin duplicados por nombre """
+        indexes = {}
+        for service in self.services:
+            for collection, models in getattr(service, "INDEXES", {}).items():
+                by_name = indexes.setdefault(collection, {})
+                for model in models:
+                    by_name.setdefault(model.document["name"], model)
+        return {collection: list(models.values()) for collection, models in indexes.items()}
+
+    def ensure(self):
+        """
+        Crea los índices declarados que faltan; devuelve sus nombres como 'colección.índice'. Un índice existente con
+        las mismas claves y otro nombre cuenta como presente; uno con el mismo nombre y otras claves es un conflicto
+        (no se crea y queda en self.conflicts).
+        """
+        created = []
+        self.conflicts = []
+        for collection, models in self.declared().items():
+            existing = {index["name"]: key_spec(index["key"]) for index in self.db[collection].list_indexes()}
+            by_key = {key: name for name, key in existing.items()}
+            missing = []
+            for model in models:
+                name = model.document["name"]
+                key = key_spec(model.document["key"])
+                if name in existing and existing[name] != key:
+                    self.conflicts.append(
+                        f"{collection}.{name} exists with keys {list(existing[name])}, declared {list(key)}"
+                    )
+                elif name not in existing and key in by_key:
+                    logging.info(f"Index {collection}.{name} already exists as {collection}.{by_key[key]}")
+                elif name not in existing:
+                    missing.append(model)
+            if missing:
+                self.db[collection].create_indexes(missing)
+                created += [f"{collection}.{model.document['name']}" for model in missing]
+        if created:
+            logging.warning(f"Created missing indexes: {', '.join(created)}")
+        for conflict in self.conflicts:
+            logging.error(f"Index conflict: {conflict}")
+        return created
+
+    def explain(self, check):
+        if check.pipeline is not None:
+            return self.db.command("aggregate", check.collection, pipeline=check.pipeline, explain=True)
+        return self.db[check.collection].find(check.filter).explain()
+
+    def verify(self, sample=None, strict=False):
+        """
+        Ejecuta explain() sobre las consultas de los servicios. Devuelve un informe por consulta;
+        con strict lanza QueryPlanError si alguna hace COLLSCAN o no se puede planificar.
+        """
+        sample = {**DEFAULT_SAMPLE, **(sample or {})}
+        report = []
+        for service in self.services:
+            for check in service.query_checks(sample):
+                entry = {"query": check.name, "collection": check.collection}
+                try:
+                    entry["stages"] = sorted(winning_stages(self.explain(check)))
+                    entry["collscan"] = "COLLSCAN" in entry["stages"]
+                except PyMongoError as e:
+                    # e.g. $geoNear without a 2dsphere index cannot even be planned
+                    entry["error"] = str(e)
+                report.append(entry)
+
+        failures = [entry for entry in report if entry.get("collscan") or "error" in entry]
+        for entry in failures:
+            reason = entry.get("error") or "COLLSCAN"
+            logging.warning(f"Query {entry['query']} on {entry['collection']} is not using an index: {reason}")
+        if strict and failures:
+            raise QueryPlanError(f"Queries without index: {', '.join(entry['query'] for entry in failures)}", report)
+        return report
+
+    def start(self, plan_check="warn"):
+        """ Crea los índices que faltan y comprueba los planes: 'warn' solo avisa, 'strict' aborta el arranque, 'off' no comprueba """
+        try:
+            self.ensure()
+        except PyMongoError as e:
+            logging.error(f"Could not create missing indexes: {str(e)}")
+        # The plans are checked even if some index could not be created: that is what verify() reports
+        try:
+            if plan_check != "off":
+                self.verify(strict=plan_check == "strict")
+        except PyMongoError as e:
+            logging.error(f"Could not verify query plans: {str(e)}")
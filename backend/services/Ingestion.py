@@ -0,0 +1,312 @@
+"""
+Carga de los datasets desde los ficheros de origen (CSV, GeoJSON o NDJSON) a MongoDB por bloques: cada bloque se
+normaliza por columnas (números con coma decimal, precios, textos, nombres de barrio y coordenadas) y se escribe
+sin orden en una colección de staging, que al terminar sustituye a la colección final con renameCollection.
+"""
+import csv
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from collections import namedtuple
+import numpy as np
+import shapely
+from bson import json_util
+from pyproj import Transformer
+from services.DemographicService import normalize_name
+from services.EmptyLocalsSnapshot import parse_prices
+
+DATA_CRS = "EPSG:32631"  # demographic_info.Geometry is stored in UTM 31N, as the API returns it
+STAGING_SUFFIX = "_staging"
+# Pares de columnas (lon, lat) que se reconocen en los CSV
+COORDINATE_COLUMNS = [("lon", "lat"), ("longitude", "latitude"), ("Longitud", "Latitud")]
+# Orden de carga: los nombres canónicos de barrio salen de demographic_info
+DATASET_ORDER = ["demographic_info", "restaurants", "empty_locals", "transport"]
+
+LoadReport = namedtuple("LoadReport", ["dataset", "read", "written", "seconds"])
+
+
+def read_chunks(path, chunk_size=5000):
+    """ Documentos del fichero en listas de chunk_size: CSV con cabecera, GeoJSON (FeatureCollection), JSON o NDJSON """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            rows = (
+                {key: value for key, value in row.items() if key is not None and value != ""}
+                for row in csv.DictReader(f)
+            )
+            yield from _batched(rows, chunk_size)
+    elif extension in (".ndjson", ".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            # mongoexport output: Extended JSON keeps ObjectId, dates...
+            yield from _batched((json_util.loads(line) for line in f if line.strip()), chunk_size)
+    elif extension in (".geojson", ".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json_util.loads(f.read())
+        if isinstance(data, dict) and data.get("type") == "FeatureCollection":
+            documents = (
+                {**(feature.get("properties") or {}), "Geometry": feature.get("geometry")}
+                for feature in data.get("features", [])
+            )
+        elif isinstance(data, list):
+            documents = iter(data)
+        else:
+            raise ValueError(f"{path}: expected a FeatureCollection or a JSON array")
+        yield from _batched(documents, chunk_size)
+    else:
+        raise ValueError(f"{path}: unsupported format (csv, geojson, json, ndjson)")
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_numbers(values):
+    """ Array float a partir de números o textos con punto o coma decimal ('4,5' -> 4.5); NaN si no es numérico """
+    parsed = np.full(len(values), np.nan)
+    is_number = np.array([isinstance(v, (int, float)) and not isinstance(v, bool) for v in values], dtype=bool)
+    is_text = np.array([isinstance(v, str) for v in values], dtype=bool)
+    if is_number.any():
+        parsed[is_number] = np.array([v for v, ok in zip(values, is_number) if ok], dtype=float)
+    if is_text.any():
+        texts = np.char.replace(np.char.strip(np.array([v for v, ok in zip(values, is_text) if ok], dtype=str)), ",", ".")
+        try:
+            parsed[is_text] = texts.astype(float)
+        except ValueError:
+            # Only a column with some non-numeric text pays for the element-wise parse
+            parsed[is_text] = [_float_or_nan(text) for text in texts.tolist()]
+    parsed[~np.isfinite(parsed)] = np.nan
+    return parsed
+
+
+def _float_or_nan(text):
+    try:
+        return float(text)
+    except ValueError:
+        return np.nan
+
+
+def clean_text(values):
+    """ Textos con los espacios colapsados; None si el valor no es texto o queda vacío """
+    return [(" ".join(v.split()) or None) if isinstance(v, str) else None for v in values]
+
+
+def clean_lines(values):
+    """ Lista de líneas de transporte a partir de una lista o de un texto separado por comas o punto y coma """
+    lines = []
+    for value in values:
+        if isinstance(value, str):
+            value = value.replace(";", ",").split(",")
+        if isinstance(value, (list, tuple)):
+            value = [" ".join(str(line).split()) for line in value]
+            lines.append([line for line in value if line] or None)
+        else:
+            lines.append(None)
+    return lines
+
+
+def point_columns(documents):
+    """ Arrays lon/lat de Geometry.coordinates o de las columnas de COORDINATE_COLUMNS; NaN si no son válidas """
+    lons = []
+    lats = []
+    for document in documents:
+        geometry = document.get("Geometry")
+        coordinates = geometry.get("coordinates") if isinstance(geometry, dict) else None
+        if not (isinstance(coordinates, (list, tuple)) and len(coordinates) == 2):
+            columns = next(((x, y) for x, y in COORDINATE_COLUMNS if x in document and y in document), None)
+            coordinates = (document[columns[0]], document[columns[1]]) if columns else (None, None)
+        lons.append(coordinates[0])
+        lats.append(coordinates[1])
+    lons = parse_numbers(lons)
+    lats = parse_numbers(lats)
+    invalid = ~((np.abs(lons) <= 180) & (np.abs(lats) <= 90))  # Also catches NaN
+    lons[invalid] = np.nan
+    lats[invalid] = np.nan
+    return lons, lats
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def assemble(documents, columns, drop=()):
+    """
+    Sustituye en cada documento los campos de columns (campo -> lista o array del bloque); los valores None o NaN
+    eliminan el campo, igual que los de drop. El resto de campos del origen se conservan.
+    """
+    columns = {field: values.tolist() if isinstance(values, np.ndarray) else values for field, values in columns.items()}
+    result = []
+    for i, document in enumerate(documents):
+        document = {key: value for key, value in document.items() if key not in drop and key not in columns}
+        for field, values in columns.items():
+            if not _missing(values[i]):
+                document[field] = values[i]
+        result.append(document)
+    return result
+
+
+def _points(lons, lats):
+    return [
+        None if math.isnan(lon) else {"type": "Point", "coordinates": [lon, lat]}
+        for lon, lat in zip(lons.tolist(), lats.tolist())
+    ]
+
+
+def _integers(values):
+    numbers = parse_numbers(values)
+    return [None if math.isnan(n) else int(n) for n in numbers.tolist()]
+
+
+def canonical_barrios(values, names):
+    """ Nombre de barrio tal como está en demographic_info (names: nombre normalizado -> Nombre) """
+    return [names.get(normalize_name(value), value) if value else None for value in clean_text(values)]
+
+
+def _column(documents):
+    return lambda field: [d.get(field) for d in documents]
+
+
+def _coordinate_columns(documents):
+    return {column for pair in COORDINATE_COLUMNS for column in pair if any(column in d for d in documents)}
+
+
+def normalize_restaurants(documents, names, crs=None):
+    column = _column(documents)
+    lons, lats = point_columns(documents)
+    return assemble(documents, {
+        "Nombre": clean_text(column("Nombre")),
+        "Tipo": clean_text(column("Tipo")),
+        "Categoría Cocina": clean_text(column("Categoría Cocina")),
+        "Categoría Precio": clean_text(column("Categoría Precio")),
+        "Precio": clean_text(column("Precio")),
+        "Dirección": clean_text(column("Dirección")),
+        "Barrio": canonical_barrios(column("Barrio"), names),
+        # Ratings that are not numbers are dropped, as if the restaurant had none
+        "Nota": parse_numbers(column("Nota")),
+        "Nº Reseñas": _integers(column("Nº Reseñas")),
+        "Accesibilidad": parse_numbers(column("Accesibilidad")),
+        "Geometry": _points(lons, lats),
+    }, drop=_coordinate_columns(documents))
+
+
+def normalize_empty_locals(documents, names, crs=None):
+    column = _column(documents)
+    lons, lats = point_columns(documents)
+    normalized = assemble(documents, {
+        "Título": clean_text(column("Título")),
+        "Dirección completa": clean_text(column("Dirección completa")),
+        "Barrio": canonical_barrios(column("Barrio"), names),
+        # Amounts in Spanish format ('1.200,50'): parse_prices reads '.' + three digits as a thousands separator
+        "Superficie (m2)": parse_prices(column("Superficie (m2)")),
+        "Precio (€/m2)": parse_prices(column("Precio (€/m2)")),
+        "Accesibilidad": parse_numbers(column("Accesibilidad")),
+        "Geometry": _points(lons, lats),
+    }, drop=_coordinate_columns(documents))
+    # Same parsing as the request-time cleaning (preprocess_price, '1.200,50 €' -> 1200.5); prices "a consultar"
+    # are stored as null. PrecioNum is the copy the average-price aggregations read
+    prices = parse_prices(column("Precio total (€)")).tolist()
+    for document, price in zip(normalized, prices):
+        document["Precio total (€)"] = document["PrecioNum"] = None if math.isnan(price) else price
+    return normalized
+
+
+def normalize_transport(documents, names, crs=None):
+    column = _column(documents)
+    lons, lats = point_columns(documents)
+    return assemble(documents, {
+        "Nombre": clean_text(column("Nombre")),
+        "Tipo": clean_text(column("Tipo")),
+        "Lineas": clean_lines(column("Lineas")),
+        "Geometry": _points(lons, lats),
+    }, drop=_coordinate_columns(documents))
+
+
+def normalize_demographics(documents, names=None, crs=DATA_CRS):
+    column = _column(documents)
+    nombres = clean_text(column("Nombre"))
+    geometries = column("Geometry")
+    if crs != DATA_CRS:
+        geometries = _reproject_geometries(geometries, crs)
+    return assemble(documents, {
+        "Nombre": nombres,
+        "NombreNormalizado": [normalize_name(nombre) if nombre else None for nombre in nombres],
+        # Renta keeps the source format in the API responses; range queries use RentaNum
+        "RentaNum": parse_numbers(column("Renta")),
+        "Población": _integers(column("Población")),
+        "Geometry": geometries,
+    })
+
+
+def _reproject_geometries(geometries, crs):
+    """ Geometrías GeoJSON de crs a DATA_CRS, todos los vértices del bloque en una sola transformación """
+    to_data_crs = Transformer.from_crs(crs, DATA_CRS, always_xy=True)
+    valid = [i for i, g in enumerate(geometries) if isinstance(g, dict) and g.get("coordinates")]
+    shapes = shapely.from_geojson([json.dumps(geometries[i]) for i in valid])
+    shapes = shapely.transform(shapes, lambda xy: np.column_stack(to_data_crs.transform(xy[:, 0], xy[:, 1])))
+    result = [None] * len(geometries)
+    for i, reprojected in zip(valid, shapes):
+        result[i] = json.loads(shapely.to_geojson(reprojected))
+    return result
+
+
+NORMALIZERS = {
+    "demographic_info": normalize_demographics,
+    "restaurants": normalize_restaurants,
+    "empty_locals": normalize_empty_locals,
+    "transport": normalize_transport,
+}
+
+
+class DatasetLoader:
+    """
+    Carga cada dataset en <colección>_staging (bloques con insert_many sin orden), crea en ella los índices
+    declarados por los servicios y la intercambia con la colección final con renameCollection (dropTarget),
+    así las lecturas ven la colección anterior completa hasta el cambio y la nueva completa después.
+    """
+
+    def __init__(self, mongo, indexes=None, chunk_size=5000):
+        self.db = mongo.db
+        self.indexes = indexes or {}  # colección -> [IndexModel], p.ej. IndexManager.declared()
+        self.chunk_size = chunk_size
+
+    def neighborhood_names(self):
+        """ Nombre normalizado -> Nombre de los barrios ya cargados """
+        return {
+            n["NombreNormalizado"]: n["Nombre"]
+            for n in self.db["demographic_info"].find({}, {"_id": 0, "Nombre": 1, "NombreNormalizado": 1})
+            if n.get("NombreNormalizado") and n.get("Nombre")
+        }
+
+    def load(self, dataset, path, crs=DATA_CRS):
+        """ Carga el fichero en staging y lo intercambia con la colección del dataset; devuelve un LoadReport """
+        started = time.perf_counter()
+        normalize = NORMALIZERS[dataset]
+        names = self.neighborhood_names() if dataset != "demographic_info" else None
+        staging = self.db[dataset + STAGING_SUFFIX]
+        staging.drop()
+        read = written = 0
+        for chunk in read_chunks(path, self.chunk_size):
+            read += len(chunk)
+            documents = normalize(chunk, names, crs)
+            if documents:
+                written += len(staging.insert_many(documents, ordered=False).inserted_ids)
+        if not written:
+            # Never replace a dataset with an empty collection (wrong file, wrong format...)
+            raise ValueError(f"{path}: no documents to load into {dataset}")
+        if self.indexes.get(dataset):
+            staging.create_indexes(self.indexes[dataset])
+        staging.rename(dataset, dropTarget=True)
+        report = LoadReport(dataset, read, written, time.perf_counter() - started)
+        logging.info(f"Loaded {dataset}: {written}/{read} documents in {report.seconds:.1f}s")
+        return report
+
+    def load_all(self, paths, crs=DATA_CRS):
+        """ Carga {dataset: fichero} en DATASET_ORDER; crs es el de las geometrías de demographic_info """
+        return [self.load(dataset, paths[dataset], crs) for dataset in DATASET_ORDER if paths.get(dataset)]
@@ -0,0 +1,57 @@
+import datetime
+import numpy as np
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Without orjson the stdlib encoder is used, with the same type support
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    if orjson is not None else 0
+)
+
+
+def _bson_default(value):
+    """ Tipos que no son JSON nativos: ObjectId, fechas y escalares/arrays de NumPy """
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """ Proveedor JSON de Flask basado en orjson que serializa directamente los documentos de MongoDB """
+
+    @staticmethod
+    def default(value):
+        try:
+            return _bson_default(value)
+        except TypeError:
+            return DefaultJSONProvider.default(value)
+
+    def dumps_bytes(self, obj):
+        if orjson is None:
+            return self.dumps(obj).encode("utf-8")
+        return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=ORJSON_OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
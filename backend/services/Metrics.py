@@ -0,0 +1,335 @@
+import bisect
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from pymongo.monitoring import CommandListener
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+SLOW_LOG_MAX_CHARS = 2000
+
+# Service method running on the current thread / task, used to label the MongoDB commands it issues
+current_operation = ContextVar("current_operation", default="other")
+# MongoDB commands of the current request, only collected while the slow-request log is enabled
+request_commands = ContextVar("request_commands", default=None)
+
+slow_log = logging.getLogger("urban_insight.slow_requests")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)) + "}"
+
+
+def render_counter(name, documentation, labelnames, values):
+    """ Líneas de un contador a partir de {tupla de etiquetas: valor} """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} counter"]
+    for key, value in sorted(values.items()):
+        lines.append(f"{name}{_label_text(labelnames, key)} {value}")
+    return lines
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        return render_counter(self.name, self.documentation, self.labelnames, values)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            series[position] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    labels = _label_text(self.labelnames + ("le",), key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _label_text(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {series[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """ Métricas del proceso en formato de texto de Prometheus """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """ collector() -> líneas de texto, calculadas en cada lectura de /metrics """
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collector in self._collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+
+def instrument(service):
+    """ Etiqueta con 'Servicio.método' los comandos de MongoDB que lanzan los métodos públicos del servicio """
+    service_name = type(service).__name__
+    for name in dir(type(service)):
+        method = getattr(service, name)
+        if name.startswith("_") or not callable(method) or isinstance(method, type):
+            continue
+        setattr(service, name, _with_operation(method, f"{service_name}.{name}"))
+    return service
+
+
+def _with_operation(method, operation):
+    if inspect.isgeneratorfunction(method):
+        return _generator_with_operation(method, operation)
+    if inspect.iscoroutinefunction(method):
+        return _coroutine_with_operation(method, operation)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        # Keep the outermost operation when a public method calls another one
+        if current_operation.get() != "other":
+            return method(*args, **kwargs)
+        token = current_operation.set(operation)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            current_operation.reset(token)
+    return wrapper
+
+
+def _coroutine_with_operation(method, operation):
+    # The *_async methods of asgi.py issue their queries when awaited, not when called
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        if current_operation.get() != "other":
+            return await method(*args, **kwargs)
+        token = current_operation.set(operation)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            current_operation.reset(token)
+    return wrapper
+
+
+def _generator_with_operation(method, operation):
+    # Streamed results run their queries while being iterated, after the call itself has returned
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        iterator = method(*args, **kwargs)
+        while True:
+            token = current_operation.set(operation) if current_operation.get() == "other" else None
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                if token is not None:
+                    current_operation.reset(token)
+            yield item
+    return wrapper
+
+
+def _command_summary(command):
+    return {key: command[key] for key in ("filter", "pipeline", "query", "sort", "limit") if key in command}
+
+
+def _returned_documents(reply):
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    return 0
+
+
+class MongoCommandMetrics(CommandListener):
+    """ Tiempo en MongoDB y documentos devueltos por operación de servicio, comando y colección """
+
+    def __init__(self, registry):
+        self.duration = registry.histogram(
+            "mongo_command_duration_seconds", "Time spent in MongoDB commands",
+            ("operation", "command", "collection")
+        )
+        self.documents = registry.counter(
+            "mongo_documents_returned_total", "Documents returned by MongoDB",
+            ("operation", "command", "collection")
+        )
+        self.failures = registry.counter(
+            "mongo_command_failures_total", "Failed MongoDB commands",
+            ("operation", "command", "collection")
+        )
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        command = event.command
+        collection = command.get("collection") if event.command_name == "getMore" else command.get(event.command_name)
+        summary = _command_summary(command) if request_commands.get() is not None else None
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (current_operation.get(), str(collection), summary)
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), ("other", "", None))
+
+    def succeeded(self, event):
+        operation, collection, summary = self._finish(event)
+        labels = {"operation": operation, "command": event.command_name, "collection": collection}
+        seconds = event.duration_micros / 1e6
+        self.duration.observe(seconds, **labels)
+        returned = _returned_documents(event.reply)
+        if returned:
+            self.documents.inc(returned, **labels)
+        commands = request_commands.get()
+        if commands is not None:
+            commands.append({**labels, "ms": round(seconds * 1000, 2), "documents": returned, **(summary or {})})
+
+    def failed(self, event):
+        operation, collection, _ = self._finish(event)
+        self.failures.inc(operation=operation, command=event.command_name, collection=collection)
+
+
+class RequestMetrics:
+    """ Latencia y tamaño de respuesta por ruta, con log opcional de las peticiones lentas y sus consultas """
+
+    def __init__(self, registry, slow_request_ms=None):
+        self.duration = registry.histogram(
+            "http_request_duration_seconds", "Request latency by route",
+            ("route", "method", "status")
+        )
+        self.response_size = registry.histogram(
+            "http_response_size_bytes", "Serialized response payload by route",
+            ("route",), buckets=SIZE_BUCKETS
+        )
+        self.slow_request_ms = slow_request_ms
+
+    def init_app(self, app):
+        from flask import g, request
+
+        @app.before_request
+        def start_timer():
+            g.metrics_started = time.perf_counter()
+            g.metrics_commands_token = request_commands.set([]) if self.slow_request_ms is not None else None
+
+        @app.after_request
+        def record(response):
+            started = g.pop("metrics_started", None)
+            if started is None:
+                return response
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            commands = request_commands.get()
+            token = g.pop("metrics_commands_token", None)
+            if token is not None:
+                request_commands.reset(token)
+            labels = {"route": route, "method": request.method, "status": response.status_code}
+            if response.is_streamed:
+                # Streamed bodies are measured when the last chunk has been sent
+                response.response = self._counting(response.response, started, labels, request.full_path.rstrip("?"), commands)
+            else:
+                self._observe(started, len(response.get_data()), labels, request.full_path.rstrip("?"), commands)
+            return response
+
+    def init_async_app(self, app):
+        """ init_app para la aplicación Quart de asgi.py """
+        from quart import g, request
+        from quart.wrappers.response import DataBody, IterableBody
+
+        @app.before_request
+        async def start_timer():
+            g.metrics_started = time.perf_counter()
+            g.metrics_commands_token = request_commands.set([]) if self.slow_request_ms is not None else None
+
+        @app.after_request
+        async def record(response):
+            started = g.pop("metrics_started", None)
+            if started is None:
+                return response
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            commands = request_commands.get()
+            token = g.pop("metrics_commands_token", None)
+            if token is not None:
+                request_commands.reset(token)
+            labels = {"route": route, "method": request.method, "status": response.status_code}
+            if isinstance(response.response, DataBody):
+                self._observe(started, len(await response.get_data()), labels, request.full_path.rstrip("?"), commands)
+            else:
+                body = self._counting_async(response.response, started, labels, request.full_path.rstrip("?"), commands)
+                response.response = IterableBody(body)
+            return response
+
+    def _counting(self, chunks, started, labels, path, commands):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            self._observe(started, size, labels, path, commands)
+
+    async def _counting_async(self, body, started, labels, path, commands):
+        size = 0
+        try:
+            async with body as chunks:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self._observe(started, size, labels, path, commands)
+
+    def _observe(self, started, size, labels, path, commands):
+        seconds = time.perf_counter() - started
+        self.duration.observe(seconds, **labels)
+        self.response_size.observe(size, route=labels["route"])
+        if self.slow_request_ms is not None and seconds * 1000 >= self.slow_request_ms:
+            detail = json.dumps(commands or [], default=str, ensure_ascii=False)[:SLOW_LOG_MAX_CHARS]
+            slow_log.warning(f"Slow request {labels['method']} {path} ({seconds * 1000:.0f} ms, {size} bytes): {detail}")
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pymongo.errors import PyMongoError
+from pymongo.monitoring import ConnectionPoolListener
+
+# Variable de entorno -> (opción de MongoClient, conversión)
+MONGO_CLIENT_ENV_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_READ_PREFERENCE": ("readPreference", str),
+    "MONGO_APPNAME": ("appname", str),
+}
+
+
+def mongo_client_options(environ):
+    """ Opciones de MongoClient definidas en el entorno; las que no están usan los valores por defecto de PyMongo """
+    options = {}
+    for variable, (option, convert) in MONGO_CLIENT_ENV_OPTIONS.items():
+        value = environ.get(variable)
+        if value not in (None, ""):
+            options[option] = convert(value)
+    return options
+
+
+class PoolMonitor(ConnectionPoolListener):
+    """ Cuenta las conexiones abiertas y en uso del pool a partir de los eventos CMAP de PyMongo """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def _add(self, attribute, delta):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + delta)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+            }
+
+    def reset(self):
+        # After fork the child starts with no connections of its own
+        with self._lock:
+            self.open = self.checked_out = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add("pool_clears", 1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("open", 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("open", -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add("checkout_failures", 1)
+
+    def connection_checked_out(self, event):
+        self._add("checked_out", 1)
+
+    def connection_checked_in(self, event):
+        self._add("checked_out", -1)
+
+
+class ConnectionPoolWarmer:
+    """ Abre las conexiones mínimas del pool en segundo plano y expone si ya está listo (para /health/ready) """
+
+    def __init__(self, client, monitor, min_size=1):
+        self.client = client
+        self.monitor = monitor
+        self.min_size = max(1, min_size)
+        self.warmed = False
+        self.error = None
+
+    def start(self):
+        threading.Thread(target=self.warm, name="mongo-pool-warmer", daemon=True).start()
+
+    def warm(self):
+        """ Lanza min_size pings simultáneos para que el pool tenga ese número de conexiones abiertas """
+        try:
+            with ThreadPoolExecutor(max_workers=self.min_size, thread_name_prefix="mongo-warm") as executor:
+                list(executor.map(lambda _: self.client.admin.command("ping"), range(self.min_size)))
+            self.warmed = True
+            self.error = None
+        except PyMongoError as e:
+            self.error = str(e)
+            logging.error(f"Could not warm MongoDB connection pool: {str(e)}")
+
+    async def warm_async(self):
+        """ warm() para un AsyncMongoClient (asgi.py), con los pings en el bucle de eventos """
+        try:
+            await asyncio.gather(*(self.client.admin.command("ping") for _ in range(self.min_size)))
+            self.warmed = True
+            self.error = None
+        except PyMongoError as e:
+            self.error = str(e)
+            logging.error(f"Could not warm MongoDB connection pool: {str(e)}")
+
+    def ready(self):
+        return self.warmed and self.monitor.open >= 1
@@ -0,0 +1,232 @@
+import logging
+import threading
+from pymongo.errors import PyMongoError
+
+STATS_COLLECTION = "neighborhood_stats"
+# Documento con los agregados de toda la ciudad; un _id objeto nunca coincide con el nombre de un barrio
+CITY_ID = {"scope": "city"}
+SOURCES = ("restaurants", "empty_locals")
+
+
+def _value_order(value):
+    # None first, like null in a MongoDB ascending sort
+    return (value is not None, str(value))
+
+
+def _counts(stats, field):
+    """ [{"value", "count"}] de un documento de barrio, de más a menos frecuente """
+    return sorted(stats.get(field, []), key=lambda entry: -entry["count"])
+
+
+def top_cuisine_types_result(stats, limit):
+    return [{"Tipo": entry["value"], "count": entry["count"]} for entry in _counts(stats, "cuisine_counts")[:limit]]
+
+
+def price_categories_result(stats):
+    return {entry["value"]: entry["count"] for entry in _counts(stats, "price_counts")}
+
+
+def restaurant_profile_result(stats):
+    """ Mismo formato que RestaurantService.get_neighborhood_profile """
+    return {
+        "top_5_cuisine_types": top_cuisine_types_result(stats, 5),
+        "price_categories": price_categories_result(stats),
+        "restaurant_count": stats.get("restaurant_count", 0)
+    }
+
+
+def average_price_result(stats):
+    return stats.get("empty_locals_average_price", 0) if stats.get("empty_locals_count") else 0
+
+
+def empty_locals_profile_result(stats):
+    """ Mismo formato que EmptyLocalsService.get_neighborhood_profile """
+    return {"count": stats.get("empty_locals_count", 0), "average_price": average_price_result(stats)}
+
+
+class NeighborhoodStats:
+    """
+    Colección materializada neighborhood_stats con los agregados por barrio de restaurants y empty_locals
+    (un documento por barrio más uno con los de la ciudad). Se construye con $merge y se mantiene al día
+    recalculando solo los barrios afectados por cada cambio de las colecciones de origen.
+    """
+
+    def __init__(self, mongo):
+        self.db = mongo.db
+        self.collection = mongo.db[STATS_COLLECTION]
+        self.loaded = False
+        self._refresh_lock = threading.Lock()
+        self._watcher = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """ Registra callback(), llamado tras cada actualización de la colección """
+        self._listeners.append(callback)
+
+    def neighborhood(self, name):
+        """ Documento de agregados del barrio ({} si no tiene restaurantes ni locales) """
+        return self.collection.find_one({"_id": name}) or {}
+
+    def city(self):
+        return self.collection.find_one({"_id": CITY_ID}) or {}
+
+    def _restaurant_pipelines(self, match):
+        pipelines = []
+        for field, name in (("Categoría Cocina", "cuisine_counts"), ("Categoría Precio", "price_counts")):
+            pipelines.append([
+                {"$match": match},
+                {"$group": {"_id": {"barrio": "$Barrio", "value": {"$ifNull": [f"${field}", None]}}, "count": {"$sum": 1}}},
+                {"$group": {
+                    "_id": "$_id.barrio",
+                    name: {"$push": {"value": "$_id.value", "count": "$count"}},
+                    "restaurant_count": {"$sum": "$count"}
+                }},
+                {"$match": {"_id": {"$type": "string"}}},
+                {"$merge": {"into": STATS_COLLECTION, "on": "_id", "whenMatched": "merge", "whenNotMatched": "insert"}}
+            ])
+        return pipelines
+
+    def _empty_locals_pipelines(self, match):
+        return [[
+            {"$match": match},
+            {"$group": {
+                "_id": "$Barrio",
+                "empty_locals_count": {"$sum": 1},
+                # PrecioNum is the price as EmptyLocalsSnapshot parses it (see EmptyLocalsService.ensure_numeric_prices)
+                "empty_locals_average_price": {"$avg": "$PrecioNum"}
+            }},
+            {"$match": {"_id": {"$type": "string"}}},
+            {"$merge": {"into": STATS_COLLECTION, "on": "_id", "whenMatched": "merge", "whenNotMatched": "insert"}}
+        ]]
+
+    def refresh(self, source=None, barrios=None):
+        """
+        Recalcula los agregados de source ("restaurants", "empty_locals" o ambas si es None), solo de los
+        barrios indicados o de todos si barrios es None, y después el documento de la ciudad.
+        """
+        with self._refresh_lock:
+            for name in ([source] if source is not None else SOURCES):
+                self._refresh_source(name, barrios)
+            self._refresh_city()
+            self.loaded = True
+        for callback in self._listeners:
+            callback()
+
+    def _refresh_source(self, source, barrios):
+        match = {} if barrios is None else {"Barrio": {"$in": sorted(barrios)}}
+        pipelines = self._restaurant_pipelines(match) if source == "restaurants" else self._empty_locals_pipelines(match)
+        for pipeline in pipelines:
+            self.db[source].aggregate(pipeline)
+
+        # $merge only writes the neighborhoods that still have documents: reset the ones left without any
+        present = [barrio for barrio in self.db[source].distinct("Barrio", match) if isinstance(barrio, str)]
+        scope = {"$type": "string"} if barrios is None else {"$in": sorted(barrios)}
+        if source == "restaurants":
+            empty = {"restaurant_count": 0, "cuisine_counts": [], "price_counts": []}
+        else:
+            empty = {"empty_locals_count": 0, "empty_locals_average_price": None}
+        self.collection.update_many({"_id": {**scope, "$nin": present}}, {"$set": empty})
+        self.collection.delete_many({
+            "_id": {"$type": "string"},
+            "restaurant_count": {"$in": [0, None]},
+            "empty_locals_count": {"$in": [0, None]}
+        })
+
+    def _refresh_city(self):
+        neighborhoods = list(self.collection.find({"_id": {"$type": "string"}}))
+        prices = {entry["value"] for stats in neighborhoods for entry in stats.get("price_counts", [])}
+        cuisines = {entry["value"] for stats in neighborhoods for entry in stats.get("cuisine_counts", [])}
+        with_locals = [stats for stats in neighborhoods if stats.get("empty_locals_count")]
+        counts = sorted(with_locals, key=lambda stats: -stats["empty_locals_count"])
+        priced = sorted(
+            with_locals,
+            key=lambda stats: (stats.get("empty_locals_average_price") is None, -(stats.get("empty_locals_average_price") or 0))
+        )
+        self.collection.replace_one({"_id": CITY_ID}, {
+            "price_categories": sorted(prices, key=_value_order),
+            "cuisine_categories": sorted(cuisines, key=_value_order),
+            "empty_locals_counts": [{"Barrio": stats["_id"], "count": stats["empty_locals_count"]} for stats in counts],
+            "average_prices": [
+                {"Barrio": stats["_id"], "average_price": stats.get("empty_locals_average_price")} for stats in priced
+            ]
+        }, upsert=True)
+
+    def apply_changes(self, pending):
+        """ Aplica {source: barrios afectados o None (recalcular todos)} acumulado a partir de los cambios """
+        for source, barrios in pending.items():
+            if barrios is None or barrios:
+                self.refresh(source, barrios)
+
+    def start(self, watch=True):
+        """ Construye la colección y arranca la actualización incremental con change streams """
+        try:
+            self.refresh()
+        except PyMongoError as e:
+            logging.error(f"Could not build {STATS_COLLECTION}, falling back to aggregations: {str(e)}")
+        if watch:
+            self.start_watching()
+
+    def start_watching(self):
+        # Threads do not survive fork(): a preloaded worker sees the parent's Thread object but not the thread
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch_changes, name="neighborhood-stats-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch_changes(self):
+        # Pre-images tell which neighborhood a deleted or moved document belonged to; without them that
+        # change falls back to recalculating every neighborhood of its collection
+        for source in SOURCES:
+            try:
+                self.db.command("collMod", source, changeStreamPreAndPostImages={"enabled": True})
+            except PyMongoError as e:
+                logging.info(f"Change stream pre-images not enabled on {source}: {str(e)}")
+        pipeline = [{"$match": {"$or": [{"ns.coll": {"$in": list(SOURCES)}}, {"to.coll": {"$in": list(SOURCES)}}]}}]
+        try:
+            with self.db.watch(
+                pipeline, full_document="updateLookup", full_document_before_change="whenAvailable", max_await_time_ms=1000
+            ) as stream:
+                pending = {}
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        self._collect(change, pending)  # Drain the burst before refreshing once
+                        continue
+                    if pending:
+                        self.apply_changes(pending)
+                        pending = {}
+        except PyMongoError as e:
+            logging.warning(f"{STATS_COLLECTION} change stream unavailable, automatic refresh disabled: {str(e)}")
+
+    def _collect(self, change, pending):
+        """ Añade a pending los barrios afectados por un evento del change stream """
+        source = change.get("to", {}).get("coll") or change["ns"]["coll"]
+        if source not in SOURCES:
+            return
+        barrios = self._changed_barrios(change)
+        if barrios is None or pending.get(source, set()) is None:
+            pending[source] = None
+        else:
+            pending.setdefault(source, set()).update(barrios)
+
+    def _changed_barrios(self, change):
+        """ Barrios antes y después del cambio, o None si no se pueden saber (drop, rename, sin pre-image...) """
+        operation = change["operationType"]
+        after = change.get("fullDocument")
+        before = change.get("fullDocumentBeforeChange")
+        barrios = set()
+        if operation in ("insert", "update", "replace"):
+            if after is None:
+                return None  # Deleted before the lookup
+            barrios.add(after.get("Barrio"))
+        if operation in ("update", "replace", "delete"):
+            if before is not None:
+                barrios.add(before.get("Barrio"))
+            elif operation == "update":
+                description = change.get("updateDescription", {})
+                if "Barrio" in description.get("updatedFields", {}) or "Barrio" in description.get("removedFields", []):
+                    return None
+            else:
+                return None
+        if operation not in ("insert", "update", "replace", "delete"):
+            return None
+        return {barrio for barrio in barrios if isinstance(barrio, str)}
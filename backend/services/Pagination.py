@@ -0,0 +1,151 @@
+from flask import Response, current_app, stream_with_context
+from bson import ObjectId
+from bson.errors import InvalidId
+
+MAX_PAGE_SIZE = 5000
+CHUNK_SIZE = 64 * 1024  # Bytes buffered before each write of the streamed body
+STREAM_FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson"
+}
+
+
+def json_encoder(provider):
+    """ Función obj -> bytes con el proveedor JSON de la app (usa dumps_bytes si lo tiene) """
+    if hasattr(provider, "dumps_bytes"):
+        return provider.dumps_bytes
+    return lambda obj: provider.dumps(obj).encode("utf-8")
+
+
+def parse_page_args(args):
+    """ Lee limit / after / format de la query string; lanza ValueError si no son válidos """
+    limit = args.get('limit')
+    after = args.get('after')
+    stream_format = args.get('format', 'json')
+    if stream_format not in STREAM_FORMATS:
+        raise ValueError(f"Invalid format: {stream_format}")
+    if limit is not None:
+        limit = int(limit)
+        if limit <= 0 or limit > MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if after is not None:
+        try:
+            after = ObjectId(after)
+        except (InvalidId, TypeError):
+            raise ValueError(f"Invalid cursor: {after}")
+    return {"limit": limit, "after": after, "stream_format": stream_format}
+
+
+def keyset_query(query, after):
+    """ Añade la condición de keyset pagination sobre _id a la consulta """
+    if after is None:
+        return query
+    return {"$and": [query, {"_id": {"$gt": after}}]} if query else {"_id": {"$gt": after}}
+
+
+def cursor_response(cursor, to_row, limit=None, stream_format="json"):
+    """
+    Respuesta a partir de un cursor de PyMongo ordenado por _id.
+    Sin limit se transmite en streaming (array JSON o NDJSON) sin cargar la colección en memoria;
+    con limit se devuelve una página y el cursor de la siguiente en la cabecera X-Next-Cursor.
+    to_row convierte cada documento en la fila de salida, o devuelve None para descartarlo.
+    """
+    encode = json_encoder(current_app.json)
+    mimetype = STREAM_FORMATS[stream_format]
+
+    if limit is None:
+        rows = (row for row in map(to_row, cursor) if row is not None)
+        chunks = _ndjson_chunks(rows, encode) if stream_format == "ndjson" else _json_array_chunks(rows, encode)
+        return Response(stream_with_context(_buffered(chunks)), mimetype=mimetype)
+
+    rows = []
+    last_id = None
+    fetched = 0
+    for document in cursor.limit(limit):
+        fetched += 1
+        last_id = document.get("_id")
+        row = to_row(document)
+        if row is not None:
+            rows.append(row)
+    chunks = _ndjson_chunks(rows, encode) if stream_format == "ndjson" else _json_array_chunks(rows, encode)
+    response = Response(b"".join(chunks), mimetype=mimetype)
+    if fetched == limit and last_id is not None:
+        response.headers["X-Next-Cursor"] = str(last_id)
+    return response
+
+
+def rows_response(rows, stream_format="ndjson"):
+    """ Respuesta en streaming de un iterable de filas; cada fila se envía en cuanto está disponible """
+    encode = json_encoder(current_app.json)
+    chunks = _ndjson_chunks(rows, encode) if stream_format == "ndjson" else _json_array_chunks(rows, encode)
+    return Response(stream_with_context(chunks), mimetype=STREAM_FORMATS[stream_format])
+
+
+def _buffered(chunks):
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _json_array_chunks(rows, encode):
+    yield b"["
+    separator = b""
+    for row in rows:
+        yield separator + encode(row)
+        separator = b","
+    yield b"]"
+
+
+def _ndjson_chunks(rows, encode):
+    for row in rows:
+        yield encode(row) + b"\n"
+
+
+async def async_cursor_chunks(cursor, to_row, encode, stream_format="json"):
+    """ Versión asíncrona del cuerpo en streaming de cursor_response, para un cursor de AsyncMongoClient """
+    buffer = [b"["] if stream_format == "json" else []
+    size = 0
+    separator = b""
+    async for document in cursor:
+        row = to_row(document)
+        if row is None:
+            continue
+        if stream_format == "ndjson":
+            chunk = encode(row) + b"\n"
+        else:
+            chunk = separator + encode(row)
+            separator = b","
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if stream_format == "json":
+        buffer.append(b"]")
+    if buffer:
+        yield b"".join(buffer)
+
+
+async def async_cursor_page(cursor, to_row, encode, limit, stream_format="json"):
+    """ Página de un cursor asíncrono: (cuerpo, cursor de la siguiente página o None) """
+    rows = []
+    last_id = None
+    fetched = 0
+    async for document in cursor.limit(limit):
+        fetched += 1
+        last_id = document.get("_id")
+        row = to_row(document)
+        if row is not None:
+            rows.append(row)
+    chunks = _ndjson_chunks(rows, encode) if stream_format == "ndjson" else _json_array_chunks(rows, encode)
+    next_cursor = str(last_id) if fetched == limit and last_id is not None else None
+    return b"".join(chunks), next_cursor
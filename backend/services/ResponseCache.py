@@ -0,0 +1,219 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import Response, make_response, request
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+CachedResponse = namedtuple("CachedResponse", ["body", "mimetype", "etag"])
+
+
+class DatasetVersion:
+    """ Versión de los datasets (colección dataset_versions); se incrementa con bump() en cada recarga de datos """
+
+    def __init__(self, mongo, check_interval=5.0):
+        self.versions_collection = mongo.db['dataset_versions']
+        self.check_interval = check_interval  # Seconds before re-reading a bump made by another process
+        self._version = None
+        self._checked_at = 0.0
+        self._watcher = None
+
+    def current(self):
+        if self._watcher is not None and self._watcher.is_alive():
+            # The watcher only moves the version once the in-memory copies are reloaded (see watch)
+            return self._version
+        now = time.monotonic()
+        if self._version is None or now - self._checked_at >= self.check_interval:
+            try:
+                self._version = self._read()
+            except PyMongoError as e:
+                logging.warning(f"Could not read dataset version: {str(e)}")
+                self._version = self._version or 0
+            self._checked_at = now
+        return self._version
+
+    def _read(self):
+        document = self.versions_collection.find_one({"_id": "datasets"})
+        return document["version"] if document else 0
+
+    def watch(self, on_change, since=None):
+        """
+        Comprueba la versión cada check_interval segundos en un hilo propio. Cuando otro proceso (ingest.py) la
+        incrementa llama a on_change() para recargar las copias en memoria de los datasets, y solo entonces
+        current() devuelve la nueva versión: la caché no guarda respuestas de la nueva versión con datos viejos.
+        since es la versión con la que se cargaron esas copias (por defecto, la actual).
+        """
+        if since is not None:
+            self._version = since
+        elif self._version is None:
+            self.current()
+        # Threads do not survive fork(): a preloaded worker sees the parent's Thread object but not the thread
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(
+                target=self._watch_version, args=(on_change,), name="dataset-version-watcher", daemon=True
+            )
+            self._watcher.start()
+
+    def _watch_version(self, on_change):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                version = self._read()
+            except PyMongoError as e:
+                logging.warning(f"Could not read dataset version: {str(e)}")
+                continue
+            if version == self._version:
+                continue
+            try:
+                on_change()
+            except Exception as e:
+                logging.error(f"Could not reload the datasets of version {version}: {str(e)}")
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def bump(self):
+        document = self.versions_collection.find_one_and_update(
+            {"_id": "datasets"},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._version = document["version"]
+        self._checked_at = time.monotonic()
+        return self._version
+
+
+class MemoryBackend:
+    """ LRU en memoria con TTL por entrada """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """ Backend compartido entre procesos (requiere el paquete redis) """
+
+    def __init__(self, url, prefix="urban_insight:cache:"):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        mimetype, etag, body = raw.split(b"\n", 2)
+        return CachedResponse(body, mimetype.decode(), etag.decode())
+
+    def set(self, key, value, ttl):
+        raw = value.mimetype.encode() + b"\n" + value.etag.encode() + b"\n" + value.body
+        self.client.set(self.prefix + key, raw, ex=int(ttl))
+
+
+class ResponseCache:
+    """
+    Caché de respuestas de las rutas de solo lectura.
+    La clave incluye la ruta, sus argumentos normalizados, la versión de los datasets y una generación local,
+    así que un DatasetVersion.bump() o un invalidate() invalidan todas las entradas; el TTL solo es un límite de seguridad.
+    """
+
+    def __init__(self, version, maxsize=512, ttl=3600, shared_backend=None):
+        self.version = version
+        self.ttl = ttl
+        self.local = MemoryBackend(maxsize)
+        self.shared = shared_backend
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self._generation = 0
+
+    def invalidate(self, *_):
+        """
+        Descarta las respuestas guardadas cuando los datos cambian sin un bump() (las recargas de los change streams).
+        Acepta y descarta los argumentos para poder registrarse directamente como listener de los servicios.
+        """
+        with self._stats_lock:
+            self._generation += 1
+        self.local.clear()
+
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = self._key(request.endpoint, kwargs, request.args)
+            entry = self._get(key)
+            self._record(request.endpoint, hit=entry is not None)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = CachedResponse(body, response.mimetype, hashlib.sha1(body).hexdigest())
+                self._set(key, entry)
+            response = Response(entry.body, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            return response.make_conditional(request)
+        return wrapper
+
+    def hit_stats(self):
+        with self._stats_lock:
+            return {endpoint: dict(counts) for endpoint, counts in self.stats.items()}
+
+    def _key(self, endpoint, view_args, query_args):
+        normalized = repr((
+            endpoint,
+            sorted(view_args.items()),
+            sorted(query_args.items(multi=True)),
+        ))
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        return f"{self.version.current()}.{self._generation}:{digest}"
+
+    def _get(self, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                logging.warning(f"Shared cache unavailable: {str(e)}")
+            if entry is not None:
+                self.local.set(key, entry, self.ttl)
+        return entry
+
+    def _set(self, key, entry):
+        self.local.set(key, entry, self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, entry, self.ttl)
+            except Exception as e:
+                logging.warning(f"Shared cache unavailable: {str(e)}")
+
+    def _record(self, endpoint, hit):
+        with self._stats_lock:
+            counts = self.stats.setdefault(endpoint, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
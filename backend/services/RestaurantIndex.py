@@ -0,0 +1,160 @@
+import logging
+import math
+import threading
+import numpy as np
+from pymongo.errors import PyMongoError
+
+# MongoDB uses this radius for spherical distances ($near / $geoNear with GeoJSON points)
+EARTH_RADIUS_METERS = 6378100.0
+
+INDEX_PROJECTION = {
+    "_id": 0,
+    "Nombre": 1,
+    "Categoría Cocina": 1,
+    "Nota": 1,
+    "Categoría Precio": 1,
+    "Accesibilidad": 1,
+    "Geometry.coordinates": 1
+}
+
+
+def haversine_distance(lat, lon, lats, lons):
+    """ Distancia esférica en metros entre un punto y arrays de puntos (grados); lat/lon también pueden ser arrays, por pares """
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons) - np.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class RestaurantIndex:
+    """ Índice espacial en memoria (rejilla lon/lat) sobre Geometry.coordinates de restaurants """
+
+    def __init__(self, mongo, cell_size=0.005):
+        self.restaurants_collection = mongo.db['restaurants']
+        self.cell_size = cell_size  # Degrees, ~550 m of latitude in Barcelona
+        self.loaded = False
+        self._snapshot = ([], np.empty(0), np.empty(0), {})
+        self._load_lock = threading.Lock()
+        self._watcher = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """ Registra callback(documents, lons, lats), llamado tras cada carga del índice """
+        self._listeners.append(callback)
+        if self.loaded:
+            callback(*self._snapshot[:3])
+
+    def load(self):
+        with self._load_lock:
+            self._load()
+
+    def _load(self):
+        documents = []
+        lons = []
+        lats = []
+        for restaurant in self.restaurants_collection.find({}, INDEX_PROJECTION):
+            coordinates = restaurant.get("Geometry", {}).get("coordinates")
+            if not isinstance(coordinates, (list, tuple)) or len(coordinates) != 2:
+                continue
+            lon, lat = coordinates
+            if not isinstance(lon, (int, float)) or not isinstance(lat, (int, float)):
+                continue
+            documents.append(restaurant)
+            lons.append(lon)
+            lats.append(lat)
+
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        cells = {}
+        if len(documents):
+            keys = np.stack([np.floor(lons / self.cell_size), np.floor(lats / self.cell_size)], axis=1).astype(np.int64)
+            unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+            order = np.argsort(inverse.ravel(), kind="stable")
+            bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(unique_keys)))
+            for cell, members in zip(map(tuple, unique_keys.tolist()), np.split(order, bounds[:-1])):
+                cells[cell] = members
+
+        # Swap the whole snapshot at once so concurrent readers never see a half-built index
+        self._snapshot = (documents, lons, lats, cells)
+        self.loaded = True
+        logging.info(f"Restaurant index loaded with {len(documents)} restaurants in {len(cells)} cells")
+        for callback in self._listeners:
+            callback(documents, lons, lats)
+
+    def query_radius(self, lat, lon, max_distance):
+        """ Devuelve (documentos, distancias) dentro de max_distance metros, ordenados por distancia como $near """
+        documents, members, distances = self.query_members(lat, lon, max_distance)
+        return [documents[i] for i in members], distances
+
+    def query_members(self, lat, lon, max_distance):
+        """ (documentos del índice, posiciones de los que están dentro de max_distance metros, distancias), por distancia """
+        documents, lons, lats, cells = self._snapshot
+        candidates = self._candidates(cells, lat, lon, max_distance)
+        if not len(candidates):
+            return documents, np.empty(0, dtype=np.int64), np.empty(0)
+        distances = haversine_distance(lat, lon, lats[candidates], lons[candidates])
+        inside = distances <= max_distance
+        candidates = candidates[inside]
+        distances = distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return documents, candidates[order], distances[order]
+
+    def points(self):
+        """ Arrays (lons, lats) de todos los restaurantes indexados """
+        _, lons, lats, _ = self._snapshot
+        return lons, lats
+
+    def _candidates(self, cells, lat, lon, max_distance):
+        dlat = math.degrees(max_distance / EARTH_RADIUS_METERS)
+        max_lat = min(abs(lat) + dlat, 89.9)
+        dlon = dlat / math.cos(math.radians(max_lat))
+        min_x = math.floor((lon - dlon) / self.cell_size)
+        max_x = math.floor((lon + dlon) / self.cell_size)
+        min_y = math.floor((lat - dlat) / self.cell_size)
+        max_y = math.floor((lat + dlat) / self.cell_size)
+        members = [
+            cells[(x, y)]
+            for x in range(min_x, max_x + 1)
+            for y in range(min_y, max_y + 1)
+            if (x, y) in cells
+        ]
+        if not members:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(members)
+
+    def start(self, watch=True):
+        """ Carga el índice y arranca la recarga automática cuando cambia la colección """
+        try:
+            self.load()
+        except PyMongoError as e:
+            logging.error(f"Could not load restaurant index, falling back to MongoDB queries: {str(e)}")
+        if watch:
+            self.start_watching()
+
+    def start_watching(self):
+        # Threads do not survive fork(): a preloaded worker sees the parent's Thread object but not the thread
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch_changes, name="restaurant-index-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch_changes(self):
+        # Change streams need a replica set; on a standalone server the index only reloads on start()/load()
+        # (and after ingest.py, through DatasetVersion). The stream is database-level: a collection-level one is
+        # invalidated when ingest.py drops restaurants or renames its staging collection over it
+        name = self.restaurants_collection.name
+        pipeline = [{"$match": {"$or": [{"ns.coll": name}, {"to.coll": name}]}}]
+        try:
+            with self.restaurants_collection.database.watch(pipeline, max_await_time_ms=1000) as stream:
+                pending = False
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        pending = True  # Drain the burst before reloading once
+                        continue
+                    if pending:
+                        self.load()
+                        pending = False
+        except PyMongoError as e:
+            logging.warning(f"Restaurant index change stream unavailable, automatic refresh disabled: {str(e)}")
@@ -1,249 +1,527 @@
 from flask import jsonify
-import re
 import logging
-from numpy import histogram
 import math
-from collections import Counter
-from shapely.geometry import Point, Polygon
-from pyproj import Transformer
-transformer = Transformer.from_crs("EPSG:32631", "EPSG:4326", always_xy=True)  # Asegúrate de usar el código UTM correcto
+import itertools
+from collections import namedtuple
+import numpy as np
+import shapely
+from shapely import STRtree
+from services.Pagination import cursor_response, keyset_query
+from services.GeometryStore import geometry_shape, utm_to_wgs84_array, transformer
+from services.IndexManager import QueryCheck
+from services.HistogramEngine import (
+    N_RATING_BINS, HistogramEngine, as_float, decay_weights, rating_bins, rating_histogram
+)
+from services.NeighborhoodStats import price_categories_result, restaurant_profile_result, top_cuisine_types_result
+from pymongo import ASCENDING, GEOSPHERE, IndexModel
+
+
+
+
+
+NEIGHBOURS_RADIUS = 500  # Meters around the clicked point
+MAX_RADIUS = 5000  # Meters; upper bound for every radius query
+MAX_NEARBY_RESULTS = 1000
+MIN_DECAY = 1  # Meters; lower bound for decay
+# Halvings of the decay weight allowed within the radius: 2 ** -1000 is still a normal float, so the weights of
+# every competitor inside the radius never underflow to 0 (a site with only zero weights has no histogram)
+MAX_DECAY_HALVINGS = 1000
+MAX_BATCH_SITES = 5000
+RESTAURANT_LIST_PROJECTION = {
+    "Nombre": 1,
+    "Tipo": 1,
+    "Categoría Cocina": 1,
+    "Nota": 1,
+    "Nº Reseñas": 1,
+    "Precio": 1,
+    "Categoría Precio": 1,
+    "Accesibilidad": 1,
+    "Barrio": 1,
+    "Dirección": 1,
+    "Geometry.coordinates": 1
+}
+# Campo de la respuesta de nearby -> campo del documento que hay que proyectar
+NEARBY_FIELDS = {
+    "name": "Nombre",
+    "lat": "Geometry.coordinates",
+    "lon": "Geometry.coordinates",
+    "type": "Categoría Cocina",
+    "rating": "Nota",
+    "price": "Categoría Precio",
+}
+
+# Radio, filtros, número máximo de resultados, campos y decaimiento por distancia de las consultas por proximidad
+# (ver parse_geo_args)
+GeoFilters = namedtuple(
+    "GeoFilters", ["radius", "cuisines", "prices", "min_rating", "limit", "fields", "decay"],
+    defaults=[NEIGHBOURS_RADIUS, None, None, None, MAX_NEARBY_RESULTS, None, None]
+)
+
+
+def parse_geo_args(args):
+    """
+    radius, cuisine, price, min_rating, limit, fields y decay de la query string (cuisine, price y fields admiten
+    varios valores separados por comas o repetidos). Lanza ValueError si no son válidos.
+    """
+    def number(name, default, cast=float):
+        value = args.get(name)
+        if value is None or value == "":
+            return default
+        try:
+            return cast(value)
+        except ValueError:
+            raise ValueError(f"Invalid {name}")
+
+    def values(name):
+        items = [item.strip() for value in args.getlist(name) for item in value.split(",") if item.strip()]
+        return items or None
+
+    radius = number("radius", NEIGHBOURS_RADIUS)
+    if not 0 < radius <= MAX_RADIUS:
+        raise ValueError(f"radius must be between 0 and {MAX_RADIUS} meters")
+    limit = number("limit", MAX_NEARBY_RESULTS, int)
+    if not 0 < limit <= MAX_NEARBY_RESULTS:
+        raise ValueError(f"limit must be between 1 and {MAX_NEARBY_RESULTS}")
+    min_rating = number("min_rating", None)
+    if min_rating is not None and math.isnan(min_rating):
+        raise ValueError("Invalid min_rating")
+    fields = values("fields")
+    unknown = sorted(set(fields or []) - set(NEARBY_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    # Meters at which a competitor weighs half in the competitor histograms (none: every competitor weighs 1)
+    decay = number("decay", None)
+    min_decay = max(MIN_DECAY, radius / MAX_DECAY_HALVINGS)
+    if decay is not None and not min_decay <= decay <= MAX_RADIUS:
+        raise ValueError(f"decay must be between {min_decay:g} and {MAX_RADIUS} meters")
+    return GeoFilters(radius, values("cuisine"), values("price"), min_rating, limit, fields, decay)
+
+
+def parse_sites(body, locations_by_neighborhood=None):
+    """
+    Puntos y radio del cuerpo de una petición de competidores por lotes:
+    {"points": [{"lat", "lon", "id"?} | [lat, lon], ...] | "neighborhood": nombre, "radius": metros}, o solo la
+    lista de puntos (con el radio por defecto). Con neighborhood, locations_by_neighborhood(nombre) da los puntos.
+    Lanza ValueError si no es válido.
+    """
+    if isinstance(body, list):
+        body = {"points": body}
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object or a list of points")
+    radius = body.get("radius", NEIGHBOURS_RADIUS)
+    if isinstance(radius, bool) or not isinstance(radius, (int, float)) or not 0 < radius <= MAX_RADIUS:
+        raise ValueError(f"radius must be between 0 and {MAX_RADIUS} meters")
+
+    if body.get("neighborhood") is not None and locations_by_neighborhood is not None:
+        sites = locations_by_neighborhood(str(body["neighborhood"]))
+    elif isinstance(body.get("points"), list):
+        sites = []
+        for i, point in enumerate(body["points"]):
+            if isinstance(point, dict):
+                site = {"id": point.get("id", i), "lat": point.get("lat"), "lon": point.get("lon")}
+            elif isinstance(point, (list, tuple)) and len(point) == 2:
+                site = {"id": i, "lat": point[0], "lon": point[1]}
+            else:
+                raise ValueError(f"Invalid point at position {i}")
+            try:
+                site["lat"] = float(site["lat"])
+                site["lon"] = float(site["lon"])
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid latitude or longitude at position {i}")
+            if not (-90 <= site["lat"] <= 90 and -180 <= site["lon"] <= 180):
+                raise ValueError(f"Invalid latitude or longitude at position {i}")
+            sites.append(site)
+    else:
+        raise ValueError("Missing points or neighborhood")
+    if len(sites) > MAX_BATCH_SITES:
+        raise ValueError(f"At most {MAX_BATCH_SITES} points per request")
+    return sites, float(radius)
 
 
+class RestaurantService:
+    # Índices que necesitan las consultas del servicio (los crea IndexManager)
+    INDEXES = {
+        "restaurants": [
+            IndexModel([("Geometry.coordinates", GEOSPHERE)], name="Geometry.coordinates_2dsphere"),
+            IndexModel([("Barrio", ASCENDING)], name="Barrio_1"),
+        ]
+    }
 
+    def __init__(self, mongo, index=None, tiles=None, geometry_store=None, stats=None):
+        self.restaurants_collection = mongo.db['restaurants']
+        self.demographics_collection = mongo.db['demographic_info']
+        # Optional in-memory RestaurantIndex; radius queries go to MongoDB until it is loaded
+        self.index = index
+        # Optional CompetitorTiles with per-cell partial aggregates for get_neighbours_competitors
+        self.tiles = tiles
+        # Optional GeometryStore with the neighborhood polygons already in WGS84
+        self.geometry_store = geometry_store
+        # Optional NeighborhoodStats; the per-neighborhood rollups are aggregated on demand until it is built
+        self.stats = stats
+        self._histogram_engine = None
+
+    def _use_index(self):
+        return self.index is not None and self.index.loaded
+
+    def _use_stats(self):
+        return self.stats is not None and self.stats.loaded
+
+    def query_checks(self, sample):
+        """ Consultas del servicio que deben usar un índice (ver IndexManager.verify) """
+        lat, lon, barrio = sample["lat"], sample["lon"], sample["neighborhood"]
+        return [
+            QueryCheck("nearby_restaurants", "restaurants", self._nearby_query(lat, lon), None),
+            QueryCheck("neighbours_competitors", "restaurants", None, self._competitors_pipeline(lat, lon)),
+            QueryCheck("restaurant_count_by_neighborhood", "restaurants", {"Barrio": barrio}, None),
+            QueryCheck("top_5_cuisine_types_by_neighborhood", "restaurants", None, self._top_cuisine_types_pipeline(barrio, 5)),
+            QueryCheck("price_categories_by_neighborhood", "restaurants", None, self._price_categories_pipeline(barrio)),
+            QueryCheck("neighborhood_profile", "restaurants", None, self._neighborhood_profile_pipeline(barrio)),
+        ]
 
+    def get_nearby_restaurants(self, lat, lon, filters=GeoFilters()):
+        if self._use_index():
+            nearby_restaurants = self._nearby_from_index(lat, lon, filters)
+        else:
+            nearby_restaurants = list(
+                self.restaurants_collection.find(self._nearby_query(lat, lon, filters), self._nearby_projection(filters))
+                .limit(filters.limit)
+            )
+        response = [self._nearby_row(restaurant, filters.fields) for restaurant in nearby_restaurants]
+        return jsonify(response)
 
-class RestaurantService:
-    def __init__(self, mongo):
-        self.restaurants_collection = mongo.db['restaurants']
+    def _nearby_from_index(self, lat, lon, filters):
+        # query_radius returns the restaurants sorted by distance, like $near
+        nearby_restaurants, _ = self.index.query_radius(lat, lon, filters.radius)
+        matching = (restaurant for restaurant in nearby_restaurants if self._matches(restaurant, filters))
+        return list(itertools.islice(matching, filters.limit))
 
-    def get_nearby_restaurants(self, lat, lon):
-        query = {
+    def _nearby_query(self, lat, lon, filters=GeoFilters()):
+        return {
             "Geometry.coordinates": {
                 "$near": {
                     "$geometry": {
                         "type": "Point",
                         "coordinates": [lon, lat]
                     },
-                    "$maxDistance": 500
+                    "$maxDistance": filters.radius
                 }
-            }
+            },
+            **self._filters_query(filters)
         }
-        nearby_restaurants = list(self.restaurants_collection.find(query))
-        response = [
-            {
-                "name": restaurant["Nombre"],
-                "lat": restaurant["Geometry"]["coordinates"][1],
-                "lon": restaurant["Geometry"]["coordinates"][0],
-                "type": restaurant.get("Categoría Cocina", "N/A"),
-                "rating": restaurant.get("Nota", "N/A"),
-                "price": restaurant.get("Categoría Precio", "N/A")
-            }
-            for restaurant in nearby_restaurants
-        ]
-        return jsonify(response)
 
-    def get_restaurants(self):
-        restaurants = self.restaurants_collection.find({}, {
-            "Nombre": 1,
-            "Tipo": 1,
-            "Categoría Cocina": 1,
-            "Nota": 1,
-            "Nº Reseñas": 1,
-            "Precio": 1,
-            "Categoría Precio": 1,
-            "Accesibilidad": 1,
-            "Barrio": 1,
-            "Dirección": 1,
-            "Geometry.coordinates": 1
-        })
-        restaurant_list = []
-        for restaurant in restaurants:
-            restaurant_list.append({
-                "Nombre": restaurant.get("Nombre"),
-                "Tipo": restaurant.get("Tipo"),
-                "Categoría Cocina": restaurant.get("Categoría Cocina"),
-                "Nota": restaurant.get("Nota"),
-                "Nº Reseñas": restaurant.get("Nº Reseñas"),
-                "Precio": restaurant.get("Precio"),
-                "Categoría Precio": restaurant.get("Categoría Precio"),
-                "Accesibilidad": restaurant.get("Accesibilidad"),
-                "Barrio": restaurant.get("Barrio"),
-                "Dirección": restaurant.get("Dirección"),
-                "Coordinates": restaurant.get("Geometry", {}).get("coordinates", [])
-            })
-        return jsonify(restaurant_list)
-    
+    def _nearby_projection(self, filters):
+        fields = filters.fields or NEARBY_FIELDS
+        return {"_id": 0, **{NEARBY_FIELDS[field]: 1 for field in fields}}
+
+    def _filters_query(self, filters):
+        """ Condiciones de cocina, precio y nota mínima que se añaden a la consulta geográfica """
+        query = {}
+        if filters.cuisines is not None:
+            query["Categoría Cocina"] = {"$in": filters.cuisines}
+        if filters.prices is not None:
+            query["Categoría Precio"] = {"$in": filters.prices}
+        if filters.min_rating is not None:
+            query["Nota"] = {"$gte": filters.min_rating}
+        return query
+
+    def _matches(self, restaurant, filters):
+        """ Misma semántica que _filters_query para los documentos del índice en memoria """
+        if filters.cuisines is not None and restaurant.get("Categoría Cocina") not in filters.cuisines:
+            return False
+        if filters.prices is not None and restaurant.get("Categoría Precio") not in filters.prices:
+            return False
+        if filters.min_rating is not None:
+            rating = restaurant.get("Nota")
+            if isinstance(rating, bool) or not isinstance(rating, (int, float)) or not rating >= filters.min_rating:
+                return False
+        return True
+
+    def _nearby_row(self, restaurant, fields=None):
+        coordinates = restaurant.get("Geometry", {}).get("coordinates", [None, None])
+        row = {
+            "name": restaurant.get("Nombre"),
+            "lat": coordinates[1],
+            "lon": coordinates[0],
+            "type": restaurant.get("Categoría Cocina", "N/A"),
+            "rating": restaurant.get("Nota", "N/A"),
+            "price": restaurant.get("Categoría Precio", "N/A")
+        }
+        return row if fields is None else {field: row[field] for field in fields}
+
+    def get_restaurants(self, limit=None, after=None, stream_format="json"):
+        restaurants = self.restaurants_collection.find(keyset_query({}, after), RESTAURANT_LIST_PROJECTION)
+        if limit is not None or after is not None:
+            restaurants = restaurants.sort("_id", 1)
+        return cursor_response(restaurants, self._restaurant_row, limit, stream_format)
+
+    def _restaurant_row(self, restaurant):
+        return {
+            "Nombre": restaurant.get("Nombre"),
+            "Tipo": restaurant.get("Tipo"),
+            "Categoría Cocina": restaurant.get("Categoría Cocina"),
+            "Nota": restaurant.get("Nota"),
+            "Nº Reseñas": restaurant.get("Nº Reseñas"),
+            "Precio": restaurant.get("Precio"),
+            "Categoría Precio": restaurant.get("Categoría Precio"),
+            "Accesibilidad": restaurant.get("Accesibilidad"),
+            "Barrio": restaurant.get("Barrio"),
+            "Dirección": restaurant.get("Dirección"),
+            "Coordinates": restaurant.get("Geometry", {}).get("coordinates", [])
+        }
 
 
 
-    def get_neighbours_competitors(self, lat, lon):
-        query_pipeline = [
+
+    def get_neighbours_competitors(self, lat, lon, filters=GeoFilters()):
+        stats = self._neighbours_competitors(lat, lon, filters)
+        if stats is None:
+            return jsonify({"error": "No nearby competitors found"}), 404
+        return jsonify(stats)
+
+    def _neighbours_competitors(self, lat, lon, filters=GeoFilters()):
+        """ Estadísticas de competidores en el radio que cumplen los filtros, o None si no hay ninguno """
+        if self.tiles is not None and self.tiles.loaded:
+            return self.tiles.competitor_stats(
+                lat, lon, filters.radius, filters.cuisines, filters.prices, filters.min_rating, filters.decay
+            )
+        if self._use_index():
+            return self._competitors_from_index(lat, lon, filters)
+        return self._competitors_from_facets(self._group_competitors_from_mongo(lat, lon, filters))
+
+    def _group_competitors_from_mongo(self, lat, lon, filters=GeoFilters()):
+        # Run the aggregation query
+        return list(self.restaurants_collection.aggregate(self._competitors_pipeline(lat, lon, filters)))
+
+    def _competitors_pipeline(self, lat, lon, filters=GeoFilters()):
+        # Only counts per value leave the $facet, so the result size does not grow with the radius
+        weight = self._decay_weight(filters)
+        return [
             {
                 "$geoNear": {
                     "near": {"type": "Point", "coordinates": [lon, lat]},
                     "distanceField": "distancia",  # Field where distance will be stored
-                    "maxDistance": 500,  # Maximum distance in meters
+                    "maxDistance": filters.radius,  # Maximum distance in meters
+                    "query": self._filters_query(filters),
                     "spherical": True,  # Spherical calculation
                     "key": "Geometry.coordinates"  # Specify which index to use
                 }
             },
             {
-                "$project": {
-                    "_id": 0,
-                    "Categoría Cocina": 1,
-                    "Nota": 1,
-                    "Categoría Precio": 1,
-                    "Accesibilidad": 1
-                }
-            },
-            {
-                "$group": {
-                    "_id": None,
-                    "categoría_cocina": {"$push": "$Categoría Cocina"},
-                    "notas": {"$push": "$Nota"},
-                    "categoría_precio": {"$push": "$Categoría Precio"},
-                    "accesibilidad": {"$push": "$Accesibilidad"},
-                    "total_restaurants": {"$sum": 1}  # Count the number of restaurants
+                "$facet": {
+                    "total": [{"$count": "n"}],
+                    "categoría_cocina": [
+                        {"$match": {"Categoría Cocina": {"$exists": True}}},
+                        {"$group": {"_id": "$Categoría Cocina", "n": {"$sum": weight}}}
+                    ],
+                    "categoría_precio": [
+                        {"$match": {"Categoría Precio": {"$exists": True}}},
+                        {"$group": {"_id": "$Categoría Precio", "n": {"$sum": weight}}}
+                    ],
+                    "notas": [
+                        {"$match": {"Nota": {"$exists": True}}},
+                        {"$group": {"_id": "$Nota", "n": {"$sum": weight}}}
+                    ],
+                    "accesibilidad": [
+                        {"$match": {"Accesibilidad": {"$type": "number"}}},
+                        *self._accessibility_stages(weight)
+                    ]
                 }
             }
         ]
 
-        # Run the aggregation query
-        result = list(self.restaurants_collection.aggregate(query_pipeline))
-
-        # Handle empty result
-        if not result:
-            return jsonify({"error": "No nearby competitors found"}), 404
-
-        restaurant_data = result[0]
-        number_of_restaurants = restaurant_data.get("total_restaurants", 0)
-        category_histogram = self.calculate_histogram(restaurant_data.get("categoría_cocina", []))
-        price_histogram = self.calculate_histogram(restaurant_data.get("categoría_precio", []))
-        mark_histogram = self.calculate_histogram(restaurant_data.get("notas", []), intervals=[x * 0.5 for x in range(11)])
-
-        # Calculate minimum, average, and maximum for accessibility
-        accesibilidad_values = restaurant_data.get("accesibilidad", [])
-        accesibilidad_values = [x for x in accesibilidad_values if x is not None]  # Filtrar valores None
-        if accesibilidad_values:
-            min_accesibilidad = min(accesibilidad_values)
-            avg_accesibilidad = sum(accesibilidad_values) / len(accesibilidad_values)
-            max_accesibilidad = max(accesibilidad_values)
-        else:
-            min_accesibilidad = avg_accesibilidad = max_accesibilidad = None
-
+    def _decay_weight(self, filters):
+        # Same weight as decay_weights: 2 ** (-distance / decay) == exp(-ln 2 * distance / decay)
+        if filters.decay is None:
+            return 1
+        return {"$exp": {"$multiply": ["$distancia", -math.log(2) / filters.decay]}}
+
+    def _accessibility_stages(self, weight):
+        if weight == 1:
+            return [{"$group": {
+                "_id": None,
+                "min": {"$min": "$Accesibilidad"},
+                "avg": {"$avg": "$Accesibilidad"},
+                "max": {"$max": "$Accesibilidad"}
+            }}]
+        return [
+            {"$group": {
+                "_id": None,
+                "min": {"$min": "$Accesibilidad"},
+                "max": {"$max": "$Accesibilidad"},
+                "sum": {"$sum": {"$multiply": ["$Accesibilidad", weight]}},
+                "weight": {"$sum": weight}
+            }},
+            {"$project": {"min": 1, "max": 1, "avg": {"$divide": ["$sum", "$weight"]}}}
+        ]
 
-        return jsonify({
-            "Categoria Cocina": category_histogram,
-            "Numero de restaurantes": number_of_restaurants,
-            "Precio": price_histogram,
-            "Nota": mark_histogram,
+    def _competitors_from_facets(self, result):
+        """ Estadísticas de competidores a partir de los conteos del $facet de _competitors_pipeline """
+        facets = result[0] if result else {}
+        total = facets["total"][0]["n"] if facets.get("total") else 0
+        if not total:
+            return None
+        accesibilidad = facets["accesibilidad"][0] if facets["accesibilidad"] else {}
+        return {
+            "Categoria Cocina": self._counts_histogram(facets["categoría_cocina"]),
+            "Numero de restaurantes": total,
+            "Precio": self._counts_histogram(facets["categoría_precio"]),
+            "Nota": self._ratings_histogram(facets["notas"]),
             "Accesibilidad": {
-                "min": min_accesibilidad,
-                "avg": avg_accesibilidad,
-                "max": max_accesibilidad
+                "min": accesibilidad.get("min"),
+                "avg": accesibilidad.get("avg"),
+                "max": accesibilidad.get("max")
             }
-        })
+        }
 
-    def calculate_histogram(self, data: list, intervals=None):
-        if not data:
+    def _counts_histogram(self, counts):
+        n = sum(entry["n"] for entry in counts)
+        if not n:
             return []
-        n = len(data)
-        if isinstance(data[0], str):
-            hist = Counter(data)
-            for k in hist.keys():
-                hist[k] = float(hist[k] / n)
-            return dict(hist)
-        elif isinstance(data[0], float):
-            if intervals is None:
-                raise ValueError('If the data are numbers you must provide the intervals')
-            hist = histogram(data, bins=intervals)
-            hist_vals = [float(x / n) for x in hist[0]]
-            return (hist_vals, hist[1].tolist())
+        return {entry["_id"]: float(entry["n"] / n) for entry in counts}
+
+    def _ratings_histogram(self, counts):
+        # Every document with a rating counts in n, but only numeric ratings fall in a bin
+        ratings = np.array([as_float(entry["_id"]) for entry in counts], dtype=float)
+        bins = rating_bins(ratings)
+        valid = bins >= 0
+        weights = np.array([entry["n"] for entry in counts], dtype=float)
+        hist = np.bincount(bins[valid], weights=weights[valid], minlength=N_RATING_BINS)
+        return rating_histogram(hist, weights.sum())
+
+    def _competitors_from_index(self, lat, lon, filters=GeoFilters()):
+        documents, members, distances = self.index.query_members(lat, lon, filters.radius)
+        matching = [i for i, point in enumerate(members.tolist()) if self._matches(documents[point], filters)]
+        if not matching:
+            return None
+        engine = self._index_engine(documents)
+        weights = None if filters.decay is None else decay_weights(distances[matching], filters.decay)
+        return engine.stats(engine.group_counts(np.zeros(len(matching), dtype=np.int64), members[matching], 1, weights))
+
+    def _index_engine(self, documents):
+        # One HistogramEngine per index snapshot, rebuilt when the index reloads (a new documents list)
+        cached = self._histogram_engine
+        if cached is None or cached[0] is not documents:
+            cached = self._histogram_engine = (documents, HistogramEngine(documents))
+        return cached[1]
+
+    def get_competitors_batch(self, sites, radius=NEIGHBOURS_RADIUS):
+        """
+        Estadísticas de competidores de cada punto de sites (ver parse_sites), en el mismo orden, a medida que se
+        calculan: {"id", "lat", "lon", "competitors"} con competitors = None si no hay restaurantes en el radio
+        """
+        lats = [site["lat"] for site in sites]
+        lons = [site["lon"] for site in sites]
+        if self.tiles is not None and self.tiles.loaded:
+            results = self.tiles.batch_stats(lats, lons, radius)
         else:
-            raise ValueError('Data must be a list of strings or floats')
-        
+            filters = GeoFilters(radius)
+            results = (self._neighbours_competitors(lat, lon, filters) for lat, lon in zip(lats, lons))
+        for site, stats in zip(sites, results):
+            yield {**site, "competitors": stats}
+
     def convert_utm_to_latlon(self, utm_x, utm_y):
         """ Convierte coordenadas UTM a latitud/longitud (WGS84) utilizando Transformer """
         lon, lat = transformer.transform(utm_x, utm_y)
         return lon, lat
 
-    def get_restaurant_count_by_neighborhood(self, neighborhoods):
-        restaurant_count_by_neighborhood = {}
-
-        for neighborhood in neighborhoods:
-            # Convertir las coordenadas UTM a lat/lon solo una vez por barrio
-            utm_polygon_coords = neighborhood['Geometry']['coordinates'][0]
-            latlon_polygon_coords = [self.convert_utm_to_latlon(x, y) for x, y in utm_polygon_coords]
-
-            # Crear el polígono en formato GeoJSON
-            polygon_geojson = {
-                "type": "Polygon",
-                "coordinates": [latlon_polygon_coords]  # GeoJSON espera [ [lat, lon], ... ]
-            }
-
-            # Consulta geoespacial en MongoDB usando $geoWithin
-            query = {
-                "Geometry.coordinates": {
-                    "$geoWithin": {
-                        "$geometry": polygon_geojson
-                    }
-                }
-            }
-
-            # Contar los restaurantes dentro del barrio
-            count = self.restaurants_collection.count_documents(query)
-            restaurant_count_by_neighborhood[neighborhood['Nombre']] = count
+    def get_restaurant_counts_for_neighborhoods(self, neighborhoods=None, points=None):
+        """ Número de restaurantes por barrio (por polígono) con un único join espacial en memoria """
+        if neighborhoods is None and self.geometry_store is not None and self.geometry_store.loaded:
+            # Polygons already reprojected by the GeometryStore
+            neighborhoods = [{"Nombre": nombre, "Geometry": geometry} for nombre, geometry in self.geometry_store.items()]
+            polygons = np.array([geometry_shape(n["Geometry"]) for n in neighborhoods], dtype=object)
+        else:
+            if neighborhoods is None:
+                neighborhoods = list(self.demographics_collection.find({}, {"_id": 0, "Nombre": 1, "Geometry": 1}))
+            neighborhoods = [n for n in neighborhoods if n.get("Geometry", {}).get("coordinates")]
+            # Build every polygon in UTM and reproject all of their vertices in one vectorized call
+            polygons = np.array([geometry_shape(n["Geometry"]) for n in neighborhoods], dtype=object)
+            polygons = shapely.transform(polygons, utm_to_wgs84_array)
+        if not neighborhoods:
+            return {}
+        shapely.prepare(polygons)
+
+        if points is not None:
+            lons, lats = points
+        elif self._use_index():
+            lons, lats = self.index.points()
+        else:
+            lons, lats = self._restaurant_points()
+        points = shapely.points(lons, lats)
+
+        tree = STRtree(polygons)
+        # "intersects" keeps the points on a border, as $geoWithin did; a point on a border shared by two
+        # neighborhoods (or inside two overlapping polygons) is counted once, in the first of them
+        point_idx, neighborhood_idx = tree.query(points, predicate="intersects")
+        order = np.lexsort((neighborhood_idx, point_idx))
+        _, first = np.unique(point_idx[order], return_index=True)
+        counts = np.bincount(neighborhood_idx[order][first], minlength=len(polygons))
+        return {n["Nombre"]: int(count) for n, count in zip(neighborhoods, counts)}
+
+    def _restaurant_points(self):
+        return self._points_from_documents(self.restaurants_collection.find({}, {"_id": 0, "Geometry.coordinates": 1}))
+
+    def _points_from_documents(self, restaurants):
+        lons = []
+        lats = []
+        for restaurant in restaurants:
+            coordinates = restaurant.get("Geometry", {}).get("coordinates")
+            if isinstance(coordinates, (list, tuple)) and len(coordinates) == 2:
+                lons.append(coordinates[0])
+                lats.append(coordinates[1])
+        return np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
 
-        return restaurant_count_by_neighborhood
-    
     def get_price_categories(self):
+        if self._use_stats():
+            return self.stats.city().get("price_categories", [])
         # Usamos aggregate para obtener los valores únicos de la categoría de precio
-        pipeline = [
-            {"$group": {"_id": "$Categoría Precio"}},  # Agrupamos por categoría de precio
-            {"$sort": {"_id": 1}}  # Ordenamos alfabéticamente
-        ]
-        results = list(self.restaurants_collection.aggregate(pipeline))
+        results = list(self.restaurants_collection.aggregate(self._distinct_values_pipeline("Categoría Precio")))
         # Extraer solo el valor de "_id", que es la categoría de precio
         price_categories = [result["_id"] for result in results]
         return price_categories
     def get_cuisine_categories(self):
-        # Usamos aggregate para obtener los valores únicos de la categoría de precio
-        pipeline = [
-            {"$group": {"_id": "$Categoría Cocina"}},  # Agrupamos por categoría de precio
-            {"$sort": {"_id": 1}}  # Ordenamos alfabéticamente
-        ]
-        results = list(self.restaurants_collection.aggregate(pipeline))
+        if self._use_stats():
+            return self.stats.city().get("cuisine_categories", [])
+        # Usamos aggregate para obtener los valores únicos de la categoría de cocina
+        results = list(self.restaurants_collection.aggregate(self._distinct_values_pipeline("Categoría Cocina")))
         # Extraer solo el valor de "_id", que es la categoría de precio
         cuisine_categories = [result["_id"] for result in results]
         return cuisine_categories
+
+    def _distinct_values_pipeline(self, field):
+        return [
+            {"$group": {"_id": f"${field}"}},  # Agrupamos por el campo
+            {"$sort": {"_id": 1}}  # Ordenamos alfabéticamente
+        ]
     
     def get_restaurant_count_by_neighborhood(self, neighborhood_name):
+        if self._use_stats():
+            return self.stats.neighborhood(neighborhood_name).get("restaurant_count", 0)
         count = self.restaurants_collection.count_documents({"Barrio": neighborhood_name})
         return count
 
 
 
     def get_top_5_cuisine_types_by_neighborhood(self, neighborhood_name):
-        pipeline = [
+        if self._use_stats():
+            return top_cuisine_types_result(self.stats.neighborhood(neighborhood_name), 5)
+        pipeline = self._top_cuisine_types_pipeline(neighborhood_name, 5)
+        result = list(self.restaurants_collection.aggregate(pipeline))  # Execute the pipeline
+        top_cuisine_types = [{"Tipo": entry["_id"], "count": entry["count"]} for entry in result]  # Format result
+        return top_cuisine_types
+
+    def _top_cuisine_types_pipeline(self, neighborhood_name, limit):
+        return [
             {"$match": {"Barrio": neighborhood_name}},  # Match restaurants in the specified neighborhood
             {"$group": {"_id": "$Categoría Cocina", "count": {"$sum": 1}}},  # Group by cuisine type and count occurrences
             {"$sort": {"count": -1}},  # Sort by count in descending order (most common first)
-            {"$limit": 5}  # Limit to top 5 most common types
+            {"$limit": limit}  # Limit to the most common types
         ]
-        result = list(self.restaurants_collection.aggregate(pipeline))  # Execute the pipeline
-        top_cuisine_types = [{"Tipo": entry["_id"], "count": entry["count"]} for entry in result]  # Format result
-        return top_cuisine_types
     
     def get_restaurants_by_neighborhood(self, neighborhood_name):
         try:
-            restaurants = self.restaurants_collection.find({"Barrio": neighborhood_name})
-            print("restaurants",restaurants)
-            restaurant_list = []
-            for restaurant in restaurants:
-                # Convert ObjectId to string for JSON serialization
-                restaurant['_id'] = str(restaurant['_id'])
-                restaurant_list.append(restaurant)
-            return restaurant_list
+            # ObjectId is serialized by the app's JSON provider
+            return list(self.restaurants_collection.find({"Barrio": neighborhood_name}))
         except Exception as e:
             logging.error(f"Error fetching restaurants: {str(e)}")
             raise
@@ -252,26 +530,61 @@ class RestaurantService:
 
 
     def get_popular_cuisine_by_neighborhood(self, neighborhood_name):
-        pipeline = [
-            {"$match": {"Barrio": neighborhood_name}},  # Match neighborhood
-            {"$group": {"_id": "$Categoría Cocina", "count": {"$sum": 1}}},  # Group by cuisine category
-            {"$sort": {"count": -1}},  # Sort by most popular
-            {"$limit": 1}  # Limit to the most popular cuisine
-        ]
-        result = list(self.restaurants_collection.aggregate(pipeline))
+        if self._use_stats():
+            top = top_cuisine_types_result(self.stats.neighborhood(neighborhood_name), 1)
+            return top[0]["Tipo"] if top else None
+        # The most popular cuisine is the top 1 of the same pipeline
+        result = list(self.restaurants_collection.aggregate(self._top_cuisine_types_pipeline(neighborhood_name, 1)))
         if result:
             return result[0]["_id"]
         return None
 
 
     def get_price_categories_by_neighborhood(self, neighborhood_name):
-        pipeline = [
+        if self._use_stats():
+            return price_categories_result(self.stats.neighborhood(neighborhood_name))
+        result = list(self.restaurants_collection.aggregate(self._price_categories_pipeline(neighborhood_name)))
+        price_categories = {entry["_id"]: entry["count"] for entry in result}  # Convert to dictionary
+        return price_categories
+
+    def _price_categories_pipeline(self, neighborhood_name):
+        return [
             {"$match": {"Barrio": neighborhood_name}},  # Match restaurants in the neighborhood
             {"$group": {"_id": "$Categoría Precio", "count": {"$sum": 1}}},  # Group by price category
             {"$sort": {"count": -1}}  # Sort by most frequent categories
         ]
-        result = list(self.restaurants_collection.aggregate(pipeline))
-        price_categories = {entry["_id"]: entry["count"] for entry in result}  # Convert to dictionary
-        return price_categories
 
+    def get_neighborhood_profile(self, neighborhood_name):
+        """ Top 5 cocinas, categorías de precio y número de restaurantes del barrio en una sola agregación """
+        if self._use_stats():
+            return restaurant_profile_result(self.stats.neighborhood(neighborhood_name))
+        result = list(self.restaurants_collection.aggregate(self._neighborhood_profile_pipeline(neighborhood_name)))
+        return self._neighborhood_profile_result(result)
 
+    def _neighborhood_profile_pipeline(self, neighborhood_name):
+        return [
+            {"$match": {"Barrio": neighborhood_name}},
+            {
+                "$facet": {
+                    "top_5_cuisine_types": [
+                        {"$group": {"_id": "$Categoría Cocina", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1}},
+                        {"$limit": 5}
+                    ],
+                    "price_categories": [
+                        {"$group": {"_id": "$Categoría Precio", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1}}
+                    ],
+                    "restaurant_count": [{"$count": "count"}]
+                }
+            }
+        ]
+
+    def _neighborhood_profile_result(self, result):
+        facets = result[0] if result else {}
+        restaurant_count = facets.get("restaurant_count", [])
+        return {
+            "top_5_cuisine_types": [{"Tipo": entry["_id"], "count": entry["count"]} for entry in facets.get("top_5_cuisine_types", [])],
+            "price_categories": {entry["_id"]: entry["count"] for entry in facets.get("price_categories", [])},
+            "restaurant_count": restaurant_count[0]["count"] if restaurant_count else 0
+        }
@@ -0,0 +1,179 @@
+import logging
+import numpy as np
+import shapely
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import PyMongoError
+from pyproj import Transformer
+from services.RestaurantIndex import haversine_distance
+from services.RestaurantService import MAX_RADIUS
+
+PROXIMITY_COLLECTION = "transport_proximity"
+PROXIMITY_SOURCES = ("restaurants", "empty_locals")
+STOPS_RADIUS = 500  # Meters; stops counted around each site
+UNKNOWN_MODE = "Otros"  # Stops without Tipo
+# The STRtrees work in UTM 31N meters; the distances returned are spherical, like the ones of $geoNear
+to_utm = Transformer.from_crs("EPSG:4326", "EPSG:32631", always_xy=True)
+# Margin over the radius for the planar candidate search (the UTM scale error is far below 1% in the city)
+PLANAR_MARGIN = 1.01
+STOP_PROJECTION = {"Nombre": 1, "Tipo": 1, "Lineas": 1, "Geometry.coordinates": 1}
+
+
+def parse_point_args(args):
+    """ lat, lon y radius de la query string; lanza ValueError si no son válidos """
+    try:
+        lat = float(args.get("lat"))
+        lon = float(args.get("lon"))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid latitude or longitude")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Invalid latitude or longitude")
+    try:
+        radius = float(args.get("radius") or STOPS_RADIUS)
+    except ValueError:
+        raise ValueError("Invalid radius")
+    if not 0 < radius <= MAX_RADIUS:
+        raise ValueError(f"radius must be between 0 and {MAX_RADIUS} meters")
+    return lat, lon, radius
+
+
+def valid_points(documents):
+    """ (documentos, lons, lats) de los documentos con Geometry.coordinates [lon, lat] numéricas """
+    kept = []
+    lons = []
+    lats = []
+    for document in documents:
+        coordinates = document.get("Geometry", {}).get("coordinates")
+        if not isinstance(coordinates, (list, tuple)) or len(coordinates) != 2:
+            continue
+        lon, lat = coordinates
+        if not isinstance(lon, (int, float)) or not isinstance(lat, (int, float)):
+            continue
+        kept.append(document)
+        lons.append(lon)
+        lats.append(lat)
+    return kept, np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+
+
+def _stop_summary(stop, distance):
+    coordinates = stop.get("Geometry", {}).get("coordinates")
+    return {
+        "distance": round(float(distance), 1),
+        "stop": stop.get("Nombre"),
+        "lines": stop.get("Lineas"),
+        "coordinates": list(coordinates) if coordinates else None
+    }
+
+
+def proximity_result(groups, radius):
+    """ Respuesta de TransportService.get_proximity a partir de las filas de _proximity_pipeline """
+    groups = sorted(groups, key=lambda group: str(group["_id"]))
+    stops_within = {str(group["_id"]): group["within"] for group in groups}
+    return {
+        "radius": radius,
+        "nearest": {str(group["_id"]): _stop_summary(group["stop"], group["distance"]) for group in groups},
+        "stops_within": stops_within,
+        "total_within": sum(stops_within.values())
+    }
+
+
+class TransportProximity:
+    """
+    Índice espacial en memoria de las paradas de transport (un STRtree por modo) y colección transport_proximity
+    con, para cada restaurante y local vacío, la parada más cercana de cada modo y las paradas a menos de radius
+    metros. Se recalcula al arrancar y al cargar datos con ingest.py, reescribiendo solo los documentos que cambian.
+    """
+
+    def __init__(self, mongo, radius=STOPS_RADIUS):
+        self.db = mongo.db
+        self.transport_collection = mongo.db['transport']
+        self.proximity_collection = mongo.db[PROXIMITY_COLLECTION]
+        self.radius = radius
+        self.loaded = False
+        self._snapshot = {"stops": [], "lons": np.empty(0), "lats": np.empty(0), "modes": {}}
+
+    def load(self):
+        stops, lons, lats = valid_points(self.transport_collection.find({}, STOP_PROJECTION))
+        modes = np.array([str(stop.get("Tipo") or UNKNOWN_MODE) for stop in stops], dtype=object)
+        points = self._utm_points(lons, lats)
+        by_mode = {}
+        for mode in sorted(set(modes.tolist())):
+            members = np.flatnonzero(modes == mode)
+            by_mode[mode] = (members, shapely.STRtree(points[members]))
+        # Swap the whole snapshot at once so concurrent readers never see a half-built index
+        self._snapshot = {"stops": stops, "lons": lons, "lats": lats, "modes": by_mode}
+        self.loaded = True
+        logging.info(f"Transport stop index loaded with {len(stops)} stops in {len(by_mode)} modes")
+
+    def _utm_points(self, lons, lats):
+        if not len(lons):
+            return np.empty(0, dtype=object)
+        x, y = to_utm.transform(lons, lats)
+        return shapely.points(np.column_stack([x, y]))
+
+    def features(self, lons, lats, radius=None):
+        """
+        mode -> (índice de la parada más cercana, distancia en metros, paradas a menos de radius) para arrays
+        de puntos lon/lat, todos los puntos de cada modo en una sola consulta al STRtree
+        """
+        radius = self.radius if radius is None else radius
+        snapshot = self._snapshot
+        points = self._utm_points(lons, lats)
+        result = {}
+        for mode, (members, tree) in snapshot["modes"].items():
+            pairs = tree.query_nearest(points, all_matches=False)
+            nearest = np.zeros(len(points), dtype=np.int64)
+            nearest[pairs[0]] = members[pairs[1]]
+            distances = haversine_distance(lats, lons, snapshot["lats"][nearest], snapshot["lons"][nearest])
+
+            sites, candidates = tree.query(points, predicate="dwithin", distance=radius * PLANAR_MARGIN)
+            stops = members[candidates]
+            inside = haversine_distance(lats[sites], lons[sites], snapshot["lats"][stops], snapshot["lons"][stops]) <= radius
+            counts = np.bincount(sites[inside], minlength=len(points))
+            result[mode] = (nearest, distances, counts)
+        return result
+
+    def _proximity_row(self, features, i, radius):
+        stops = self._snapshot["stops"]
+        stops_within = {mode: int(counts[i]) for mode, (_, _, counts) in features.items()}
+        return {
+            "radius": radius,
+            "nearest": {
+                mode: _stop_summary(stops[nearest[i]], distances[i]) for mode, (nearest, distances, _) in features.items()
+            },
+            "stops_within": stops_within,
+            "total_within": sum(stops_within.values())
+        }
+
+    def nearest_stops(self, lat, lon, radius=None):
+        """ Parada más cercana por modo y paradas a menos de radius metros de un punto """
+        radius = self.radius if radius is None else radius
+        features = self.features(np.array([lon], dtype=float), np.array([lat], dtype=float), radius)
+        return self._proximity_row(features, 0, radius)
+
+    def sync(self):
+        """ Recalcula las distancias de todos los restaurantes y locales vacíos y escribe las que han cambiado """
+        self.load()
+        for source in PROXIMITY_SOURCES:
+            sites, lons, lats = valid_points(self.db[source].find({}, {"Geometry.coordinates": 1}))
+            features = self.features(lons, lats)
+            stored = {d["_id"]["id"]: d for d in self.proximity_collection.find({"_id.source": source})}
+            operations = []
+            for i, site in enumerate(sites):
+                _id = {"source": source, "id": site["_id"]}
+                document = {"_id": _id, **self._proximity_row(features, i, self.radius)}
+                previous = stored.pop(site["_id"], None)
+                if previous is None:
+                    operations.append(InsertOne(document))
+                elif previous != document:
+                    operations.append(ReplaceOne({"_id": _id}, document))
+            if operations:
+                self.proximity_collection.bulk_write(operations, ordered=False)
+            if stored:
+                self.proximity_collection.delete_many({"_id": {"$in": [{"source": source, "id": i} for i in stored]}})
+            logging.info(f"Transport proximity of {source}: {len(operations)} written, {len(stored)} removed")
+
+    def start(self):
+        try:
+            self.sync()
+        except PyMongoError as e:
+            logging.error(f"Could not sync {PROXIMITY_COLLECTION}, point queries fall back to MongoDB: {str(e)}")
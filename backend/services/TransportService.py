@@ -1,14 +1,63 @@
-from flask import jsonify
-import re
-import logging
-from numpy import histogram
-import math
-from collections import Counter
+from services.Pagination import cursor_response, keyset_query
+from services.IndexManager import QueryCheck
+from services.TransportProximity import PROXIMITY_COLLECTION, STOPS_RADIUS, UNKNOWN_MODE, proximity_result
+from pymongo import GEOSPHERE, IndexModel
 
 class TransportService:
-    def __init__(self, mongo):
+    # Índices que necesitan las consultas del servicio (los crea IndexManager)
+    INDEXES = {
+        "transport": [IndexModel([("Geometry.coordinates", GEOSPHERE)], name="Geometry.coordinates_2dsphere")]
+    }
+
+    def __init__(self, mongo, proximity=None):
         self.transport_collection = mongo.db['transport']
+        self.proximity_collection = mongo.db[PROXIMITY_COLLECTION]
+        # Optional TransportProximity with the in-memory stop index; MongoDB is queried until it is loaded
+        self.proximity = proximity
+
+    def _use_proximity(self):
+        return self.proximity is not None and self.proximity.loaded
+
+    def query_checks(self, sample):
+        # The transport list is only read as a whole collection (keyset over _id)
+        return [
+            QueryCheck("transport_proximity", "transport", None, self._proximity_pipeline(sample["lat"], sample["lon"], STOPS_RADIUS)),
+        ]
+
+    def get_transport_data(self, limit=None, after=None, stream_format="json"):
+        transport_data = self.transport_collection.find(keyset_query({}, after))
+        if limit is not None or after is not None:
+            transport_data = transport_data.sort("_id", 1)
+        return cursor_response(transport_data, self._transport_row, limit, stream_format)
+
+    def _transport_row(self, transport):
+        # _id is only read for the keyset cursor, it is not part of the payload
+        return {key: value for key, value in transport.items() if key != '_id'}
+
+    def get_proximity(self, lat, lon, radius=STOPS_RADIUS):
+        """ Parada más cercana de cada modo y número de paradas a menos de radius metros del punto """
+        if self._use_proximity():
+            return self.proximity.nearest_stops(lat, lon, radius)
+        return proximity_result(list(self.transport_collection.aggregate(self._proximity_pipeline(lat, lon, radius))), radius)
+
+    def _proximity_pipeline(self, lat, lon, radius):
+        return [
+            # $geoNear returns the stops sorted by distance, so $first is the nearest of each mode
+            {"$geoNear": {
+                "near": {"type": "Point", "coordinates": [lon, lat]},
+                "key": "Geometry.coordinates",
+                "distanceField": "distance",
+                "spherical": True
+            }},
+            {"$group": {
+                # Same modes as TransportProximity: null, missing or empty Tipo is UNKNOWN_MODE
+                "_id": {"$cond": [{"$in": [{"$ifNull": ["$Tipo", None]}, [None, ""]]}, UNKNOWN_MODE, "$Tipo"]},
+                "stop": {"$first": {"Nombre": "$Nombre", "Lineas": "$Lineas", "Geometry": "$Geometry"}},
+                "distance": {"$first": "$distance"},
+                "within": {"$sum": {"$cond": [{"$lte": ["$distance", radius]}, 1, 0]}}
+            }}
+        ]
 
-    def get_transport_data(self):
-        transport_data = list(self.transport_collection.find({}, {'_id': 0}))
-        return jsonify(transport_data)
\ No newline at end of file
+    def get_site_proximity(self, source, site_id):
+        """ Datos precalculados de transport_proximity de un restaurante o local vacío (None si no hay) """
+        return self.proximity_collection.find_one({"_id": {"source": source, "id": site_id}}, {"_id": 0})
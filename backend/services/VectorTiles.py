@@ -0,0 +1,215 @@
+import itertools
+import logging
+import math
+import mapbox_vector_tile
+import numpy as np
+from pymongo.errors import PyMongoError
+from shapely.geometry import Point
+from services.ResponseCache import MemoryBackend
+
+MVT_MIMETYPE = "application/vnd.mapbox-vector-tile"
+EXTENT = 4096  # Tile coordinate space of the MVT spec
+BUFFER = 64  # Points this close to the tile edge are also drawn in the neighbouring tile
+CLUSTER_CELL = 256  # Cluster grid in tile units (16 px on a 256 px tile), aligned across tiles
+MAX_ZOOM = 22
+MAX_LATITUDE = 85.0511287798  # Web Mercator limit
+
+# capa -> (colección, propiedades de cada punto); los restaurantes se toman del RestaurantIndex si está activo
+LAYER_SOURCES = {
+    "restaurants": ("restaurants", ["Nombre", "Categoría Cocina", "Nota", "Categoría Precio"]),
+    "empty_locals": ("empty_locals", ["Título", "Precio total (€)", "Superficie (m2)", "Barrio"]),
+    "transport": ("transport", ["Nombre", "Tipo", "Lineas"]),
+}
+STATIC_LAYERS = ("empty_locals", "transport")
+
+_generations = itertools.count(1)
+
+
+def _property(value):
+    """ Valor representable en el MVT, o None si la propiedad no se codifica """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(v) for v in value)
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def encode_layer(name, features):
+    """ Capa MVT (versión 2) a partir de [(x, y, propiedades)] en coordenadas de tesela """
+    encoded = []
+    for x, y, properties in features:
+        properties = {key: _property(value) for key, value in properties.items()}
+        encoded.append({
+            "geometry": Point(x, y),
+            "properties": {key: value for key, value in properties.items() if value is not None}
+        })
+    # y_coord_down: tile coordinates already have their origin at the top left
+    return mapbox_vector_tile.encode(
+        [{"name": name, "features": encoded}], default_options={"extents": EXTENT, "y_coord_down": True}
+    )
+
+
+def web_mercator(lons, lats):
+    """ Coordenadas Web Mercator normalizadas a [0, 1] (origen arriba a la izquierda) """
+    lats = np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE)
+    xs = (np.asarray(lons, dtype=float) + 180.0) / 360.0
+    ys = 0.5 - np.log(np.tan(np.pi / 4 + np.radians(lats) / 2)) / (2 * np.pi)
+    return xs, ys
+
+
+class PointLayer:
+    """ Puntos de una capa ordenados por x en Web Mercator para recortar cada tesela con búsqueda binaria """
+
+    def __init__(self, name, properties, lons, lats, cluster_max_zoom):
+        xs, ys = web_mercator(lons, lats)
+        order = np.argsort(xs, kind="stable")
+        self.name = name
+        self.xs = xs[order]
+        self.ys = ys[order]
+        self.properties = [properties[i] for i in order.tolist()]
+        self.cluster_max_zoom = cluster_max_zoom
+        self.generation = next(_generations)
+        self.pyramid = {}
+
+    def render(self, z, x, y):
+        scale = 2 ** z
+        clustered = z <= self.cluster_max_zoom
+        # Clusters belong to exactly one tile, so the buffer is only used for individual points
+        margin = 0.0 if clustered else BUFFER / EXTENT
+        low = np.searchsorted(self.xs, (x - margin) / scale, side="left")
+        high = np.searchsorted(self.xs, (x + 1 + margin) / scale, side="right")
+        tile_xs = self.xs[low:high] * scale - x
+        tile_ys = self.ys[low:high] * scale - y
+        inside = (tile_xs >= -margin) & (tile_xs < 1 + margin) & (tile_ys >= -margin) & (tile_ys < 1 + margin)
+        members = np.flatnonzero(inside)
+        if not len(members):
+            return encode_layer(self.name, [])
+        points_x = np.floor(tile_xs[members] * EXTENT).astype(np.int64)
+        points_y = np.floor(tile_ys[members] * EXTENT).astype(np.int64)
+        if not clustered:
+            features = [
+                (px, py, self.properties[low + i])
+                for px, py, i in zip(points_x.tolist(), points_y.tolist(), members.tolist())
+            ]
+            return encode_layer(self.name, features)
+        return encode_layer(self.name, self._clusters(points_x, points_y, low + members))
+
+    def _clusters(self, points_x, points_y, indexes):
+        """ Agrupa los puntos por celda de CLUSTER_CELL; las celdas con un solo punto lo mantienen tal cual """
+        cells = (points_x // CLUSTER_CELL) * (EXTENT // CLUSTER_CELL) + points_y // CLUSTER_CELL
+        unique_cells, inverse, counts = np.unique(cells, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        sum_x = np.bincount(inverse, weights=points_x, minlength=len(unique_cells))
+        sum_y = np.bincount(inverse, weights=points_y, minlength=len(unique_cells))
+        member = np.empty(len(unique_cells), dtype=np.int64)
+        member[inverse] = indexes  # Only read for single-point cells
+        features = []
+        for cell, count in enumerate(counts.tolist()):
+            if count == 1:
+                features.append((int(sum_x[cell]), int(sum_y[cell]), self.properties[member[cell]]))
+            else:
+                features.append((
+                    int(round(sum_x[cell] / count)), int(round(sum_y[cell] / count)),
+                    {"cluster": True, "point_count": count}
+                ))
+        return features
+
+    def occupied_tiles(self, z):
+        """ Teselas (x, y) del nivel z que contienen algún punto """
+        scale = 2 ** z
+        tiles = np.stack([
+            np.clip(np.floor(self.xs * scale), 0, scale - 1),
+            np.clip(np.floor(self.ys * scale), 0, scale - 1)
+        ], axis=1).astype(np.int64)
+        return [tuple(tile) for tile in np.unique(tiles, axis=0).tolist()] if len(tiles) else []
+
+
+class VectorTiles:
+    """
+    Teselas vectoriales (MVT) de las capas de puntos. Hasta cluster_max_zoom los puntos se agrupan en
+    clusters con point_count; las capas estáticas tienen la pirámide precalculada hasta pyramid_max_zoom y el
+    resto de teselas se generan bajo demanda y se guardan en una caché LRU.
+    """
+
+    def __init__(self, mongo, index=None, pyramid_max_zoom=14, cluster_max_zoom=15, cache_size=4096):
+        self.db = mongo.db
+        self.index = index
+        self.pyramid_max_zoom = pyramid_max_zoom
+        self.cluster_max_zoom = cluster_max_zoom
+        self.cache = MemoryBackend(cache_size)
+        self.loaded = False
+        self._layers = {}
+        if index is not None:
+            index.add_listener(self._restaurants_loaded)
+
+    def layers(self):
+        return sorted(LAYER_SOURCES)
+
+    def build_layer(self, name, documents, lons=None, lats=None):
+        """ Crea (o sustituye) la capa a partir de documentos con Geometry.coordinates o de arrays lon/lat """
+        fields = LAYER_SOURCES[name][1]
+        if lons is None:
+            points = [
+                (d, d["Geometry"]["coordinates"]) for d in documents
+                if _is_point(d.get("Geometry", {}).get("coordinates"))
+            ]
+            documents = [d for d, _ in points]
+            lons = np.array([c[0] for _, c in points], dtype=float)
+            lats = np.array([c[1] for _, c in points], dtype=float)
+        properties = [{field: d.get(field) for field in fields if field in d} for d in documents]
+        layer = PointLayer(name, properties, lons, lats, self.cluster_max_zoom)
+        if name in STATIC_LAYERS:
+            self._precompute(layer)
+        self._layers[name] = layer
+        return layer
+
+    def _precompute(self, layer):
+        for z in range(self.pyramid_max_zoom + 1):
+            for x, y in layer.occupied_tiles(z):
+                layer.pyramid[(z, x, y)] = layer.render(z, x, y)
+        logging.info(f"Tile pyramid for {layer.name}: {len(layer.pyramid)} tiles up to zoom {self.pyramid_max_zoom}")
+
+    def _restaurants_loaded(self, documents, lons, lats):
+        self.build_layer("restaurants", documents, lons, lats)
+
+    def load(self):
+        names = [name for name in LAYER_SOURCES if name != "restaurants" or self.index is None]
+        for name in names:
+            collection, fields = LAYER_SOURCES[name]
+            projection = {"_id": 0, "Geometry.coordinates": 1, **{field: 1 for field in fields}}
+            self.build_layer(name, self.db[collection].find({}, projection))
+        self.loaded = True
+
+    def start(self):
+        try:
+            self.load()
+        except PyMongoError as e:
+            logging.error(f"Could not load vector tile layers: {str(e)}")
+
+    def tile(self, name, z, x, y):
+        """ Bytes de la tesela (sin comprimir); None si la capa no existe o no está cargada """
+        layer = self._layers.get(name)
+        if layer is None:
+            return None
+        if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValueError(f"Invalid tile {z}/{x}/{y}")
+        data = layer.pyramid.get((z, x, y))
+        if data is not None:
+            return data
+        key = (layer.generation, z, x, y)
+        data = self.cache.get(key)
+        if data is None:
+            data = layer.render(z, x, y)
+            self.cache.set(key, data, math.inf)
+        return data
+
+
+def _is_point(coordinates):
+    return (
+        isinstance(coordinates, (list, tuple)) and len(coordinates) == 2
+        and all(isinstance(c, (int, float)) for c in coordinates)
+    )
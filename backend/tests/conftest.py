@@ -0,0 +1,93 @@
+"""
+Los tests usan el MongoDB simulado de los benchmarks (benchmarks.run --stand-in, requiere mongomock) con el
+dataset sintético, cargado una sola vez antes de importar controller.py o asgi.py (desde backend/):
+
+    python -m pytest -q tests
+"""
+import math
+import os
+import sys
+from types import SimpleNamespace
+import mongomock
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pymongo  # noqa: E402
+from benchmarks.run import use_stand_in  # noqa: E402
+from benchmarks.synthetic_city import generate, load  # noqa: E402
+
+URI = use_stand_in()
+os.environ["MONGO_URI"] = URI
+# The asynchronous client of asgi.py is not simulated: fail fast instead of waiting for a server
+os.environ.setdefault("MONGO_SERVER_SELECTION_TIMEOUT_MS", "500")
+DATASETS = generate(0.1, seed=7)
+load(pymongo.MongoClient(URI).get_default_database(), DATASETS)
+
+
+@pytest.fixture(scope="session")
+def mongo():
+    return SimpleNamespace(db=pymongo.MongoClient(URI).get_default_database())
+
+
+def _spherical_distance(coordinates, lon, lat):
+    # Same sphere as MongoDB's 2dsphere distances
+    lon2, lat2 = coordinates
+    a = (
+        math.sin(math.radians(lat2 - lat) / 2) ** 2
+        + math.cos(math.radians(lat)) * math.cos(math.radians(lat2)) * math.sin(math.radians(lon2 - lon) / 2) ** 2
+    )
+    return 2 * 6378100.0 * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _near(collection, query, field, distance_field):
+    """ Documentos de query dentro de $maxDistance ordenados por distancia, con la distancia en distance_field """
+    lon, lat = query["near"]["coordinates"]
+    documents = []
+    for document in _original_find(collection, query.get("query") or {}):
+        coordinates = document
+        for part in field.split("."):
+            coordinates = coordinates.get(part, {}) if isinstance(coordinates, dict) else {}
+        if not isinstance(coordinates, list) or len(coordinates) != 2:
+            continue
+        distance = _spherical_distance(coordinates, lon, lat)
+        if distance <= query.get("maxDistance", math.inf):
+            documents.append({**document, distance_field: distance})
+    return sorted(documents, key=lambda document: document[distance_field])
+
+
+_original_find = mongomock.collection.Collection.find
+
+
+@pytest.fixture
+def geo_queries(monkeypatch):
+    """ $near (find) y $geoNear (aggregate) sobre el MongoDB simulado, que no los implementa """
+    original_aggregate = mongomock.collection.Collection.aggregate
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        filter = dict(filter or {})
+        near = next((key for key, value in filter.items() if isinstance(value, dict) and "$near" in value), None)
+        if near is None:
+            return _original_find(self, filter, projection, *args, **kwargs)
+        condition = filter.pop(near)["$near"]
+        query = {"near": condition["$geometry"], "maxDistance": condition.get("$maxDistance", math.inf), "query": filter}
+        staging = self.database["_geo_queries"]
+        staging.drop()
+        documents = _near(self, query, near, "_near")
+        if documents:
+            staging.insert_many(documents)
+        return _original_find(staging, {}, projection).sort("_near", 1)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        if not pipeline or "$geoNear" not in pipeline[0]:
+            return original_aggregate(self, pipeline, *args, **kwargs)
+        stage = pipeline[0]["$geoNear"]
+        documents = _near(self, stage, stage.get("key", "Geometry.coordinates"), stage["distanceField"])
+        staging = self.database["_geo_queries"]
+        staging.drop()
+        if documents:
+            staging.insert_many(documents)
+        return original_aggregate(staging, pipeline[1:], *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find", find)
+    monkeypatch.setattr(mongomock.collection.Collection, "aggregate", aggregate)
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+
+pytest.importorskip("quart")
+import asgi  # noqa: E402
+import controller  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def serve():
+    """ get(path, headers) -> (status, cabeceras, cuerpo) contra asgi.app, arrancada una vez en un único bucle """
+    # AsyncMongoClient is bound to the event loop it first runs on, as in an ASGI worker
+    loop = asyncio.new_event_loop()
+    test_app = asgi.app.test_app()
+    client = loop.run_until_complete(test_app.__aenter__()).test_client()
+
+    async def get(path, headers):
+        response = await client.get(path, headers=headers or {})
+        return response.status_code, response.headers, await response.get_data()
+
+    yield lambda path, headers=None: loop.run_until_complete(get(path, headers))
+    loop.run_until_complete(test_app.__aexit__(None, None, None))
+    loop.close()
+
+
+def test_operational_routes(serve):
+    assert serve("/health/live")[0] == 200
+    # Not ready without a server for the asynchronous client, but the datasets are loaded with the simulated one
+    status, _, body = serve("/health/ready")
+    assert status in (200, 503) and all(asgi.app.json.loads(body)["datasets"].values())
+    status, _, body = serve("/metrics")
+    assert status == 200 and b"http_request_duration_seconds" in body
+    assert serve("/api/cache_stats")[0] == 200
+
+
+def test_cached_route_etag(serve):
+    path = "/api/empty_locals_count_by_neighborhood"
+    status, headers, body = serve(path)
+    assert status == 200 and headers.get("ETag")
+    assert serve(path)[2] == body
+    status, _, body = serve(path, {"If-None-Match": headers["ETag"]})
+    assert status == 304 and body == b""
+    assert asgi.response_cache.hit_stats()["get_empty_locals_count_by_neighborhood"]["hits"] >= 2
+
+
+@pytest.mark.parametrize("path", [
+    "/api/empty_locals_count_by_neighborhood",
+    "/api/empty_locals_average_price_by_neighborhood",
+    "/api/neighbours_competitors?lat=41.39&lon=2.16&radius=800",
+])
+def test_same_response_as_controller(serve, path):
+    status, _, body = serve(path)
+    expected = controller.app.test_client().get(path)
+    assert status == expected.status_code
+    assert asgi.app.json.loads(body) == expected.get_json()
@@ -0,0 +1,46 @@
+import pytest
+from services.CompetitorTiles import CompetitorTiles
+from services.RestaurantIndex import RestaurantIndex
+from services.RestaurantService import GeoFilters, RestaurantService
+from benchmarks.histograms import same_stats
+
+FILTERS = [
+    GeoFilters(),
+    GeoFilters(radius=2000),  # Most of the covering tiles are fully inside the radius
+    GeoFilters(radius=800, cuisines=["Mediterránea", "Tapas"], min_rating=3.5),
+    GeoFilters(radius=1000, decay=300),
+]
+
+
+@pytest.fixture(scope="module")
+def services(mongo):
+    index = RestaurantIndex(mongo)
+    tiles = CompetitorTiles()
+    index.add_listener(tiles.build)
+    index.load()
+    return RestaurantService(mongo, index=index, tiles=tiles), RestaurantService(mongo)
+
+
+@pytest.fixture(scope="module")
+def sites(mongo):
+    return [local["Geometry"]["coordinates"] for local in mongo.db.empty_locals.find({}, {"Geometry": 1}).limit(10)]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_competitor_stats_match_geonear_pipeline(services, sites, geo_queries, filters):
+    tiled, fallback = services
+    for lon, lat in sites:
+        expected = fallback._neighbours_competitors(lat, lon, filters)
+        assert same_stats(tiled._neighbours_competitors(lat, lon, filters), expected)
+
+
+def test_batch_stats_match_geonear_pipeline(services, sites, geo_queries):
+    tiled, fallback = services
+    # The last site is far from the city and has no competitors
+    batch = [{"id": str(i), "lat": lat, "lon": lon} for i, (lon, lat) in enumerate(sites + [[0.0, 0.0]])]
+    results = list(tiled.get_competitors_batch(batch, radius=600))
+    assert [result["id"] for result in results] == [site["id"] for site in batch]
+    for result in results:
+        expected = fallback._neighbours_competitors(result["lat"], result["lon"], GeoFilters(radius=600))
+        assert same_stats(result["competitors"], expected)
+    assert results[-1]["competitors"] is None
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from services.HistogramEngine import HistogramEngine, decay_weights
+from services.RestaurantIndex import INDEX_PROJECTION
+from services.RestaurantService import GeoFilters, RestaurantService
+from benchmarks.histograms import engine_stats, legacy_stats, neighbours_of, same_stats
+
+# Values that the synthetic city does not have: missing fields, the closed last bin, text and bool ratings
+EDGE_CASES = [
+    {"Categoría Cocina": "Tapas", "Categoría Precio": "€", "Nota": 5.0, "Accesibilidad": 7.5, "distancia": 10.0},
+    {"Categoría Cocina": "Tapas", "Nota": 0.0, "distancia": 120.0},
+    {"Categoría Precio": "€€", "Nota": "4,5", "Accesibilidad": 2, "distancia": 300.0},
+    {"Categoría Cocina": "China", "Nota": 3, "Accesibilidad": None, "distancia": 450.0},
+    {"Categoría Cocina": "China", "Categoría Precio": "€€", "Nota": None, "Accesibilidad": 9.0, "distancia": 499.0},
+    {"Nota": True, "distancia": 50.0},
+]
+
+
+@pytest.fixture(scope="module")
+def city(mongo):
+    restaurants = list(mongo.db.restaurants.find({}, INDEX_PROJECTION))
+    lons = np.array([r["Geometry"]["coordinates"][0] for r in restaurants], dtype=float)
+    lats = np.array([r["Geometry"]["coordinates"][1] for r in restaurants], dtype=float)
+    sites = [local["Geometry"]["coordinates"] for local in mongo.db.empty_locals.find({}, {"Geometry": 1}).limit(25)]
+    return restaurants, neighbours_of(sites, lons, lats, 500)
+
+
+def test_per_site_and_batch_match_calculate_histogram(city):
+    restaurants, neighbours = city
+    engine = HistogramEngine(restaurants)
+    groups = np.repeat(np.arange(len(neighbours)), [len(members) for members, _ in neighbours])
+    points = np.concatenate([members for members, _ in neighbours])
+    batch = engine.batch_stats(groups, points, len(neighbours))
+    for (members, distances), batched in zip(neighbours, batch):
+        expected = legacy_stats([restaurants[i] for i in members.tolist()])
+        assert same_stats(engine_stats(engine, members, distances), expected)
+        assert same_stats(batched, expected)
+
+
+def test_weighted_batch_matches_per_site(city):
+    restaurants, neighbours = city
+    engine = HistogramEngine(restaurants)
+    groups = np.repeat(np.arange(len(neighbours)), [len(members) for members, _ in neighbours])
+    points = np.concatenate([members for members, _ in neighbours])
+    distances = np.concatenate([d for _, d in neighbours])
+    batch = engine.batch_stats(groups, points, len(neighbours), decay_weights(distances, 200))
+    for (members, distances), batched in zip(neighbours, batch):
+        assert same_stats(batched, engine_stats(engine, members, distances, 200))
+
+
+@pytest.mark.parametrize("decay", [None, 150])
+def test_edge_cases_match_facet_pipeline(mongo, decay):
+    # The $facet stages of the fallback pipeline over documents that already carry their distance
+    collection = mongo.db.histogram_edge_cases
+    collection.drop()
+    collection.insert_many([dict(document) for document in EDGE_CASES])
+    service = RestaurantService(mongo)
+    pipeline = service._competitors_pipeline(0.0, 0.0, GeoFilters(radius=500, decay=decay))[1:]
+    expected = service._competitors_from_facets(list(collection.aggregate(pipeline)))
+
+    engine = HistogramEngine(EDGE_CASES)
+    weights = None if decay is None else decay_weights([d["distancia"] for d in EDGE_CASES], decay)
+    points = np.arange(len(EDGE_CASES))
+    assert same_stats(engine.stats(engine.group_counts(np.zeros(len(points), dtype=np.int64), points, 1, weights)), expected)
+    collection.drop()
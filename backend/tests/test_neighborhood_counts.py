@@ -0,0 +1,26 @@
+from collections import Counter
+import numpy as np
+import shapely
+from services.GeometryStore import geometry_shape, utm_to_wgs84_array
+from services.RestaurantService import RestaurantService
+
+
+def test_point_on_shared_border_counted_once(mongo):
+    neighborhoods = list(mongo.db.demographic_info.find({}, {"_id": 0, "Nombre": 1, "Geometry": 1}))
+    # The synthetic neighborhoods tile the city: a vertex in two of them lies on their shared border
+    vertices = Counter(
+        tuple(v) for n in neighborhoods for v in np.unique(shapely.get_coordinates(geometry_shape(n["Geometry"])), axis=0)
+    )
+    shared = next(vertex for vertex, count in vertices.items() if count >= 2)
+    lon, lat = utm_to_wgs84_array(np.array([shared], dtype=float))[0]
+    counts = RestaurantService(mongo).get_restaurant_counts_for_neighborhoods(
+        neighborhoods, points=(np.array([lon]), np.array([lat]))
+    )
+    assert sum(counts.values()) == 1
+
+
+def test_counts_add_up_to_restaurants_inside_the_city(mongo):
+    service = RestaurantService(mongo)
+    lons, lats = service._restaurant_points()
+    counts = service.get_restaurant_counts_for_neighborhoods()
+    assert 0 < sum(counts.values()) <= len(lons)
@@ -0,0 +1,57 @@
+import json
+import pytest
+import controller
+from services.Pagination import MAX_PAGE_SIZE
+
+COLLECTIONS = ["/restaurants", "/api/empty_locals", "/transport"]
+
+
+@pytest.fixture(scope="module")
+def client():
+    return controller.app.test_client()
+
+
+def rows(response, stream_format):
+    body = response.get_data(as_text=True)
+    if stream_format == "ndjson":
+        return [json.loads(line) for line in body.splitlines()]
+    return json.loads(body)
+
+
+def key(row):
+    return json.dumps(row, sort_keys=True)
+
+
+@pytest.mark.parametrize("path", COLLECTIONS)
+@pytest.mark.parametrize("stream_format", ["json", "ndjson"])
+def test_pages_follow_next_cursor_to_the_full_stream(client, path, stream_format):
+    everything = rows(client.get(f"{path}?format={stream_format}"), stream_format)
+    pages = []
+    after = ""
+    while True:
+        response = client.get(f"{path}?format={stream_format}&limit=97{after}")
+        assert response.status_code == 200
+        page = rows(response, stream_format)
+        assert len(page) <= 97
+        pages.extend(page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        after = f"&after={cursor}"
+    assert len(pages) == len(everything) > 97
+    assert sorted(map(key, pages)) == sorted(map(key, everything))
+
+
+def test_last_full_page_leads_to_an_empty_page(client):
+    total = len(rows(client.get("/transport"), "json"))
+    response = client.get(f"/transport?limit={total}")
+    assert len(rows(response, "json")) == total
+    last = client.get(f"/transport?limit={total}&after={response.headers['X-Next-Cursor']}")
+    assert rows(last, "json") == [] and "X-Next-Cursor" not in last.headers
+
+
+@pytest.mark.parametrize("query", ["limit=0", f"limit={MAX_PAGE_SIZE + 1}", "limit=abc", "after=not-an-id", "format=xml"])
+def test_invalid_page_arguments(client, query):
+    response = client.get(f"/restaurants?{query}")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
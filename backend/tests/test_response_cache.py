@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+import flask
+import pytest
+from werkzeug.datastructures import MultiDict
+from services.ResponseCache import DatasetVersion, MemoryBackend, ResponseCache
+
+
+@pytest.fixture
+def version(mongo):
+    # A database of its own, so bump() does not touch the version seen by controller.py
+    database = mongo.db.client["response_cache_tests"]
+    database.dataset_versions.drop()
+    return DatasetVersion(SimpleNamespace(db=database), check_interval=0)
+
+
+def make_app(cache):
+    app = flask.Flask(__name__)
+    calls = []
+
+    @app.route("/items/<name>")
+    @cache.cached
+    def items(name):
+        calls.append(name)
+        if name == "missing":
+            return flask.jsonify({"error": "not found"}), 404
+        return flask.jsonify({"name": name, "call": len(calls), "args": flask.request.args.to_dict(flat=False)})
+
+    @app.route("/stream")
+    @cache.cached
+    def stream():
+        calls.append("stream")
+        return flask.Response(iter([b"[", b"]"]), mimetype="application/json")
+
+    return app.test_client(), calls
+
+
+def test_key_normalizes_arguments(version):
+    cache = ResponseCache(version)
+    key = cache._key("items", {"name": "a"}, MultiDict([("x", "1"), ("y", "2"), ("x", "3")]))
+    assert key == cache._key("items", {"name": "a"}, MultiDict([("y", "2"), ("x", "3"), ("x", "1")]))
+    assert key != cache._key("items", {"name": "b"}, MultiDict([("x", "1"), ("y", "2"), ("x", "3")]))
+    assert key != cache._key("items", {"name": "a"}, MultiDict([("x", "1"), ("y", "2")]))
+    assert key != cache._key("other", {"name": "a"}, MultiDict([("x", "1"), ("y", "2"), ("x", "3")]))
+    assert key.startswith(f"{version.current()}.0:")
+
+
+def test_hit_returns_the_same_body_and_etag(version):
+    cache = ResponseCache(version)
+    client, calls = make_app(cache)
+    first = client.get("/items/a?x=1&y=2")
+    second = client.get("/items/a?y=2&x=1")
+    assert calls == ["a"]
+    assert first.get_data() == second.get_data() and first.headers["ETag"] == second.headers["ETag"]
+    assert cache.hit_stats() == {"items": {"hits": 1, "misses": 1}}
+
+
+def test_if_none_match_gets_304(version):
+    client, calls = make_app(ResponseCache(version))
+    etag = client.get("/items/a").headers["ETag"]
+    response = client.get("/items/a", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.get_data() == b""
+    assert client.get("/items/a", headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert calls == ["a"]
+
+
+def test_invalidate_and_version_bump_discard_entries(version):
+    cache = ResponseCache(version)
+    client, calls = make_app(cache)
+    etag = client.get("/items/a").headers["ETag"]
+    cache.invalidate(["listener", "arguments"], None)
+    refreshed = client.get("/items/a", headers={"If-None-Match": etag})
+    assert refreshed.status_code == 200 and refreshed.headers["ETag"] != etag
+    version.bump()
+    client.get("/items/a")
+    assert calls == ["a", "a", "a"]
+    assert cache._key("items", {}, MultiDict()).startswith(f"{version.current()}.1:")
+
+
+def test_errors_and_streamed_responses_are_not_cached(version):
+    client, calls = make_app(ResponseCache(version))
+    for _ in range(2):
+        assert client.get("/items/missing").status_code == 404
+        assert client.get("/stream").get_data() == b"[]"
+    assert calls == ["missing", "stream", "missing", "stream"]
+
+
+def test_shared_backend_serves_other_processes(version):
+    class DictBackend:
+        def __init__(self):
+            self.entries = {}
+
+        def get(self, key):
+            return self.entries.get(key)
+
+        def set(self, key, value, ttl):
+            self.entries[key] = value
+
+    shared = DictBackend()
+    client, calls = make_app(ResponseCache(version, shared_backend=shared))
+    other_client, other_calls = make_app(ResponseCache(version, shared_backend=shared))
+    etag = client.get("/items/a").headers["ETag"]
+    assert other_client.get("/items/a").headers["ETag"] == etag
+    assert calls == ["a"] and other_calls == []
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(maxsize=2)
+    backend.set("a", 1, 60)
+    backend.set("b", 2, 60)
+    backend.get("a")
+    backend.set("c", 3, 60)
+    assert (backend.get("a"), backend.get("b"), backend.get("c")) == (1, None, 3)
+    backend.set("d", 4, -1)
+    assert backend.get("d") is None
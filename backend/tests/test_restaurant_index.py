@@ -0,0 +1,44 @@
+import flask
+import pytest
+from services.RestaurantIndex import RestaurantIndex
+from services.RestaurantService import GeoFilters, RestaurantService
+from benchmarks.histograms import same_stats
+
+FILTERS = [
+    GeoFilters(),
+    GeoFilters(radius=1500, limit=5),
+    GeoFilters(radius=800, min_rating=4.0),
+    GeoFilters(radius=1200, prices=["€€"], fields=["name", "price"]),
+]
+
+
+@pytest.fixture(scope="module")
+def services(mongo):
+    index = RestaurantIndex(mongo)
+    index.load()
+    return RestaurantService(mongo, index=index), RestaurantService(mongo)
+
+
+def sites(mongo, n=8):
+    """ Puntos de consulta: locales vacíos repartidos por la ciudad """
+    return [local["Geometry"]["coordinates"] for local in mongo.db.empty_locals.find({}, {"Geometry": 1}).limit(n)]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_nearby_restaurants_match_near_query(mongo, services, geo_queries, filters):
+    indexed, fallback = services
+    with flask.Flask(__name__).app_context():
+        for lon, lat in sites(mongo):
+            expected = fallback.get_nearby_restaurants(lat, lon, filters).get_json()
+            assert indexed.get_nearby_restaurants(lat, lon, filters).get_json() == expected
+
+
+@pytest.mark.parametrize("filters", FILTERS[:3] + [GeoFilters(radius=1000, decay=300)])
+def test_competitors_match_geonear_pipeline(mongo, services, geo_queries, filters):
+    indexed, fallback = services
+    results = []
+    for lon, lat in sites(mongo):
+        expected = fallback._neighbours_competitors(lat, lon, filters)
+        results.append(expected)
+        assert same_stats(indexed._neighbours_competitors(lat, lon, filters), expected)
+    assert any(result is not None for result in results)
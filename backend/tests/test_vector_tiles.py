@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import mapbox_vector_tile
+import numpy as np
+import pytest
+from services.VectorTiles import EXTENT, VectorTiles, web_mercator
+
+DOCUMENTS = [
+    {"Nombre": "Bar Centro", "Nota": 4.5, "Categoría Cocina": ["Tapas", "Mediterránea"], "Geometry": {"coordinates": [2.1700, 41.3870]}},
+    {"Nombre": "Casa Pepe", "Nota": float("nan"), "Geometry": {"coordinates": [2.1702, 41.3871]}},
+    {"Nombre": "La Costa", "Categoría Precio": None, "Geometry": {"coordinates": [2.2000, 41.4000]}},
+]
+
+
+def decode(data):
+    return mapbox_vector_tile.decode(data, default_options={"y_coord_down": True})
+
+
+def tile_of(lon, lat, z):
+    xs, ys = web_mercator(np.array([lon]), np.array([lat]))
+    return z, int(xs[0] * 2 ** z), int(ys[0] * 2 ** z)
+
+
+@pytest.fixture
+def tiles():
+    tiles = VectorTiles(SimpleNamespace(db=None), pyramid_max_zoom=-1, cluster_max_zoom=12)
+    tiles.build_layer("restaurants", DOCUMENTS)
+    return tiles
+
+
+def test_points_round_trip_with_properties(tiles):
+    z, x, y = tile_of(2.1700, 41.3870, 18)
+    layer = decode(tiles.tile("restaurants", z, x, y))["restaurants"]
+    assert layer["extent"] == EXTENT
+    by_name = {f["properties"]["Nombre"]: f for f in layer["features"]}
+    assert by_name["Bar Centro"]["properties"] == {
+        "Nombre": "Bar Centro", "Nota": 4.5, "Categoría Cocina": "Tapas, Mediterránea"
+    }
+    # NaN and None are left out rather than encoded
+    assert by_name["Casa Pepe"]["properties"] == {"Nombre": "Casa Pepe"}
+    xs, ys = web_mercator(np.array([2.1700]), np.array([41.3870]))
+    expected = [int(np.floor((xs[0] * 2 ** z - x) * EXTENT)), int(np.floor((ys[0] * 2 ** z - y) * EXTENT))]
+    assert by_name["Bar Centro"]["geometry"] == {"type": "Point", "coordinates": expected}
+
+
+def test_low_zoom_clusters_keep_every_point(tiles):
+    z, x, y = tile_of(2.1700, 41.3870, 8)
+    features = decode(tiles.tile("restaurants", z, x, y))["restaurants"]["features"]
+    clusters = [f for f in features if f["properties"].get("cluster")]
+    assert clusters and all(f["properties"]["point_count"] >= 2 for f in clusters)
+    assert sum(f["properties"].get("point_count", 1) for f in features) == len(DOCUMENTS)
+
+
+def test_empty_tile_is_a_valid_layer(tiles):
+    assert decode(tiles.tile("restaurants", 3, 0, 0))["restaurants"]["features"] == []
+
+
+def test_static_layer_pyramid_matches_on_demand_render(mongo):
+    tiles = VectorTiles(mongo, pyramid_max_zoom=6)
+    tiles.load()
+    layer = tiles._layers["empty_locals"]
+    assert layer.pyramid
+    for (z, x, y), data in list(layer.pyramid.items())[:20]:
+        assert data == layer.render(z, x, y)
+        decoded = decode(data)["empty_locals"]
+        assert sum(f["properties"].get("point_count", 1) for f in decoded["features"]) > 0
@@ -33,19 +33,14 @@ const ComparationBetweenNeigh = ({ renta }) => {
     const fetchAdditionalNeighborhoodData = async (neighborhoods) => {
         try {
             const enrichedNeighborhoods = await Promise.all(neighborhoods.map(async (barrio) => {
-                const responseCount = await fetch(`http://127.0.0.1:5000/api/restaurant_count_by_neighborhood/${barrio.Nombre}`);
-                const responseCuisines = await fetch(`http://127.0.0.1:5000/api/top_5_cuisine_types_by_neighborhood/${barrio.Nombre}`);
-                const responsePriceCategories = await fetch(`http://127.0.0.1:5000/api/restaurant_price_categories_by_neighborhood/${barrio.Nombre}`);
-
-                const countData = await responseCount.json();
-                const cuisineData = await responseCuisines.json();
-                const priceData = await responsePriceCategories.json();
+                const responseProfile = await fetch(`http://127.0.0.1:5000/api/neighborhood_profile/${barrio.Nombre}`);
+                const profile = await responseProfile.json();
 
                 return {
                     ...barrio,
-                    restaurantCount: countData.count,
-                    popularCuisine: cuisineData.map(item => `${item.Tipo} (${item.count})`).join(", "),
-                    priceCategories: priceData
+                    restaurantCount: profile.restaurant_count,
+                    popularCuisine: profile.top_5_cuisine_types.map(item => `${item.Tipo} (${item.count})`).join(", "),
+                    priceCategories: profile.price_categories
                 };
             }));
             setSimilarNeighborhoods(enrichedNeighborhoods);